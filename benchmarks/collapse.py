@@ -0,0 +1,222 @@
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bolthole.debounce import Event, collapse_events  # noqa: E402
+
+
+# the original implementation, which searched every rename to find the
+# origin of a path; kept to check the fast version gives the same answer
+
+
+def reference_find_origin(
+    renames: dict[str, str],
+    path: str,
+) -> str | None:
+    for origin, dest in renames.items():
+        if dest == path:
+            return origin
+    return None
+
+
+def reference_build_result(
+    states: dict[str, str],
+    renames: dict[str, str],
+) -> list[Event]:
+    result = []
+    emitted = set()
+    for origin, dest in sorted(renames.items()):
+        if origin in emitted or dest == origin:
+            continue
+        if renames.get(dest) == origin:
+            result.append(Event("renamed", origin, dest))
+            result.append(Event("renamed", dest, origin))
+            emitted.add(dest)
+        else:
+            result.append(Event("renamed", origin, dest))
+        emitted.add(origin)
+
+    for path, state in sorted(states.items()):
+        result.append(Event(state, path))
+
+    return result
+
+
+def reference_collapse_events(
+    events: list[Event],
+) -> list[Event]:
+    states: dict[str, str] = {}
+    renames: dict[str, str] = {}
+    vacated: set[str] = set()
+
+    for event in events:
+        if event.type == "created":
+            path = event.path
+            if states.get(path) == "deleted":
+                states[path] = "modified"
+            else:
+                states[path] = "created"
+            vacated.discard(path)
+
+        elif event.type == "modified":
+            path = event.path
+            if path in vacated:
+                continue
+            if reference_find_origin(renames, path):
+                continue
+            if states.get(path) != "created":
+                states[path] = "modified"
+
+        elif event.type == "deleted":
+            path = event.path
+            if path in vacated:
+                continue
+            origin = reference_find_origin(renames, path)
+            if origin:
+                del renames[origin]
+                states[origin] = "deleted"
+                continue
+            if states.get(path) == "created":
+                del states[path]
+            else:
+                states[path] = "deleted"
+
+        elif event.type == "renamed":
+            src, dst = event.path, event.new_path
+            src_origin = reference_find_origin(renames, src)
+            if not src_origin:
+                src_origin = src
+            src_state = states.get(src)
+            dst_state = states.get(dst)
+
+            if dst_state == "deleted":
+                states[dst] = "modified"
+                if src_origin != src and src_origin in renames:
+                    del renames[src_origin]
+                vacated.add(src)
+                continue
+
+            if dst_state == "modified":
+                states[src_origin] = "deleted"
+                vacated.add(src)
+                if src_origin in renames:
+                    del renames[src_origin]
+                continue
+
+            if dst_state == "created":
+                del states[dst]
+
+            if src_state == "created":
+                states.pop(src, None)
+                states[dst] = "created"
+            else:
+                states.pop(src, None)
+                renames[src_origin] = dst
+                vacated.add(src)
+
+    return reference_build_result(states, renames)
+
+
+def rename_heavy(
+    count: int,
+    rng: random.Random,
+) -> list[Event]:
+    # a directory renamed back and forth, as watchdog reports one event
+    # per file for each move
+    events = []
+    files = max(1, count // 4)
+    names = [f"dir{generation}" for generation in range(4)]
+    for generation in range(4):
+        old, new = names[generation], names[(generation + 1) % 4]
+        for number in range(files):
+            events.append(
+                Event("renamed", f"{old}/file{number}", f"{new}/file{number}")
+            )
+    return events[:count]
+
+
+def churn(
+    count: int,
+    rng: random.Random,
+) -> list[Event]:
+    # files repeatedly deleted and recreated, as an editor or build does
+    paths = [f"src/file{number}.txt" for number in range(max(1, count // 10))]
+    events = []
+    for _ in range(count):
+        path = rng.choice(paths)
+        events.append(Event(rng.choice(("created", "deleted")), path))
+    return events
+
+
+def mixed(
+    count: int,
+    rng: random.Random,
+) -> list[Event]:
+    paths = [f"dir{n % 50}/file{n}.txt" for n in range(max(2, count // 20))]
+    events = []
+    for _ in range(count):
+        kind = rng.choice(("created", "modified", "deleted", "renamed"))
+        path = rng.choice(paths)
+        if kind == "renamed":
+            events.append(Event(kind, path, rng.choice(paths)))
+        else:
+            events.append(Event(kind, path))
+    return events
+
+
+SCENARIOS = {
+    "rename-heavy": rename_heavy,
+    "churn": churn,
+    "mixed": mixed,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="time collapse_events on synthetic event streams",
+    )
+    parser.add_argument(
+        "--sizes",
+        default="1000,10000,100000,1000000",
+        help="comma separated event counts",
+    )
+    parser.add_argument(
+        "--check-limit",
+        type=int,
+        default=10000,
+        metavar="EVENTS",
+        help="compare with the original implementation up to this size",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for name, generate in SCENARIOS.items():
+        for size in (int(size) for size in args.sizes.split(",")):
+            events = generate(size, random.Random(args.seed))
+            start = time.perf_counter()
+            result = collapse_events(events)
+            elapsed = time.perf_counter() - start
+
+            checked = size <= args.check_limit
+            if checked:
+                expected = reference_collapse_events(events)
+                if result != expected:
+                    print(f"{name} with {size} events differs", file=sys.stderr)
+                    sys.exit(1)
+
+            print(json.dumps({
+                "benchmark": "collapse_events",
+                "scenario": name,
+                "events": size,
+                "seconds": round(elapsed, 6),
+                "checked": checked,
+            }), flush=True)
+
+
+if __name__ == "__main__":
+    main()
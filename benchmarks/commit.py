@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bolthole.debounce import Event  # noqa: E402
+from bolthole.fastimport import FastImportRepo  # noqa: E402
+from bolthole.git import GitRepo  # noqa: E402
+from bolthole.objects import ObjectRepo  # noqa: E402
+
+
+BACKENDS = {
+    "git": GitRepo,
+    "fast-import": FastImportRepo,
+    "python": ObjectRepo,
+}
+
+
+def write_files(
+    root: Path,
+    count: int,
+    generation: int,
+) -> list[str]:
+    # spread files over directories the way a real tree would be
+    paths = []
+    for n in range(count):
+        rel = f"dir{n % 100:02d}/sub{n // 100 % 10}/file{n}.txt"
+        target = root / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(f"{rel} generation {generation}\n")
+        paths.append(rel)
+    return paths
+
+
+def timed_commit(
+    repo: GitRepo,
+    events: list[Event],
+) -> float | str:
+    start = time.perf_counter()
+    try:
+        repo.commit_changes(events)
+    except (OSError, subprocess.CalledProcessError) as error:
+        # a backend that fails at some size is worth seeing rather
+        # than hiding
+        return str(error)
+    return time.perf_counter() - start
+
+
+def run(
+    backend: str,
+    count: int,
+) -> dict[str, float | str]:
+    with tempfile.TemporaryDirectory() as directory:
+        root = Path(directory)
+        GitRepo(root).init()
+        repo = BACKENDS[backend](root)
+        try:
+            paths = write_files(root, count, 1)
+            add = timed_commit(repo, [Event("created", p) for p in paths])
+            write_files(root, count, 2)
+            update = timed_commit(repo, [Event("modified", p) for p in paths])
+        finally:
+            repo.close()
+    return {"add": add, "update": update}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="time single commits through each commit backend",
+    )
+    parser.add_argument(
+        "--sizes",
+        default="1,100,10000",
+        help="comma separated file counts",
+    )
+    parser.add_argument(
+        "--backends",
+        default=",".join(BACKENDS),
+        help="comma separated backends to compare",
+    )
+    args = parser.parse_args()
+
+    for name, value in (
+        ("GIT_AUTHOR_NAME", "Benchmark"),
+        ("GIT_AUTHOR_EMAIL", "benchmark@example.com"),
+        ("GIT_COMMITTER_NAME", "Benchmark"),
+        ("GIT_COMMITTER_EMAIL", "benchmark@example.com"),
+    ):
+        os.environ.setdefault(name, value)
+
+    for size in (int(size) for size in args.sizes.split(",")):
+        for backend in args.backends.split(","):
+            for scenario, elapsed in run(backend, size).items():
+                result = {
+                    "benchmark": "commit",
+                    "backend": backend,
+                    "scenario": scenario,
+                    "files": size,
+                }
+                if isinstance(elapsed, str):
+                    result["error"] = elapsed
+                else:
+                    result["seconds"] = round(elapsed, 6)
+                print(json.dumps(result), flush=True)
+
+
+if __name__ == "__main__":
+    main()
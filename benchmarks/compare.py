@@ -0,0 +1,71 @@
+import argparse
+import json
+import sys
+
+
+# fields that are results, rather than describing what was measured
+RESULT_FIELDS = {"seconds", "error", "checked", "ignored", "bytes"}
+
+
+def load(
+    path: str,
+) -> dict[tuple, dict]:
+    results = {}
+    with open(path) as handle:
+        for line in handle:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            key = tuple(
+                (name, value)
+                    for name, value in result.items()
+                    if name not in RESULT_FIELDS
+            )
+            results[key] = result
+    return results
+
+
+def describe(
+    key: tuple,
+) -> str:
+    return " ".join(str(value) for _, value in key)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="compare two sets of benchmark results",
+    )
+    parser.add_argument("before", help="JSON lines from the earlier run")
+    parser.add_argument("after", help="JSON lines from the later run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        metavar="RATIO",
+        help="fail if anything is this many times slower (default: 1.2)",
+    )
+    args = parser.parse_args()
+
+    before = load(args.before)
+    after = load(args.after)
+    slower = 0
+    for key, result in after.items():
+        if key not in before:
+            continue
+        old = before[key].get("seconds")
+        new = result.get("seconds")
+        if old is None or new is None:
+            continue
+        ratio = new / old if old else 1
+        flag = ""
+        if ratio > args.threshold:
+            flag = "  slower"
+            slower += 1
+        print(f"{describe(key):<50} {old:>10.4f} {new:>10.4f} {ratio:>6.2f}x{flag}")
+
+    if slower:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bolthole.ignore import IgnoreMatcher  # noqa: E402
+
+
+PATTERNS = [
+    ".git",
+    ".gitignore",
+    "node_modules",
+    "__pycache__",
+    "*.pyc",
+    "*.o",
+    "*.swp",
+    ".DS_Store",
+    "build/*",
+    "logs/*.log",
+]
+
+
+def generate_paths(
+    count: int,
+) -> list[str]:
+    # mostly ordinary source files, with the clutter a real working
+    # directory collects mixed in
+    paths = []
+    for n in range(count):
+        kind = n % 20
+        top = f"project{n % 7}/src{n // 1000 % 10}/pkg{n // 100 % 10}"
+        if kind == 0:
+            paths.append(f"{top}/node_modules/dep{n % 30}/index{n}.js")
+        elif kind == 1:
+            paths.append(f"{top}/__pycache__/module{n}.cpython-311.pyc")
+        elif kind == 2:
+            paths.append(f"{top}/module{n}.o")
+        elif kind == 3:
+            paths.append(f"build/{top}/output{n}.bin")
+        elif kind == 4:
+            paths.append(f"logs/run{n}.log")
+        elif kind == 5:
+            paths.append(f"{top}/.module{n}.py.swp")
+        else:
+            paths.append(f"{top}/module{n}.py")
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="time ignore pattern matching over generated paths",
+    )
+    parser.add_argument(
+        "--sizes",
+        default="10000,100000,1000000",
+        help="comma separated path counts",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="runs of each, keeping the quickest",
+    )
+    args = parser.parse_args()
+
+    for size in (int(size) for size in args.sizes.split(",")):
+        paths = generate_paths(size)
+        # the quickest of several runs, each with a new matcher so its
+        # cache starts empty as it would when bolthole starts
+        timings = []
+        for _ in range(args.repeat):
+            ignore = IgnoreMatcher(PATTERNS)
+            start = time.perf_counter()
+            ignored = sum(1 for path in paths if ignore(path))
+            timings.append(time.perf_counter() - start)
+        elapsed = min(timings)
+        print(json.dumps({
+            "benchmark": "ignore",
+            "paths": size,
+            "patterns": len(PATTERNS),
+            "seconds": round(elapsed, 6),
+            "ignored": ignored,
+        }), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bolthole.debounce import Event  # noqa: E402
+from bolthole.git import GitRepo  # noqa: E402
+
+
+def one_directory(
+    count: int,
+) -> list[Event]:
+    return [Event("modified", f"assets/image{n}.png") for n in range(count)]
+
+
+def many_directories(
+    count: int,
+) -> list[Event]:
+    # deep enough that the summary has to merge directories to fit
+    return [
+        Event("created", f"src/area{n % 40}/module{n % 400}/file{n}.py")
+            for n in range(count)
+    ]
+
+
+def mixed(
+    count: int,
+) -> list[Event]:
+    events = []
+    for n in range(count):
+        path = f"dir{n % 50}/file{n}.txt"
+        kind = ("created", "modified", "deleted", "renamed")[n % 4]
+        if kind == "renamed":
+            events.append(Event(kind, path, f"moved/{path}"))
+        else:
+            events.append(Event(kind, path))
+    return events
+
+
+SCENARIOS = {
+    "one-directory": one_directory,
+    "many-directories": many_directories,
+    "mixed": mixed,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="time commit message generation for large change sets",
+    )
+    parser.add_argument(
+        "--sizes",
+        default="10,100,10000,1000000",
+        help="comma separated event counts",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="runs of each, keeping the quickest",
+    )
+    args = parser.parse_args()
+
+    for name, generate in SCENARIOS.items():
+        for size in (int(size) for size in args.sizes.split(",")):
+            events = generate(size)
+            # the quickest of several runs, as the least disturbed by
+            # anything else happening on the machine
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                message = GitRepo.generate_commit_message(events)
+                timings.append(time.perf_counter() - start)
+            elapsed = min(timings)
+            print(json.dumps({
+                "benchmark": "commit_message",
+                "scenario": name,
+                "events": size,
+                "seconds": round(elapsed, 6),
+                "bytes": len(message.encode()),
+            }), flush=True)
+
+
+if __name__ == "__main__":
+    main()
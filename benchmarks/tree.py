@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bolthole.git import GitRepo  # noqa: E402
+from bolthole.ignore import IgnoreMatcher  # noqa: E402
+from bolthole.manifest import Manifest  # noqa: E402
+from bolthole.walk import list_files  # noqa: E402
+from bolthole.watcher import REPO_BACKENDS, initial_sync  # noqa: E402
+
+
+IGNORE = [".git", ".gitignore", "node_modules", "*.pyc", "build"]
+
+
+def build_tree(
+    root: Path,
+    count: int,
+):
+    # a hundred files to a directory, with one directory in ten being
+    # something ignored
+    for n in range(count):
+        directory = f"top{n // 10000}/mid{n // 1000 % 10}/leaf{n // 100 % 10}"
+        if n // 100 % 10 == 9:
+            directory = f"top{n // 10000}/mid{n // 1000 % 10}/node_modules"
+        target = root / directory / f"file{n}.txt"
+        if n % 100 == 0:
+            target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(f"{n}\n")
+
+
+def timed_sync(
+    source: Path,
+    dest: Path,
+    backend: str,
+) -> float:
+    ignore = IgnoreMatcher(IGNORE)
+    manifest = Manifest.for_repo(dest)
+    repo = REPO_BACKENDS[backend](dest, manifest=manifest)
+    start = time.perf_counter()
+    # every file copied is reported, which is not what is being timed
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        initial_sync(source, dest, ignore, repo, manifest=manifest)
+        repo.close()
+    elapsed = time.perf_counter() - start
+    manifest.close()
+    return elapsed
+
+
+def run(
+    count: int,
+    backend: str,
+) -> dict[str, float]:
+    with tempfile.TemporaryDirectory() as directory:
+        source = Path(directory) / "source"
+        dest = Path(directory) / "dest"
+        build_tree(source, count)
+
+        start = time.perf_counter()
+        list_files(source, IgnoreMatcher(IGNORE))
+        listed = time.perf_counter() - start
+
+        dest.mkdir()
+        GitRepo(dest).init()
+        first = timed_sync(source, dest, backend)
+        # as if restarted with nothing changed in between
+        repeat = timed_sync(source, dest, backend)
+    return {
+        "list_files": listed,
+        "initial_sync": first,
+        "restart_sync": repeat,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="time walking and mirroring generated trees",
+    )
+    parser.add_argument(
+        "--sizes",
+        default="10000,100000",
+        help="comma separated file counts, such as 1000000 for a large tree",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=list(REPO_BACKENDS),
+        default="git",
+        help="how the initial commit is written",
+    )
+    args = parser.parse_args()
+
+    for name, value in (
+        ("GIT_AUTHOR_NAME", "Benchmark"),
+        ("GIT_AUTHOR_EMAIL", "benchmark@example.com"),
+        ("GIT_COMMITTER_NAME", "Benchmark"),
+        ("GIT_COMMITTER_EMAIL", "benchmark@example.com"),
+    ):
+        os.environ.setdefault(name, value)
+
+    for size in (int(size) for size in args.sizes.split(",")):
+        for scenario, elapsed in run(size, args.backend).items():
+            print(json.dumps({
+                "benchmark": "tree",
+                "scenario": scenario,
+                "backend": args.backend,
+                "files": size,
+                "seconds": round(elapsed, 6),
+            }), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,33 @@ import sys
 from importlib.metadata import version
 from pathlib import Path
 
-from bolthole.git import GitRepo, configure_output
+from bolthole.config import (
+    ConfigError,
+    Tree,
+    load_config,
+    option_defaults,
+    parse_size,
+    paths_problem,
+    settings_problem,
+)
+from bolthole.daemon import JOBS, watch_trees
+from bolthole.git import GitRepo, configure_output, output
+from bolthole.metrics import MetricsFile, MetricsServer
+from bolthole.profile import profiler
 from bolthole.watcher import watch
 
 
+def parse_address(text: str) -> tuple[str, int]:
+    host, _, port = text.rpartition(":")
+    try:
+        number = int(port)
+    except ValueError:
+        number = 0
+    if not 0 < number < 65536:
+        raise argparse.ArgumentTypeError(f"invalid address: '{text}'")
+    return host.strip("[]") or "127.0.0.1", number
+
+
 def main():
     parser = argparse.ArgumentParser(prog="bolthole")
     parser.add_argument(
@@ -43,6 +66,29 @@ def main():
         metavar="PATTERN",
         help="ignore files matching pattern (repeatable)",
     )
+    parser.add_argument(
+        "--paranoid",
+        action="store_true",
+        help="always compare file contents at startup",
+    )
+    parser.add_argument(
+        "--hash-copies",
+        action="store_true",
+        help="store copies in the repository as they are made",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["git", "fast-import", "python"],
+        default="git",
+        help="how commits are written (default: git)",
+    )
+    parser.add_argument(
+        "--observer",
+        choices=["native", "poll", "inotify"],
+        default="native",
+        help="how changes are noticed, poll for network filesystems or "
+             "inotify to skip ignored directories on Linux (default: native)",
+    )
     parser.add_argument(
         "--show-git",
         action="store_true",
@@ -75,6 +121,59 @@ def main():
         metavar="SECONDS",
         help="delay commits by grace period (default: 0)",
     )
+    parser.add_argument(
+        "--max-wait",
+        type=float,
+        default=5,
+        metavar="SECONDS",
+        help="act on changes at least this often (default: 5)",
+    )
+    parser.add_argument(
+        "--max-files",
+        type=int,
+        default=0,
+        metavar="COUNT",
+        help="split commits with more files than this",
+    )
+    parser.add_argument(
+        "--max-bytes",
+        type=parse_size,
+        default=0,
+        metavar="SIZE",
+        help="split commits larger than this, e.g. 500M",
+    )
+    parser.add_argument(
+        "--summarise-over",
+        type=int,
+        default=0,
+        metavar="COUNT",
+        help="summarise commit messages listing more files than this by "
+             "directory, such as 100 (default: list them all)",
+    )
+    parser.add_argument(
+        "--scrub-rate",
+        type=parse_size,
+        default=0,
+        metavar="SIZE",
+        help="check the copy matches in the background, reading at most "
+             "this much a second, e.g. 10M",
+    )
+    parser.add_argument(
+        "--metrics-listen",
+        type=parse_address,
+        metavar="[HOST:]PORT",
+        help="serve prometheus metrics (default host: 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="PATH",
+        help="write prometheus metrics to a textfile collector file",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="record how long each stage takes, as JSON lines",
+    )
     parser.add_argument(
         "-m",
         "--message",
@@ -89,94 +188,146 @@ def main():
         metavar="REMOTE",
         help="push to remote after commit (repeatable)",
     )
-    parser.add_argument("source")
+    parser.add_argument(
+        "--config",
+        metavar="PATH",
+        help="watch every tree listed in a config file",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=JOBS,
+        metavar="COUNT",
+        help=f"trees committing or pushing at once with --config (default: {JOBS})",
+    )
+    parser.add_argument("source", nargs="?")
     parser.add_argument("dest", nargs="?")
     args = parser.parse_args()
 
-    configure_output(args.timeless)
+    if args.config and args.source:
+        parser.error("a source cannot be given with --config")
+    if not args.config and not args.source:
+        parser.error("the following arguments are required: source")
 
-    if args.grace < 0:
-        print("error: grace period cannot be negative", file=sys.stderr)
-        sys.exit(2)
+    configure_output(args.timeless)
 
-    if args.bundle < 0:
-        print("error: bundle threshold cannot be negative", file=sys.stderr)
+    problem = settings_problem(
+        args.grace, args.bundle, args.max_wait, args.max_files, args.max_bytes,
+        args.scrub_rate, args.summarise_over,
+    )
+    if problem:
+        print(f"error: {problem}", file=sys.stderr)
         sys.exit(2)
 
-    if args.bundle > 0 and args.grace == 0:
-        print("error: bundle requires grace period", file=sys.stderr)
+    if args.jobs < 1:
+        print("error: jobs must be at least one", file=sys.stderr)
         sys.exit(2)
 
-    if args.grace and args.bundle >= args.grace:
-        print("error: bundle threshold must be less than grace period", file=sys.stderr)
+    if args.observer == "inotify" and sys.platform != "linux":
+        print("error: inotify is only available on Linux", file=sys.stderr)
         sys.exit(2)
 
-    source = Path(args.source).resolve()
-    if not source.exists():
-        print(
-            f"error: source directory does not exist: {args.source}",
-            file=sys.stderr,
-        )
-        sys.exit(2)
+    metrics_file = None
+    if args.metrics_file:
+        metrics_file = Path(args.metrics_file).resolve()
+        if not metrics_file.parent.is_dir():
+            print("error: metrics directory does not exist: "
+                  f"{metrics_file.parent}", file=sys.stderr)
+            sys.exit(2)
 
-    dest = None
-    if not args.dest:
-        if not GitRepo.is_repo(source):
-            print("error: source must be a git repository in single-directory mode",
-                  file=sys.stderr)
+    trees = []
+    source = dest = None
+    if args.config:
+        try:
+            trees = load_config(Path(args.config), option_defaults(args))
+        except ConfigError as error:
+            print(f"error: {error}", file=sys.stderr)
             sys.exit(2)
     else:
-        dest = Path(args.dest).resolve()
-        if source == dest:
-            print("error: source and destination cannot be the same",
-                  file=sys.stderr)
-            sys.exit(2)
-        if source.is_relative_to(dest):
-            print("error: source cannot be inside destination",
-                  file=sys.stderr)
-            sys.exit(2)
-        if dest.is_relative_to(source):
-            print("error: destination cannot be inside source",
-                  file=sys.stderr)
-            sys.exit(2)
-
-        if GitRepo.is_repo(dest):
-            pass
-        elif dest.exists() and any(dest.iterdir()):
-            print("error: destination exists but is not a git repository",
-                  file=sys.stderr)
+        source = Path(args.source).resolve()
+        if args.dest:
+            dest = Path(args.dest).resolve()
+        problem = paths_problem(source, dest, args.source)
+        if not problem and args.scrub_rate and not dest:
+            problem = "scrub rate requires a destination directory"
+        if problem:
+            print(f"error: {problem}", file=sys.stderr)
             sys.exit(2)
-        elif not args.dry_run:
-            dest.mkdir(parents=True, exist_ok=True)
-            repo = GitRepo(dest)
-            repo.init()
+        trees = [Tree(name="", source=source, dest=dest, remotes=args.remote)]
 
-    if args.remote:
-        if dest:
-            repo_path = dest
-        else:
-            repo_path = source
-        repo = GitRepo(repo_path)
-        for remote in args.remote:
+    for tree in trees:
+        if tree.dest and not args.dry_run and not GitRepo.is_repo(tree.dest):
+            tree.dest.mkdir(parents=True, exist_ok=True)
+            GitRepo(tree.dest).init()
+        repo = GitRepo(tree.dest or tree.source)
+        for remote in tree.remotes:
             if not repo.has_remote(remote):
-                print(f"remote '{remote}' needs to be added",
+                label = f"[{tree.name}] " if tree.name else ""
+                print(f"{label}remote '{remote}' needs to be added",
                       file=sys.stderr)
                 sys.exit(2)
 
-    watch(
-        source,
-        dest=dest,
-        dry_run=args.dry_run,
-        verbose=args.verbose,
-        watchdog_debug=args.watchdog_debug,
-        ignore_patterns=args.ignore,
-        show_git=args.show_git,
-        source_label=args.source,
-        dest_label=args.dest,
-        once=args.once,
-        author=args.author,
-        message=args.message,
-        remotes=args.remote,
-        grace=args.grace,
-        bundle=args.bundle,
-    )
+    exporters = []
+    if args.metrics_listen:
+        host, port = args.metrics_listen
+        try:
+            exporters.append(MetricsServer(host, port))
+        except OSError as error:
+            print(f"error: cannot serve metrics on {host}:{port}: "
+                  f"{error.strerror}", file=sys.stderr)
+            sys.exit(2)
+    if metrics_file:
+        exporters.append(MetricsFile(metrics_file))
+    if args.profile:
+        try:
+            profiler.start(Path(args.profile))
+        except OSError as error:
+            print(f"error: cannot write profile: {error.strerror}",
+                  file=sys.stderr)
+            sys.exit(2)
+
+    try:
+        if args.config:
+            watch_trees(
+                trees,
+                dry_run=args.dry_run,
+                verbose=args.verbose,
+                watchdog_debug=args.watchdog_debug,
+                show_git=args.show_git,
+                once=args.once,
+                jobs=args.jobs,
+            )
+        else:
+            watch(
+                source,
+                dest=dest,
+                dry_run=args.dry_run,
+                verbose=args.verbose,
+                watchdog_debug=args.watchdog_debug,
+                ignore_patterns=args.ignore,
+                show_git=args.show_git,
+                source_label=args.source,
+                dest_label=args.dest,
+                once=args.once,
+                author=args.author,
+                message=args.message,
+                remotes=args.remote,
+                grace=args.grace,
+                bundle=args.bundle,
+                paranoid=args.paranoid,
+                hash_copies=args.hash_copies,
+                max_wait=args.max_wait,
+                backend=args.backend,
+                max_files=args.max_files,
+                max_bytes=args.max_bytes,
+                summarise_over=args.summarise_over,
+                observer=args.observer,
+                scrub_rate=args.scrub_rate,
+            )
+    finally:
+        for exporter in exporters:
+            exporter.close()
+        if args.profile:
+            for line in profiler.summary():
+                output(f"   {line}")
+            profiler.close()
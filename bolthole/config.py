@@ -0,0 +1,248 @@
+import argparse
+import configparser
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from bolthole.git import GitRepo
+
+
+BACKENDS = ["git", "fast-import", "python"]
+OBSERVERS = ["native", "poll", "inotify"]
+
+SIZE_SUFFIXES = {
+    "": 1,
+    "K": 1024,
+    "M": 1024 ** 2,
+    "G": 1024 ** 3,
+}
+
+# settings each tree in a config file can have, named as the options
+SETTINGS = {
+    "source",
+    "dest",
+    "ignore",
+    "author",
+    "message",
+    "grace",
+    "bundle",
+    "max-wait",
+    "max-files",
+    "max-bytes",
+    "summarise-over",
+    "backend",
+    "observer",
+    "scrub-rate",
+    "remote",
+    "paranoid",
+    "hash-copies",
+}
+
+
+class ConfigError(Exception):
+    pass
+
+
+def parse_size(text: str) -> int:
+    number = text.strip().upper().removesuffix("B")
+    suffix = number[-1:] if number[-1:] in SIZE_SUFFIXES else ""
+    try:
+        return int(float(number.removesuffix(suffix)) * SIZE_SUFFIXES[suffix])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: '{text}'")
+
+
+@dataclass
+class Tree:
+    name: str
+    source: Path
+    dest: Path | None = None
+    ignore: list[str] = field(default_factory=list)
+    author: str | None = None
+    message: str | None = None
+    grace: float = 0
+    bundle: float = 0
+    max_wait: float = 5
+    max_files: int = 0
+    max_bytes: int = 0
+    summarise_over: int = 0
+    backend: str = "git"
+    observer: str = "native"
+    scrub_rate: int = 0
+    remotes: list[str] = field(default_factory=list)
+    paranoid: bool = False
+    hash_copies: bool = False
+
+
+def settings_problem(
+    grace: float,
+    bundle: float,
+    max_wait: float,
+    max_files: int,
+    max_bytes: int,
+    scrub_rate: int = 0,
+    summarise_over: int = 0,
+) -> str | None:
+    if grace < 0:
+        return "grace period cannot be negative"
+    if max_wait < 0:
+        return "max wait cannot be negative"
+    if max_files < 0:
+        return "max files cannot be negative"
+    if max_bytes < 0:
+        return "max bytes cannot be negative"
+    if summarise_over < 0:
+        return "summarise over cannot be negative"
+    if scrub_rate < 0:
+        return "scrub rate cannot be negative"
+    if bundle < 0:
+        return "bundle threshold cannot be negative"
+    if bundle > 0 and grace == 0:
+        return "bundle requires grace period"
+    if grace and bundle >= grace:
+        return "bundle threshold must be less than grace period"
+    return None
+
+
+def paths_problem(
+    source: Path,
+    dest: Path | None,
+    source_label: str,
+) -> str | None:
+    if not source.exists():
+        return f"source directory does not exist: {source_label}"
+    if not dest:
+        if not GitRepo.is_repo(source):
+            return "source must be a git repository in single-directory mode"
+        return None
+    if source == dest:
+        return "source and destination cannot be the same"
+    if source.is_relative_to(dest):
+        return "source cannot be inside destination"
+    if dest.is_relative_to(source):
+        return "destination cannot be inside source"
+    if (not GitRepo.is_repo(dest)
+            and dest.exists() and any(dest.iterdir())):
+        return "destination exists but is not a git repository"
+    return None
+
+
+def read_tree(
+    name: str,
+    section: configparser.SectionProxy,
+) -> Tree:
+    unknown = set(section) - SETTINGS
+    if unknown:
+        raise ConfigError(f"unknown setting '{sorted(unknown)[0]}'")
+    if "source" not in section:
+        raise ConfigError("source is required")
+
+    def path(value: str) -> Path:
+        return Path(value).expanduser().resolve()
+
+    def lines(value: str) -> list[str]:
+        return [line.strip() for line in value.splitlines() if line.strip()]
+
+    try:
+        tree = Tree(
+            name=name,
+            source=path(section["source"]),
+            dest=path(section["dest"]) if section.get("dest") else None,
+            ignore=lines(section.get("ignore", "")),
+            author=section.get("author"),
+            message=section.get("message"),
+            grace=section.getfloat("grace", 0),
+            bundle=section.getfloat("bundle", 0),
+            max_wait=section.getfloat("max-wait", 5),
+            max_files=section.getint("max-files", 0),
+            max_bytes=parse_size(section.get("max-bytes", "0")),
+            summarise_over=section.getint(
+                "summarise-over", 0,
+            ),
+            backend=section.get("backend", "git"),
+            observer=section.get("observer", "native"),
+            scrub_rate=parse_size(section.get("scrub-rate", "0")),
+            remotes=lines(section.get("remote", "")),
+            paranoid=section.getboolean("paranoid", False),
+            hash_copies=section.getboolean("hash-copies", False),
+        )
+    except (ValueError, argparse.ArgumentTypeError) as error:
+        raise ConfigError(str(error))
+
+    if tree.backend not in BACKENDS:
+        raise ConfigError(f"unknown backend '{tree.backend}'")
+    if tree.observer not in OBSERVERS:
+        raise ConfigError(f"unknown observer '{tree.observer}'")
+    if tree.observer == "inotify" and sys.platform != "linux":
+        raise ConfigError("inotify is only available on Linux")
+    problem = settings_problem(
+        tree.grace, tree.bundle, tree.max_wait, tree.max_files, tree.max_bytes,
+        tree.scrub_rate, tree.summarise_over,
+    )
+    if not problem:
+        problem = paths_problem(tree.source, tree.dest, section["source"])
+    if not problem and tree.scrub_rate and not tree.dest:
+        problem = "scrub rate requires a destination directory"
+    if problem:
+        raise ConfigError(problem)
+    return tree
+
+
+def option_defaults(
+    args: argparse.Namespace,
+) -> dict[str, str]:
+    # the command line options are where every tree starts from, before
+    # [DEFAULT] and its own section have their say
+    defaults = {
+        "ignore": "\n".join(args.ignore),
+        "grace": str(args.grace),
+        "bundle": str(args.bundle),
+        "max-wait": str(args.max_wait),
+        "max-files": str(args.max_files),
+        "max-bytes": str(args.max_bytes),
+        "summarise-over": str(args.summarise_over),
+        "backend": args.backend,
+        "observer": args.observer,
+        "scrub-rate": str(args.scrub_rate),
+        "remote": "\n".join(args.remote),
+        "paranoid": "yes" if args.paranoid else "no",
+        "hash-copies": "yes" if args.hash_copies else "no",
+    }
+    if args.author is not None:
+        defaults["author"] = args.author
+    if args.message is not None:
+        defaults["message"] = args.message
+    return defaults
+
+
+def load_config(
+    path: Path,
+    defaults: dict[str, str] | None = None,
+) -> list[Tree]:
+    # one section per tree, with anything in [DEFAULT] applying to all
+    parser = configparser.ConfigParser(defaults, interpolation=None)
+    try:
+        with open(path) as handle:
+            parser.read_file(handle)
+    except OSError as error:
+        raise ConfigError(f"cannot read {path}: {error.strerror}")
+    except configparser.Error as error:
+        raise ConfigError(f"cannot parse {path}: {error.message}")
+
+    trees = []
+    repos: dict[Path, str] = {}
+    for name in parser.sections():
+        try:
+            tree = read_tree(name, parser[name])
+        except ConfigError as error:
+            raise ConfigError(f"[{name}] {error}")
+        repo_path = tree.dest or tree.source
+        if repo_path in repos:
+            raise ConfigError(
+                f"[{name}] uses the same repository as [{repos[repo_path]}]"
+            )
+        repos[repo_path] = name
+        trees.append(tree)
+    if not trees:
+        raise ConfigError(f"no trees in {path}")
+    return trees
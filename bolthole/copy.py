@@ -0,0 +1,189 @@
+import errno
+import os
+import shutil
+from pathlib import Path
+from typing import BinaryIO
+
+from bolthole.objects import BlobWriter
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# from linux/fs.h, _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+CHUNK_SIZE = 8 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# errors meaning "this filesystem or kernel can't do that", rather than
+# anything being wrong with the files themselves
+UNSUPPORTED = {
+    errno.EBADF,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTSUP,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.EXDEV,
+}
+
+# devices where a method has failed once are not tried again
+_no_reflink: set[int] = set()
+_no_copy_range: set[int] = set()
+_no_sendfile: set[int] = set()
+
+
+def reflink(
+    source_fd: int,
+    dest_fd: int,
+) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(dest_fd, FICLONE, source_fd)
+    except OSError as error:
+        if error.errno in UNSUPPORTED:
+            return False
+        raise
+    return True
+
+
+def rewind(
+    source_fd: int,
+    dest_fd: int,
+):
+    # back to the start, for the next method to copy everything again
+    os.lseek(source_fd, 0, os.SEEK_SET)
+    os.lseek(dest_fd, 0, os.SEEK_SET)
+    os.ftruncate(dest_fd, 0)
+
+
+def copy_range(
+    source_fd: int,
+    dest_fd: int,
+    size: int,
+) -> bool:
+    if not hasattr(os, "copy_file_range"):
+        return False
+    offset = 0
+    while offset < size:
+        try:
+            copied = os.copy_file_range(
+                source_fd, dest_fd, min(CHUNK_SIZE, size - offset),
+            )
+        except OSError as error:
+            if offset == 0 and error.errno in UNSUPPORTED:
+                return False
+            raise
+        if copied == 0:
+            # some filesystems copy nothing rather than failing
+            rewind(source_fd, dest_fd)
+            return False
+        offset += copied
+    return True
+
+
+def send_file(
+    source_fd: int,
+    dest_fd: int,
+    size: int,
+) -> bool:
+    if not hasattr(os, "sendfile"):
+        return False
+    offset = 0
+    while offset < size:
+        try:
+            sent = os.sendfile(
+                dest_fd, source_fd, offset, min(CHUNK_SIZE, size - offset),
+            )
+        except OSError as error:
+            if offset == 0 and error.errno in UNSUPPORTED:
+                return False
+            raise
+        if sent == 0:
+            rewind(source_fd, dest_fd)
+            return False
+        offset += sent
+    return True
+
+
+def copy_through(
+    fsrc: BinaryIO,
+    fdst: BinaryIO,
+    blob: BlobWriter,
+):
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    while count := fsrc.readinto(buffer):
+        chunk = view[:count]
+        fdst.write(chunk)
+        blob.update(chunk)
+
+
+def store_blob(
+    path: Path,
+    objects_dir: Path,
+) -> str | None:
+    with open(path, "rb") as handle:
+        blob = BlobWriter(objects_dir, os.fstat(handle.fileno()).st_size)
+        try:
+            while chunk := handle.read(HASH_CHUNK_SIZE):
+                blob.update(chunk)
+        except BaseException:
+            blob.abort()
+            raise
+    return blob.finish()
+
+
+def copy_file(
+    source: Path,
+    dest: Path,
+    objects_dir: Path | None = None,
+) -> str | None:
+    # given a repository's objects directory, the copy is read through
+    # here and also stored as a git blob, its id returned, so the source
+    # is only read once; otherwise the kernel copies it without it
+    # passing through here at all
+    blob = None
+    with open(source, "rb") as fsrc, open(dest, "wb") as fdst:
+        source_fd = fsrc.fileno()
+        dest_fd = fdst.fileno()
+        size = os.fstat(source_fd).st_size
+        device = os.fstat(dest_fd).st_dev
+
+        if size and device not in _no_reflink and reflink(source_fd, dest_fd):
+            pass
+        elif objects_dir is not None:
+            blob = BlobWriter(objects_dir, size)
+            try:
+                copy_through(fsrc, fdst, blob)
+            except BaseException:
+                blob.abort()
+                raise
+        elif size == 0:
+            pass
+        elif device not in _no_copy_range and copy_range(
+            source_fd, dest_fd, size,
+        ):
+            _no_reflink.add(device)
+        elif device not in _no_sendfile and send_file(
+            source_fd, dest_fd, size,
+        ):
+            _no_reflink.add(device)
+            _no_copy_range.add(device)
+        else:
+            _no_reflink.add(device)
+            _no_copy_range.add(device)
+            _no_sendfile.add(device)
+            shutil.copyfileobj(fsrc, fdst, CHUNK_SIZE)
+
+    shutil.copystat(source, dest)
+
+    if blob:
+        # None if the source changed while it was being copied
+        return blob.finish()
+    # a clone shares the source's data, so hashing it would mean reading
+    # it all; git reads it when committing instead, if it's still needed
+    return None
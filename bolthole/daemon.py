@@ -0,0 +1,189 @@
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from types import FrameType
+
+from bolthole.config import Tree
+from bolthole.git import GitRepo, output, output_label
+from bolthole.ignore import IgnoreMatcher
+from bolthole.manifest import Manifest
+from bolthole.push import PushQueue
+from bolthole.scrub import Scrubber
+from bolthole.watcher import (
+    OBSERVERS,
+    REPO_BACKENDS,
+    DebouncingEventHandler,
+    SharedPools,
+    sync_tree,
+)
+
+
+# how many trees can be committing, or pushing, at the same time
+JOBS = 4
+
+
+@dataclass
+class RunningTree:
+    tree: Tree
+    ignore: IgnoreMatcher
+    repo: GitRepo
+    pusher: PushQueue
+    manifest: Manifest | None
+    known_files: set[str] | None = None
+    handler: DebouncingEventHandler | None = None
+    scrubber: Scrubber | None = None
+
+    def close(self):
+        if self.scrubber:
+            self.scrubber.close()
+        if self.handler:
+            self.handler.close()
+        self.pusher.close()
+        self.repo.close()
+        if self.manifest:
+            self.manifest.close()
+
+
+def start_tree(
+    tree: Tree,
+    pools: SharedPools,
+    dry_run: bool = False,
+    show_git: bool = False,
+) -> RunningTree:
+    with output_label(tree.name):
+        manifest = None
+        if tree.dest and not dry_run:
+            manifest = Manifest.for_repo(tree.dest, tree.hash_copies)
+        repo = REPO_BACKENDS[tree.backend](
+            tree.dest or tree.source,
+            dry_run=dry_run,
+            show_git=show_git,
+            author=tree.author,
+            message=tree.message,
+            manifest=manifest,
+            max_files=tree.max_files,
+            max_bytes=tree.max_bytes,
+            summarise_over=tree.summarise_over,
+        )
+        pusher = PushQueue(
+            repo,
+            tree.remotes,
+            scheduler=pools.scheduler,
+            pool=pools.push,
+            label=tree.name,
+        )
+        running = RunningTree(
+            tree=tree,
+            ignore=IgnoreMatcher([".git", ".gitignore"] + tree.ignore),
+            repo=repo,
+            pusher=pusher,
+            manifest=manifest,
+        )
+        try:
+            running.known_files = sync_tree(
+                tree.source, tree.dest, running.ignore, repo, pusher,
+                dry_run=dry_run,
+                paranoid=tree.paranoid,
+                manifest=manifest,
+                label=tree.name,
+            )
+        except BaseException:
+            running.close()
+            raise
+        return running
+
+
+def watch_trees(
+    trees: list[Tree],
+    dry_run: bool = False,
+    verbose: bool = False,
+    watchdog_debug: bool = False,
+    show_git: bool = False,
+    once: bool = False,
+    jobs: int = JOBS,
+):
+    # one set of workers, and an observer of each kind, for every tree
+    pools = SharedPools(jobs)
+    running: list[RunningTree] = []
+    try:
+        # trees are brought up to date a few at a time
+        with ThreadPoolExecutor(jobs, thread_name_prefix="sync") as starter:
+            futures = [
+                starter.submit(start_tree, tree, pools, dry_run, show_git)
+                    for tree in trees
+            ]
+            # every tree that did start is closed again if one didn't
+            error = None
+            for future in futures:
+                try:
+                    running.append(future.result())
+                except BaseException as exc:
+                    error = error or exc
+            if error:
+                raise error
+
+        if once:
+            return
+
+        # trees share an observer, unless they need different kinds
+        observers = {}
+        for tree in running:
+            tree.handler = DebouncingEventHandler(
+                tree.tree.source,
+                dest_path=tree.tree.dest,
+                dry_run=dry_run,
+                verbose=verbose,
+                watchdog_debug=watchdog_debug,
+                ignore=tree.ignore,
+                repo=tree.repo,
+                pusher=tree.pusher,
+                grace=tree.tree.grace,
+                bundle=tree.tree.bundle,
+                known_files=tree.known_files,
+                manifest=tree.manifest,
+                max_wait=tree.tree.max_wait,
+                pools=pools,
+                label=tree.tree.name,
+                sweep=tree.tree.observer == "native",
+            )
+            kind = tree.tree.observer
+            if kind not in observers:
+                observers[kind] = OBSERVERS[kind]()
+            observers[kind].schedule(
+                tree.handler,
+                str(tree.tree.source),
+                recursive=True,
+            )
+
+        def sigterm_handler(
+            signum: int,
+            frame: FrameType | None,
+        ):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, sigterm_handler)
+
+        for observer in observers.values():
+            observer.start()
+        output(f"   Watching {len(running)} trees...")
+        for tree in running:
+            if tree.tree.dest and tree.tree.scrub_rate and not dry_run:
+                tree.scrubber = Scrubber(tree.handler, tree.tree.scrub_rate)
+                tree.scrubber.start()
+
+        try:
+            while all(observer.is_alive() for observer in observers.values()):
+                for observer in observers.values():
+                    observer.join(timeout=1 / len(observers))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for observer in observers.values():
+                observer.stop()
+            for observer in observers.values():
+                observer.join()
+    finally:
+        for tree in running:
+            with output_label(tree.tree.name):
+                tree.close()
+        pools.close()
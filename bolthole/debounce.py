@@ -8,19 +8,69 @@ class Event:
     new_path: str | None = None
 
 
-def find_origin(
-    renames: dict[str, str],
-    path: str,
-) -> str | None:
-    for origin, dest in renames.items():
-        if dest == path:
-            return origin
-    return None
+class Renames:
+    # maps each origin to where it has been renamed to, with a reverse
+    # index so finding the origin of a path doesn't scan every rename
+    def __init__(self):
+        self.targets: dict[str, str] = {}
+        self.origins: dict[str, set[str]] = {}
+        self.order: dict[str, int] = {}
+        self.counter = 0
+
+    def __contains__(
+        self,
+        origin: str,
+    ) -> bool:
+        return origin in self.targets
+
+    def __setitem__(
+        self,
+        origin: str,
+        dest: str,
+    ):
+        if origin in self.targets:
+            self.origins[self.targets[origin]].discard(origin)
+        else:
+            self.order[origin] = self.counter
+            self.counter += 1
+        self.targets[origin] = dest
+        self.origins.setdefault(dest, set()).add(origin)
+
+    def __delitem__(
+        self,
+        origin: str,
+    ):
+        dest = self.targets.pop(origin)
+        del self.order[origin]
+        self.origins[dest].discard(origin)
+        if not self.origins[dest]:
+            del self.origins[dest]
+
+    def get(
+        self,
+        origin: str,
+    ) -> str | None:
+        return self.targets.get(origin)
+
+    def items(self):
+        return self.targets.items()
+
+    def find_origin(
+        self,
+        path: str,
+    ) -> str | None:
+        origins = self.origins.get(path)
+        if not origins:
+            return None
+        if len(origins) == 1:
+            return next(iter(origins))
+        # several renames onto one path, the longest standing one wins
+        return min(origins, key=self.order.__getitem__)
 
 
 def build_result(
     states: dict[str, str],
-    renames: dict[str, str],
+    renames: Renames,
 ) -> list[Event]:
     result = []
     emitted = set()
@@ -45,7 +95,7 @@ def collapse_events(
     events: list[Event],
 ) -> list[Event]:
     states: dict[str, str] = {}
-    renames: dict[str, str] = {}
+    renames = Renames()
     vacated: set[str] = set()
 
     for event in events:
@@ -61,7 +111,7 @@ def collapse_events(
             path = event.path
             if path in vacated:
                 continue
-            if find_origin(renames, path):
+            if renames.find_origin(path):
                 continue
             if states.get(path) != "created":
                 states[path] = "modified"
@@ -70,7 +120,7 @@ def collapse_events(
             path = event.path
             if path in vacated:
                 continue
-            origin = find_origin(renames, path)
+            origin = renames.find_origin(path)
             if origin:
                 del renames[origin]
                 states[origin] = "deleted"
@@ -82,7 +132,7 @@ def collapse_events(
 
         elif event.type == "renamed":
             src, dst = event.path, event.new_path
-            src_origin = find_origin(renames, src)
+            src_origin = renames.find_origin(src)
             if not src_origin:
                 src_origin = src
             src_state = states.get(src)
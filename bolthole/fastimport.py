@@ -0,0 +1,535 @@
+import hashlib
+import os
+import stat
+import subprocess
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import BinaryIO
+
+from bolthole.debounce import Event
+from bolthole.git import GitRepo, output
+from bolthole.ignore import IgnoreMatcher
+from bolthole.walk import list_files
+
+
+# number of "ls" queries in flight at once, small enough that neither
+# pipe fills up while the other side is still writing
+LS_BATCH = 256
+
+# fast-import reloads the parent's trees for every "ls", so past this many
+# paths it is quicker to list the whole parent tree once
+LS_TREE_LIMIT = 1000
+
+# files are hashed and sent to fast-import this much at a time, rather
+# than read into memory whole
+CHUNK_SIZE = 1024 * 1024
+
+
+def quote_path(path: str) -> bytes:
+    encoded = os.fsencode(path)
+    if not encoded.startswith(b'"') and b"\n" not in encoded:
+        return encoded
+    escaped = (
+        encoded
+            .replace(b"\\", b"\\\\")
+            .replace(b'"', b'\\"')
+            .replace(b"\n", b"\\n")
+    )
+    return b'"' + escaped + b'"'
+
+
+def exact_chunks(
+    handle: BinaryIO,
+    size: int,
+) -> Iterator[bytes]:
+    # exactly size bytes however the file changes while it is read, since
+    # that is the length promised up front; the change has an event of its
+    # own that commits the file again
+    while size:
+        chunk = handle.read(min(CHUNK_SIZE, size))
+        if not chunk:
+            chunk = bytes(min(CHUNK_SIZE, size))
+        yield chunk
+        size -= len(chunk)
+
+
+def timestamp() -> str:
+    offset = time.localtime().tm_gmtoff // 60
+    sign = "-" if offset < 0 else "+"
+    hours, minutes = divmod(abs(offset), 60)
+    return f"{int(time.time())} {sign}{hours:02d}{minutes:02d}"
+
+
+class FastImportRepo(GitRepo):
+    EXCLUDE_COMMANDS = GitRepo.EXCLUDE_COMMANDS | {
+        "ls-tree",
+        "symbolic-ref",
+    }
+
+    def __init__(
+        self,
+        path,
+        dry_run=False,
+        show_git=False,
+        author=None,
+        message=None,
+        manifest=None,
+        max_files=0,
+        max_bytes=0,
+        summarise_over=0,
+    ):
+        super().__init__(
+            path,
+            dry_run=dry_run,
+            show_git=show_git,
+            author=author,
+            message=message,
+            manifest=manifest,
+            max_files=max_files,
+            max_bytes=max_bytes,
+            summarise_over=summarise_over,
+        )
+        self.process: subprocess.Popen | None = None
+        self.git_dir: Path | None = None
+        self.common_dir: Path | None = None
+        self.object_format = "sha1"
+        self.author_ident: str | None = None
+        self.committer_ident: str | None = None
+        # paths committed around the index, to be brought back in line
+        self.committed: set[str] = set()
+
+    def start(self):
+        result = self.run_git(
+            "rev-parse",
+            "--absolute-git-dir", "--git-common-dir", "--show-object-format",
+            capture_output=True, text=True, check=True,
+        )
+        git_dir, common_dir, self.object_format = result.stdout.splitlines()
+        self.git_dir = Path(git_dir)
+        self.common_dir = self.path / common_dir
+
+        # identities are looked up once, the time is added per commit
+        self.committer_ident = self.ident("GIT_COMMITTER_IDENT")
+        if self.author:
+            self.author_ident = self.author
+        else:
+            self.author_ident = self.ident("GIT_AUTHOR_IDENT")
+
+    def start_process(self):
+        if self.show_git:
+            output("%  git fast-import")
+        self.process = subprocess.Popen(
+            ["git", "-C", str(self.path), "fast-import", "--quiet", "--done"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def ident(
+        self,
+        variable: str,
+    ) -> str:
+        result = subprocess.run(
+            ["git", "-C", str(self.path), "var", variable],
+            capture_output=True, text=True, check=True,
+        )
+        return result.stdout.strip().rsplit(" ", 2)[0]
+
+    def close(self):
+        if self.process:
+            self.close_process()
+        if self.committed:
+            # commits went straight to the object store, so the index is
+            # brought back in line for the paths they touched, leaving
+            # anything else staged in it alone
+            paths = sorted(self.committed)
+            self.committed = set()
+            self.run_git("reset", "--quiet", paths=paths, capture_output=True)
+
+    def close_process(self):
+        process = self.process
+        self.process = None
+        try:
+            process.stdin.write(b"done\n")
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        process.wait()
+
+    def fail(self):
+        process = self.process
+        self.process = None
+        process.kill()
+        process.wait()
+        raise subprocess.CalledProcessError(
+            process.returncode, ["git", "fast-import"],
+        )
+
+    def send(
+        self,
+        data: bytes,
+    ):
+        if self.process is None:
+            self.start_process()
+        try:
+            self.process.stdin.write(data)
+        except BrokenPipeError:
+            self.fail()
+
+    def receive(self) -> bytes:
+        try:
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            self.fail()
+        line = self.process.stdout.readline()
+        if not line:
+            self.fail()
+        return line
+
+    def current_branch(self) -> str | None:
+        try:
+            head = (self.git_dir / "HEAD").read_text().strip()
+        except OSError:
+            head = ""
+        if head.startswith("ref: ") and not head.endswith("/.invalid"):
+            return head[5:]
+        result = self.run_git(
+            "symbolic-ref", "-q", "HEAD",
+            capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip()
+
+    def resolve(
+        self,
+        ref: str,
+    ) -> str | None:
+        # the branch is read fresh before every commit, it may have
+        # been moved by someone else in the meantime
+        try:
+            value = (self.common_dir / ref).read_text().strip()
+        except OSError:
+            value = ""
+        if value and all(c in "0123456789abcdef" for c in value):
+            return value
+        result = self.run_git(
+            "rev-parse", "-q", "--verify", f"{ref}^{{commit}}",
+            capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip()
+
+    def ls(
+        self,
+        parent: str | None,
+        paths: list[str],
+    ) -> dict[str, tuple[str, str, str]]:
+        entries = {}
+        if parent is None:
+            return entries
+        if len(paths) > LS_TREE_LIMIT:
+            return self.ls_tree(parent, paths)
+        for start in range(0, len(paths), LS_BATCH):
+            batch = paths[start:start + LS_BATCH]
+            for path in batch:
+                self.send(b"ls %s %s\n" % (parent.encode(), quote_path(path)))
+            for path in batch:
+                line = self.receive()
+                if line.startswith(b"missing "):
+                    continue
+                mode, kind, sha = line.split(b"\t", 1)[0].split()
+                entries[path] = (mode.decode(), kind.decode(), sha.decode())
+        return entries
+
+    def ls_tree(
+        self,
+        parent: str,
+        paths: list[str],
+    ) -> dict[str, tuple[str, str, str]]:
+        wanted = set(paths)
+        result = self.run_git(
+            "ls-tree", "-r", "-t", "-z", "--full-tree", parent,
+            capture_output=True, check=True,
+        )
+        entries = {}
+        for record in result.stdout.split(b"\0"):
+            if not record:
+                continue
+            info, path = record.split(b"\t", 1)
+            path = os.fsdecode(path)
+            if path in wanted:
+                mode, kind, sha = info.decode().split()
+                entries[path] = (mode, kind, sha)
+        return entries
+
+    def tracked_under(
+        self,
+        parent: str,
+        directories: list[str],
+    ) -> list[str]:
+        result = self.run_git(
+            "ls-tree", "-r", "-z", "--name-only", parent, "--", *directories,
+            capture_output=True, check=True,
+        )
+        return [
+            os.fsdecode(path)
+                for path in result.stdout.split(b"\0")
+                if path
+        ]
+
+    def ignored(
+        self,
+        paths: list[str],
+    ) -> set[str]:
+        if not paths:
+            return set()
+        result = self.run_git(
+            "check-ignore", "--stdin", "-z", "--no-index",
+            input=b"".join(os.fsencode(path) + b"\0" for path in paths),
+            capture_output=True,
+        )
+        return {
+            os.fsdecode(path)
+                for path in result.stdout.split(b"\0")
+                if path
+        }
+
+    def read_entry(
+        self,
+        path: str,
+    ) -> tuple[str, bytes | Path, str] | None:
+        # a link's target is small enough to keep, a file is only hashed
+        # here and read again when it is sent
+        full = self.path / path
+        try:
+            st = os.lstat(full)
+            if stat.S_ISLNK(st.st_mode):
+                target = os.readlink(os.fsencode(full))
+                return "120000", target, self.blob_id(target)
+            if not stat.S_ISREG(st.st_mode):
+                return None
+            if st.st_mode & 0o100:
+                mode = "100755"
+            else:
+                mode = "100644"
+            return mode, full, self.file_id(full)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def blob_id(
+        self,
+        data: bytes,
+    ) -> str:
+        digest = hashlib.new(self.object_format, b"blob %d\0" % len(data))
+        digest.update(data)
+        return digest.hexdigest()
+
+    def file_id(
+        self,
+        full: Path,
+    ) -> str:
+        with open(full, "rb") as handle:
+            size = os.fstat(handle.fileno()).st_size
+            digest = hashlib.new(self.object_format, b"blob %d\0" % size)
+            while chunk := handle.read(CHUNK_SIZE):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def candidate_paths(
+        self,
+        events: list[Event],
+    ) -> tuple[list[str], list[str]]:
+        paths = {}
+        directories = []
+        for event in events:
+            for path in (event.path, event.new_path):
+                if not path:
+                    continue
+                path = path.rstrip("/")
+                full = self.path / path
+                if full.is_dir() and not full.is_symlink():
+                    directories.append(path)
+                    for rel in sorted(list_files(full, IgnoreMatcher([".git"]))):
+                        paths[f"{path}/{rel}"] = None
+                paths[path] = None
+        return list(paths), directories
+
+    def collect_changes(
+        self,
+        parent: str | None,
+        events: list[Event],
+    ) -> tuple[
+        list[str],
+        list[tuple[str, str, bytes | Path | None, str]],
+        list[Event],
+    ]:
+        paths, directories = self.candidate_paths(events)
+        entries = self.ls(parent, paths)
+
+        # whole directories come and go in one event, so anything that
+        # used to be tracked beneath them needs checking as well
+        trees = [
+            path
+                for path, (_, kind, _) in entries.items()
+                if kind == "tree"
+        ]
+        if trees:
+            extra = [
+                path
+                    for path in self.tracked_under(parent, trees)
+                    if path not in entries
+            ]
+            entries.update(self.ls(parent, extra))
+            paths.extend(path for path in extra if path not in paths)
+
+        deletes = []
+        replaced = []
+        modifies = []
+        created = []
+        for path in paths:
+            entry = entries.get(path)
+            was_tree = entry is not None and entry[1] in ("tree", "commit")
+            if was_tree:
+                # only of interest if a file has taken its place
+                entry = None
+            known = self.known_blob(path)
+            if known:
+                # already in the object store, so there's nothing to read
+                mode, sha = known
+                data = None
+            else:
+                current = self.read_entry(path)
+                if current is None:
+                    if entry:
+                        deletes.append((path, entry[2]))
+                    continue
+                mode, data, sha = current
+            if was_tree:
+                # the directory or submodule has to go before the file
+                # can be written in its place
+                replaced.append(path)
+            if entry is None:
+                created.append((path, mode, data, sha))
+            elif (mode, sha) != (entry[0], entry[2]):
+                modifies.append((path, mode, data, sha))
+        if created:
+            ignored = self.ignored([path for path, _, _, _ in created])
+            created = [item for item in created if item[0] not in ignored]
+
+        changed = []
+        writes = []
+        deleted_by_id = {}
+        for path, sha in deletes:
+            deleted_by_id.setdefault(sha, []).append(path)
+        for path, mode, data, sha in modifies:
+            writes.append((path, mode, data, sha))
+            changed.append(Event("modified", path))
+        for path, mode, data, sha in created:
+            writes.append((path, mode, data, sha))
+            origins = deleted_by_id.get(sha)
+            if origins:
+                changed.append(Event("renamed", origins.pop(0), path))
+            else:
+                changed.append(Event("created", path))
+        for origins in deleted_by_id.values():
+            for path in origins:
+                changed.append(Event("deleted", path))
+        return replaced + [path for path, _ in deletes], writes, changed
+
+    def send_modify(
+        self,
+        path: str,
+        mode: str,
+        data: bytes | Path | None,
+        sha: str,
+    ):
+        if data is None:
+            self.send(b"M %s %s %s\n" % (
+                mode.encode(), sha.encode(), quote_path(path),
+            ))
+            return
+        self.send(b"M %s inline %s\n" % (mode.encode(), quote_path(path)))
+        if isinstance(data, bytes):
+            self.send(b"data %d\n%s\n" % (len(data), data))
+        else:
+            self.send_file(data)
+
+    def send_file(
+        self,
+        full: Path,
+    ):
+        try:
+            handle = open(full, "rb")
+        except (FileNotFoundError, NotADirectoryError):
+            self.send(b"data 0\n\n")
+            return
+        with handle:
+            size = os.fstat(handle.fileno()).st_size
+            self.send(b"data %d\n" % size)
+            for chunk in exact_chunks(handle, size):
+                self.send(chunk)
+        self.send(b"\n")
+
+    def commit_batch(self, events):
+        if not events:
+            return
+        if self.dry_run:
+            return super().commit_batch(events)
+        if self.git_dir is None:
+            self.start()
+
+        ref = self.current_branch()
+        if ref is None:
+            # a detached HEAD has no branch to update directly
+            return GitRepo.commit_batch(self, events)
+        parent = self.resolve(ref)
+
+        deletes, writes, changed = self.collect_changes(parent, events)
+        if not changed:
+            return
+        if self.message:
+            message = self.message
+        else:
+            message = self.generate_commit_message(
+                changed, self.summarise_over,
+            )
+        self.write_commit(ref, parent, deletes, writes, message)
+        for event in changed:
+            self.committed.add(event.path)
+            if event.new_path:
+                self.committed.add(event.new_path)
+
+    def write_commit(
+        self,
+        ref: str,
+        parent: str | None,
+        deletes: list[str],
+        writes: list[tuple[str, str, bytes | Path | None, str]],
+        message: str,
+    ):
+        message = message.encode()
+        when = timestamp()
+        if parent is None:
+            self.send(b"reset %s\n" % ref.encode())
+        self.send(b"commit %s\n" % ref.encode())
+        self.send(b"author %s %s\n" % (
+            self.author_ident.encode(), when.encode(),
+        ))
+        self.send(b"committer %s %s\n" % (
+            self.committer_ident.encode(), when.encode(),
+        ))
+        self.send(b"data %d\n%s\n" % (len(message), message))
+        if parent:
+            self.send(b"from %s\n" % parent.encode())
+        for path in deletes:
+            self.send(b"D %s\n" % quote_path(path))
+        for path, mode, data, sha in writes:
+            self.send_modify(path, mode, data, sha)
+
+        # refs only move on a checkpoint, and the progress line coming
+        # back says that it has finished
+        self.send(b"\ncheckpoint\n\nprogress bolthole\n")
+        while self.receive() != b"progress bolthole\n":
+            pass
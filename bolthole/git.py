@@ -1,12 +1,22 @@
+import hashlib
+import os
 import shlex
+import stat
 import subprocess
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 
 from bolthole.debounce import Event
+from bolthole.index import fill_stat
+from bolthole.metrics import registry
+from bolthole.profile import profiler
 
 
 _timeless = False
+_context = threading.local()
 
 
 def configure_output(timeless: bool):
@@ -14,7 +24,22 @@ def configure_output(timeless: bool):
     _timeless = timeless
 
 
+@contextmanager
+def output_label(label: str | None):
+    # when watching several trees, what is output while working on one
+    # is marked with its name
+    previous = getattr(_context, "label", None)
+    _context.label = label
+    try:
+        yield
+    finally:
+        _context.label = previous
+
+
 def output(message: str):
+    label = getattr(_context, "label", None)
+    if label:
+        message = f"[{label}] {message}"
     if _timeless:
         print(message, flush=True)
     else:
@@ -22,8 +47,19 @@ def output(message: str):
         print(f"{ts}{message}", flush=True)
 
 
+def hash_blob(path: Path) -> str:
+    # the object id git would give the file's contents
+    with open(path, "rb") as handle:
+        size = os.fstat(handle.fileno()).st_size
+        digest = hashlib.sha1(b"blob %d\0" % size)
+        while chunk := handle.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 class GitRepo:
     SUBJECT_LINE_LIMIT = 50
+    BODY_LINE_LIMIT = 100
 
     def __init__(
         self,
@@ -32,12 +68,20 @@ class GitRepo:
         show_git=False,
         author=None,
         message=None,
+        manifest=None,
+        max_files=0,
+        max_bytes=0,
+        summarise_over=0,
     ):
         self.path = Path(path)
         self.dry_run = dry_run
         self.show_git = show_git
         self.author = author
         self.message = message
+        self.manifest = manifest
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.summarise_over = summarise_over
 
     EXCLUDE_FLAGS = {
         "--no-verify",
@@ -46,10 +90,13 @@ class GitRepo:
     }
     EXCLUDE_OPTIONS = {
         "-m",
+        "-F",
         "-C",
     }
     EXCLUDE_COMMANDS = {
+        "check-ignore",
         "diff",
+        "rev-parse",
         "status",
     }
     DRY_RUN_ALLOWED = {
@@ -57,11 +104,21 @@ class GitRepo:
         "status",
     }
 
-    def run_git(self, *args, **kwargs):
+    def run_git(self, *args, paths=None, **kwargs):
         if args:
             command = args[0]
         else:
             command = None
+        git_args = list(args)
+        if paths is not None:
+            # handed over on stdin, as there could be more than fit on
+            # a command line, but shown as if they were arguments
+            args = (*args, "--", *paths)
+            git_args.extend(["--pathspec-from-file=-", "--pathspec-file-nul"])
+            kwargs["input"] = b"".join(
+                os.fsencode(path) + b"\0"
+                    for path in paths
+            )
         display_parts = ["git"]
         skip_next = False
         for arg in args:
@@ -85,7 +142,18 @@ class GitRepo:
         if show_this:
             output(f"%  {formatted}")
 
-        result = subprocess.run(["git", "-C", str(self.path), *args], **kwargs)
+        start = time.monotonic()
+        with profiler.span(f"git {command}"):
+            result = subprocess.run(
+                ["git", "-C", str(self.path), *git_args],
+                **kwargs,
+            )
+        registry.inc("bolthole_git_commands_total", command=command)
+        registry.observe(
+            "bolthole_git_command_seconds",
+            time.monotonic() - start,
+            command=command,
+        )
 
         return result
 
@@ -104,12 +172,27 @@ class GitRepo:
         )
         return result.returncode == 0
 
+    def push_remote(self, remote):
+        start = time.monotonic()
+        with profiler.span("push", remote=remote):
+            result = self.run_git("push", remote, "HEAD", capture_output=True)
+        registry.observe(
+            "bolthole_push_seconds",
+            time.monotonic() - start,
+            remote=remote,
+        )
+        if result.returncode != 0:
+            registry.inc("bolthole_push_failures_total", remote=remote)
+        return result.returncode == 0
+
     def push(self, remotes):
         for remote in remotes:
-            result = self.run_git("push", remote, "HEAD", capture_output=True)
-            if result.returncode != 0:
+            if not self.push_remote(remote):
                 output(f"!! push to {remote} failed")
 
+    def close(self):
+        pass
+
     def init(self):
         self.run_git("init", "--quiet", check=True)
 
@@ -117,8 +200,13 @@ class GitRepo:
         self.run_git("add", "-A", check=True)
 
     def get_uncommitted(self):
+        status_args = ["status", "--porcelain", "-z"]
+        if self.max_files or self.max_bytes:
+            # untracked directories need listing file by file, to be
+            # able to split them across commits
+            status_args.append("--untracked-files=all")
         result = self.run_git(
-            "status", "--porcelain", "-z",
+            *status_args,
             capture_output=True, text=True, check=True,
         )
         events = []
@@ -156,7 +244,146 @@ class GitRepo:
                 events.append(Event("renamed", path, new_path))
         return events
 
+    def known_blob(self, path):
+        # files copied into the repository were stored as blobs on the
+        # way, which can be used as long as the file hasn't changed since
+        if self.manifest is None or self.manifest.objects_dir is None:
+            return None
+        entry = self.manifest.entries.get(path)
+        if entry is None or entry.digest is None:
+            return None
+        try:
+            st = os.lstat(self.path / path)
+        except OSError:
+            return None
+        if (not stat.S_ISREG(st.st_mode)
+                or st.st_size != entry.size
+                or st.st_mtime_ns != entry.mtime_ns):
+            return None
+        digest = entry.digest
+        if not (self.manifest.objects_dir / digest[:2] / digest[2:]).exists():
+            return None
+        if st.st_mode & 0o100:
+            return "100755", digest
+        return "100644", digest
+
+    def known_blobs(self, paths):
+        known = {}
+        for path in paths:
+            blob = self.known_blob(path)
+            if blob:
+                known[path] = blob
+        if not known:
+            return known
+        result = self.run_git(
+            "check-ignore", "--stdin", "-z",
+            input=b"".join(os.fsencode(path) + b"\0" for path in known),
+            capture_output=True,
+        )
+        for path in result.stdout.split(b"\0"):
+            known.pop(os.fsdecode(path), None)
+        return known
+
+    def stage_blobs(self, blobs):
+        records = [
+            b"%s %s\t%s\0" % (mode.encode(), digest.encode(), os.fsencode(path))
+                for path, (mode, digest) in blobs.items()
+        ]
+        self.run_git(
+            "update-index", "--add", "-z", "--index-info",
+            input=b"".join(records), check=True,
+        )
+        # without stat details, git would read every file again to see
+        # it is unchanged, so they are filled in from what the manifest
+        # says was copied; a file changed since is left for git to read
+        stats = {}
+        for path, (mode, digest) in blobs.items():
+            entry = self.manifest.entries.get(path)
+            try:
+                st = os.lstat(self.path / path)
+            except OSError:
+                continue
+            if (entry and st.st_size == entry.size
+                    and st.st_mtime_ns == entry.mtime_ns):
+                stats[path] = (digest, st)
+        if stats:
+            fill_stat(self.path / ".git" / "index", stats)
+
+    def commit_index(self, message):
+        # the staged entries have their stat details already, there's no
+        # need for git commit to go over the whole index again
+        tree = self.run_git(
+            "write-tree",
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        head = self.run_git(
+            "rev-parse", "-q", "--verify", "HEAD",
+            capture_output=True, text=True,
+        )
+        commit_args = ["commit-tree", tree, "-F", "-", "--no-gpg-sign"]
+        parent = ""
+        if head.returncode == 0:
+            parent = head.stdout.strip()
+            commit_args.extend(["-p", parent])
+        env = None
+        if self.author:
+            name, _, email = self.author.partition("<")
+            env = dict(
+                os.environ,
+                GIT_AUTHOR_NAME=name.strip(),
+                GIT_AUTHOR_EMAIL=email.rstrip(">").strip(),
+            )
+        commit = self.run_git(
+            *commit_args,
+            input=message, capture_output=True, text=True, check=True, env=env,
+        ).stdout.strip()
+        subject = message.split("\n", 1)[0]
+        self.run_git(
+            "update-ref", "-m", f"commit: {subject}", "HEAD", commit, parent,
+            check=True,
+        )
+
+    def event_size(self, event):
+        if event.type == "deleted":
+            return 0
+        try:
+            return os.lstat(self.path / (event.new_path or event.path)).st_size
+        except OSError:
+            return 0
+
+    def batches(self, events):
+        # very large change sets are split into a series of commits, each
+        # kept under the limits, rather than one enormous one
+        if not self.max_files and not self.max_bytes:
+            yield events
+            return
+        batch = []
+        size = 0
+        for event in events:
+            if self.max_bytes:
+                event_size = self.event_size(event)
+            else:
+                event_size = 0
+            full = (
+                (self.max_files and len(batch) >= self.max_files)
+                or (self.max_bytes and size + event_size > self.max_bytes)
+            )
+            if batch and full:
+                yield batch
+                batch = []
+                size = 0
+            batch.append(event)
+            size += event_size
+        if batch:
+            yield batch
+
     def commit_changes(self, events):
+        start = time.monotonic()
+        for batch in self.batches(events):
+            self.commit_batch(batch)
+        registry.observe("bolthole_commit_seconds", time.monotonic() - start)
+
+    def commit_batch(self, events):
         if not events:
             return
         paths = []
@@ -164,12 +391,21 @@ class GitRepo:
             paths.append(event.path)
             if event.new_path:
                 paths.append(event.new_path)
-        self.run_git("add", "--", *paths)
+        known = {}
+        if not self.dry_run:
+            known = self.known_blobs(paths)
+        if known:
+            self.stage_blobs(known)
+        others = [path for path in paths if path not in known]
+        if others:
+            self.run_git("add", paths=others)
         if self.dry_run:
             if self.message:
                 message = self.message
             else:
-                message = self.generate_commit_message(events)
+                message = self.generate_commit_message(
+                    events, self.summarise_over,
+                )
         else:
             staged = self.get_staged()
             if not staged:
@@ -177,20 +413,27 @@ class GitRepo:
             if self.message:
                 message = self.message
             else:
-                message = self.generate_commit_message(staged)
+                message = self.generate_commit_message(
+                    staged, self.summarise_over,
+                )
+        if known:
+            self.commit_index(message)
+            return
+        # the message lists every file, so like the paths it goes over
+        # stdin rather than risk not fitting on the command line
         commit_args = [
             "commit",
-            "-m", message,
+            "-F", "-",
             "--no-verify",
             "--no-gpg-sign",
             "--quiet",
         ]
         if self.author:
             commit_args.extend(["--author", self.author])
-        self.run_git(*commit_args, check=True)
+        self.run_git(*commit_args, input=message, text=True, check=True)
 
     @staticmethod
-    def generate_commit_message(events):
+    def generate_commit_message(events, summarise_over=0):
         if not events:
             return ""
 
@@ -201,6 +444,11 @@ class GitRepo:
             "renamed": "Rename",
         }
 
+        # past this, listing every file makes for an unreadable message;
+        # zero lists them all regardless
+        if summarise_over and len(events) > summarise_over:
+            return GitRepo.summarise_changes(events, verb_map)
+
         items = []
         for event in events:
             verb = verb_map[event.type]
@@ -259,3 +507,60 @@ class GitRepo:
                 for item in items
         ]
         return f"{subject}\n\n" + "\n".join(body_lines)
+
+    @staticmethod
+    def summarise_changes(events, verb_map):
+        # too many to list one by one, so count them by directory, moving
+        # up a level at a time until there are few enough lines to show
+        groups = {}
+        for event in events:
+            directory = event.path.rpartition("/")[0]
+            key = (directory, event.type)
+            group = groups.get(key)
+            if group:
+                group[0] += 1
+            else:
+                groups[key] = [1, event, False]
+
+        while len(groups) > GitRepo.BODY_LINE_LIMIT:
+            depth = max(directory.count("/") for directory, _ in groups) + 1
+            merged = {}
+            for (directory, event_type), group in groups.items():
+                count, event, nested = group
+                if directory and directory.count("/") + 1 == depth:
+                    directory = directory.rpartition("/")[0]
+                    nested = True
+                key = (directory, event_type)
+                if key in merged:
+                    merged[key][0] += count
+                    merged[key][2] = merged[key][2] or nested
+                else:
+                    merged[key] = [count, event, nested]
+            groups = merged
+
+        order = list(verb_map)
+        body_lines = []
+        for directory, event_type in sorted(
+            groups,
+            key=lambda key: (key[0], order.index(key[1])),
+        ):
+            count, event, nested = groups[(directory, event_type)]
+            verb = verb_map[event_type]
+            if count == 1 and event_type == "renamed":
+                line = f"{verb} {event.path} to {event.new_path}"
+            elif count == 1:
+                line = f"{verb} {event.path}"
+            elif directory:
+                line = f"{verb} {count:,} files under {directory}/"
+            elif nested:
+                line = f"{verb} {count:,} files"
+            else:
+                line = f"{verb} {count:,} files at the top level"
+            body_lines.append(f"- {line}")
+
+        types = {event_type for _, event_type in groups}
+        if len(types) == 1:
+            subject = f"{verb_map[types.pop()]} {len(events):,} files"
+        else:
+            subject = f"Change {len(events):,} files"
+        return f"{subject}\n\n" + "\n".join(body_lines)
@@ -0,0 +1,69 @@
+import fnmatch
+import re
+from functools import lru_cache
+
+
+class IgnoreMatcher:
+    CACHE_SIZE = 4096
+
+    def __init__(
+        self,
+        patterns: list[str],
+    ):
+        self.patterns = list(patterns)
+
+        # a path component never contains a separator, so only patterns
+        # without one need trying against each directory and filename
+        name_patterns = [p for p in self.patterns if "/" not in p]
+        self.name_regex = self.compile(name_patterns)
+        self.path_regex = self.compile(self.patterns)
+
+        self.directory_ignored = lru_cache(maxsize=self.CACHE_SIZE)(
+            self.match_directory
+        )
+
+    @staticmethod
+    def compile(
+        patterns: list[str],
+    ) -> re.Pattern | None:
+        if not patterns:
+            return None
+        combined = "|".join(
+            f"(?:{fnmatch.translate(pattern)})"
+                for pattern in patterns
+        )
+        return re.compile(combined)
+
+    def match_name(
+        self,
+        name: str,
+    ) -> bool:
+        if self.name_regex is None:
+            return False
+        return self.name_regex.match(name) is not None
+
+    def match_directory(
+        self,
+        directory: str,
+    ) -> bool:
+        # a directory is ignored when any of its components is, which
+        # means everything beneath it is ignored too
+        if not directory:
+            return False
+        parent, _, name = directory.rpartition("/")
+        if self.match_name(name):
+            return True
+        return self.directory_ignored(parent)
+
+    def __call__(
+        self,
+        rel_path: str,
+    ) -> bool:
+        parent, _, name = rel_path.rpartition("/")
+        if self.directory_ignored(parent):
+            return True
+        if self.match_name(name):
+            return True
+        if self.path_regex is None:
+            return False
+        return self.path_regex.match(rel_path) is not None
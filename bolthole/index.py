@@ -0,0 +1,91 @@
+import hashlib
+import os
+import struct
+from pathlib import Path
+
+
+# ctime, mtime, dev, ino, mode, uid, gid, size, object id and flags
+ENTRY = struct.Struct(">10I20sH")
+EXTENDED = 0x4000
+
+
+def stat_fields(
+    st: os.stat_result,
+    mode: int,
+) -> tuple[int, ...]:
+    # as git stores them, each cut down to 32 bits
+    fields = (
+        st.st_ctime_ns // 1_000_000_000, st.st_ctime_ns % 1_000_000_000,
+        st.st_mtime_ns // 1_000_000_000, st.st_mtime_ns % 1_000_000_000,
+        st.st_dev, st.st_ino, mode, st.st_uid, st.st_gid, st.st_size,
+    )
+    return tuple(field & 0xFFFFFFFF for field in fields)
+
+
+def has_split_index(
+    data: bytes,
+    offset: int,
+) -> bool:
+    # with a split index, entries can live in a shared file instead
+    while offset + 8 <= len(data) - 20:
+        signature, size = struct.unpack_from(">4sI", data, offset)
+        if signature == b"link":
+            return True
+        offset += 8 + size
+    return False
+
+
+def fill_stat(
+    index: Path,
+    known: dict[str, tuple[str, os.stat_result]],
+) -> bool:
+    # entries staged by object id have no stat details, so git would read
+    # the files again to find out they are unchanged; as the contents are
+    # already known, the details are written in directly. known maps each
+    # path to its object id and the stat it had when that was taken.
+    # Returns False, leaving the index alone, for formats this can't
+    # patch or when something else is using the index
+    data = index.read_bytes()
+    signature, version, count = struct.unpack_from(">4sII", data)
+    if signature != b"DIRC" or version not in (2, 3):
+        return False
+
+    body = bytearray(data[:-20])
+    offset = 12
+    for _ in range(count):
+        fields = ENTRY.unpack_from(body, offset)
+        object_id, flags = fields[10], fields[11]
+        start = offset + ENTRY.size
+        if flags & EXTENDED:
+            start += 2
+        end = body.index(b"\0", start)
+        path = os.fsdecode(bytes(body[start:end]))
+        entry = known.get(path)
+        if entry and entry[0] == object_id.hex():
+            struct.pack_into(
+                ">10I", body, offset, *stat_fields(entry[1], fields[6]),
+            )
+        # names are padded with at least one NUL to a multiple of eight
+        offset += (end - offset + 8) & ~7
+    if has_split_index(data, offset):
+        return False
+
+    if data[-20:] == bytes(20):
+        # index.skipHash leaves the checksum out
+        checksum = bytes(20)
+    else:
+        checksum = hashlib.sha1(body).digest()
+    lock = index.with_name(index.name + ".lock")
+    try:
+        fd = os.open(lock, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        return False
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(body)
+            handle.write(checksum)
+        os.replace(lock, index)
+    except BaseException:
+        lock.unlink(missing_ok=True)
+        raise
+    return True
@@ -0,0 +1,463 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import stat
+import struct
+import threading
+import time
+import traceback
+from pathlib import Path
+
+from watchdog.events import (
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+    FileSystemEvent,
+)
+
+from bolthole.git import output, output_label
+from bolthole.walk import walk_files
+
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# contents are taken as changed when a writer closes the file, not on
+# every write, so a large file is reported once it is complete
+WATCH_MASK = (
+    IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+    | IN_DELETE | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+)
+
+# wd, mask, cookie, len, then the name padded to len
+EVENT_HEADER = struct.Struct("iIII")
+EVENT_MAX = EVENT_HEADER.size + 256
+READ_SIZE = 64 * 1024
+
+# a file moved out of the tree is only reported as moved from, so is
+# taken as deleted if nothing moved to turns up this soon after
+MOVE_TIMEOUT = 0.05
+
+
+def load_libc() -> ctypes.CDLL:
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+    return libc
+
+
+def join_path(
+    directory: str,
+    name: str,
+) -> str:
+    if directory:
+        return f"{directory}/{name}"
+    return name
+
+
+def within(
+    path: str,
+    directory: str,
+) -> bool:
+    if not directory:
+        return True
+    return path == directory or path.startswith(directory + "/")
+
+
+class WatchedTree:
+    def __init__(
+        self,
+        handler,
+        root: Path,
+    ):
+        self.handler = handler
+        self.root = root
+        self.ignore = handler.ignore
+        # relative directory: watch descriptor
+        self.watches: dict[str, int] = {}
+
+    def absolute(
+        self,
+        rel: str,
+    ) -> str:
+        return os.path.join(self.root, rel) if rel else str(self.root)
+
+    def dispatch(
+        self,
+        event: FileSystemEvent,
+    ):
+        self.handler.dispatch(event)
+
+    def subtree(
+        self,
+        rel_dir: str,
+    ) -> list[str]:
+        return [rel for rel in self.watches if within(rel, rel_dir)]
+
+    def known_under(
+        self,
+        rel_dir: str,
+    ) -> list[str]:
+        # only what matches is sorted; copied first, as other threads can
+        # be adding to it
+        prefix = rel_dir + "/"
+        return sorted(
+            path
+                for path in list(self.handler.known_files)
+                if path.startswith(prefix)
+        )
+
+
+class InotifyObserver:
+    # stands in for watchdog's observer on Linux, but only watches the
+    # directories that aren't ignored, so .git, node_modules and the like
+    # neither use up watches nor send events only to be dropped; watches
+    # follow directories as they are created, renamed and removed
+    def __init__(self):
+        self.libc = load_libc()
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.wake_read, self.wake_write = os.pipe()
+        self.trees: list[WatchedTree] = []
+        self.watches: dict[int, tuple[WatchedTree, str]] = {}
+        # cookie: (when, tree, path, whether a directory)
+        self.moves: dict[int, tuple[float, WatchedTree, str, bool]] = {}
+        # wall clock time the queue was last known to be empty, from when
+        # events lost to an overflow could have happened
+        self.drained_ns = time.time_ns()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="inotify")
+
+    def schedule(
+        self,
+        handler,
+        path: str,
+        recursive: bool = True,
+    ):
+        self.trees.append(WatchedTree(handler, Path(path)))
+
+    def add_watch(
+        self,
+        tree: WatchedTree,
+        rel_dir: str,
+    ) -> bool:
+        wd = self.libc.inotify_add_watch(
+            self.fd,
+            os.fsencode(tree.absolute(rel_dir)),
+            WATCH_MASK,
+        )
+        if wd < 0:
+            if ctypes.get_errno() == errno.ENOSPC:
+                with output_label(tree.handler.label):
+                    output(
+                        f"!! cannot watch {rel_dir or '.'}: "
+                        f"fs.inotify.max_user_watches reached"
+                    )
+            # otherwise it has already gone again
+            return False
+        self.watches[wd] = (tree, rel_dir)
+        tree.watches[rel_dir] = wd
+        return True
+
+    def add_directory(
+        self,
+        tree: WatchedTree,
+        rel_dir: str,
+        report: bool,
+    ):
+        # watched before being listed, so nothing created in between is
+        # missed; anything seen twice is only a repeated change
+        if not self.add_watch(tree, rel_dir):
+            return
+        try:
+            with os.scandir(tree.absolute(rel_dir)) as scanner:
+                entries = sorted(scanner, key=lambda entry: entry.name)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            return
+        for entry in entries:
+            rel = join_path(rel_dir, entry.name)
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not tree.ignore.directory_ignored(rel):
+                        self.add_directory(tree, rel, report)
+                elif report and entry.is_file():
+                    tree.dispatch(FileCreatedEvent(entry.path))
+            except FileNotFoundError:
+                continue
+
+    def forget_directory(
+        self,
+        tree: WatchedTree,
+        rel_dir: str,
+    ) -> list[int]:
+        # returns the watches, which are still in place
+        forgotten = []
+        for rel in tree.subtree(rel_dir):
+            wd = tree.watches.pop(rel)
+            self.watches.pop(wd, None)
+            forgotten.append(wd)
+        return forgotten
+
+    def remove_directory(
+        self,
+        tree: WatchedTree,
+        rel_dir: str,
+    ):
+        for wd in self.forget_directory(tree, rel_dir):
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def rewatch(
+        self,
+        tree: WatchedTree,
+        old: str,
+        new: str,
+    ):
+        # the watches move with a directory, but which of its
+        # subdirectories are ignored can change with the name
+        old_watches = self.forget_directory(tree, old)
+        if not new or not tree.ignore.directory_ignored(new):
+            self.add_directory(tree, new, False)
+        kept = set(tree.watches.values())
+        for wd in old_watches:
+            if wd not in kept:
+                self.libc.inotify_rm_watch(self.fd, wd)
+
+    def moved_within(
+        self,
+        tree: WatchedTree,
+        old: str,
+        new: str,
+        is_dir: bool,
+    ):
+        if not is_dir:
+            tree.dispatch(FileMovedEvent(tree.absolute(old), tree.absolute(new)))
+            return
+        old_ignored = tree.ignore.directory_ignored(old)
+        new_ignored = tree.ignore.directory_ignored(new)
+        if old_ignored and new_ignored:
+            return
+
+        self.rewatch(tree, old, new)
+
+        # reported file by file, as watchdog does, so the handler can
+        # decide which side of the move is ignored; ignored directories
+        # aren't walked, so anything known in them under the old name is
+        # taken as gone
+        moved = set()
+        for rel, _ in walk_files(Path(tree.absolute(new)), tree.ignore, new + "/"):
+            old_rel = old + rel[len(new):]
+            moved.add(old_rel)
+            tree.dispatch(FileMovedEvent(tree.absolute(old_rel), tree.absolute(rel)))
+        for path in tree.known_under(old):
+            if path not in moved:
+                tree.dispatch(FileDeletedEvent(tree.absolute(path)))
+
+    def moved_out(
+        self,
+        tree: WatchedTree,
+        rel: str,
+        is_dir: bool,
+    ):
+        if not is_dir:
+            tree.dispatch(FileDeletedEvent(tree.absolute(rel)))
+            return
+        # it can't be listed any more, so what it held is what was known
+        self.remove_directory(tree, rel)
+        for path in tree.known_under(rel):
+            tree.dispatch(FileDeletedEvent(tree.absolute(path)))
+
+    def moved_in(
+        self,
+        tree: WatchedTree,
+        rel: str,
+        is_dir: bool,
+    ):
+        if not is_dir:
+            tree.dispatch(FileCreatedEvent(tree.absolute(rel)))
+        elif not tree.ignore.directory_ignored(rel):
+            self.add_directory(tree, rel, True)
+
+    def created(
+        self,
+        tree: WatchedTree,
+        rel: str,
+    ):
+        # a file created to be written is reported when it is closed;
+        # links are never opened, so are reported straight away
+        path = tree.absolute(rel)
+        try:
+            info = os.lstat(path)
+        except FileNotFoundError:
+            return
+        if stat.S_ISLNK(info.st_mode) or info.st_nlink > 1:
+            tree.dispatch(FileCreatedEvent(path))
+
+    def written(
+        self,
+        tree: WatchedTree,
+        rel: str,
+    ):
+        path = tree.absolute(rel)
+        if rel in tree.handler.known_files:
+            tree.dispatch(FileModifiedEvent(path))
+        else:
+            tree.dispatch(FileCreatedEvent(path))
+
+    def expire_moves(
+        self,
+        before: float,
+    ):
+        for cookie, (when, tree, rel, is_dir) in list(self.moves.items()):
+            if when <= before:
+                del self.moves[cookie]
+                self.moved_out(tree, rel, is_dir)
+
+    def overflowed(self):
+        # anything could have happened since the queue was last emptied,
+        # including directories coming and going, so watches are put
+        # right before looking for what changed
+        for tree in self.trees:
+            with output_label(tree.handler.label):
+                output("!! inotify queue overflowed, rescanning")
+            self.rewatch(tree, "", "")
+            tree.handler.request_rescan("", self.drained_ns)
+
+    def recover(
+        self,
+        wd: int,
+    ):
+        # only the directory an event was lost in needs looking at again
+        watched = self.watches.get(wd)
+        if watched:
+            tree, rel_dir = watched
+            tree.handler.request_rescan(rel_dir, self.drained_ns)
+
+    def handle(
+        self,
+        wd: int,
+        mask: int,
+        cookie: int,
+        name: str,
+    ):
+        if mask & IN_Q_OVERFLOW:
+            self.overflowed()
+            return
+        if mask & IN_IGNORED:
+            # the directory was removed, or its watch taken off
+            watched = self.watches.pop(wd, None)
+            if watched and watched[0].watches.get(watched[1]) == wd:
+                del watched[0].watches[watched[1]]
+            return
+        watched = self.watches.get(wd)
+        if watched is None or not name:
+            return
+        tree, rel_dir = watched
+        rel = join_path(rel_dir, name)
+        is_dir = bool(mask & IN_ISDIR)
+
+        if mask & IN_MOVED_FROM:
+            self.moves[cookie] = (time.monotonic(), tree, rel, is_dir)
+        elif mask & IN_MOVED_TO:
+            move = self.moves.pop(cookie, None)
+            if move and move[1] is tree:
+                self.moved_within(tree, move[2], rel, is_dir)
+            else:
+                if move:
+                    self.moved_out(*move[1:])
+                self.moved_in(tree, rel, is_dir)
+        elif is_dir:
+            # the files in a removed directory have each been reported,
+            # and its watch goes with it
+            if mask & IN_CREATE and not tree.ignore.directory_ignored(rel):
+                self.add_directory(tree, rel, True)
+        elif mask & IN_CREATE:
+            self.created(tree, rel)
+        elif mask & IN_DELETE:
+            tree.dispatch(FileDeletedEvent(tree.absolute(rel)))
+        elif mask & IN_CLOSE_WRITE:
+            self.written(tree, rel)
+        elif mask & IN_ATTRIB:
+            tree.dispatch(FileModifiedEvent(tree.absolute(rel)))
+
+    def read_events(self) -> list[tuple[int, int, int, str]]:
+        started_ns = time.time_ns()
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        if READ_SIZE - len(data) >= EVENT_MAX:
+            # anything more would have fitted, so the queue is now empty
+            self.drained_ns = started_ns
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, cookie, name))
+        return events
+
+    def start(self):
+        self.drained_ns = time.time_ns()
+        for tree in self.trees:
+            self.add_directory(tree, "", False)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopping.is_set():
+            timeout = MOVE_TIMEOUT if self.moves else None
+            ready, _, _ = select.select(
+                [self.fd, self.wake_read], [], [], timeout,
+            )
+            if self.stopping.is_set():
+                return
+            for event in self.read_events() if ready else []:
+                try:
+                    self.handle(*event)
+                except Exception:
+                    # keep going, one failure shouldn't stop everything else
+                    traceback.print_exc()
+                    self.recover(event[0])
+            self.expire_moves(time.monotonic() - MOVE_TIMEOUT)
+
+    def stop(self):
+        self.stopping.set()
+        os.write(self.wake_write, b"\0")
+
+    def join(
+        self,
+        timeout: float | None = None,
+    ):
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+        if self.stopping.is_set() and not self.thread.is_alive():
+            self.close()
+
+    def close(self):
+        # once stopped, so nothing else can be using them
+        if self.fd < 0:
+            return
+        for fd in (self.fd, self.wake_read, self.wake_write):
+            os.close(fd)
+        self.fd = -1
+
+    def is_alive(self) -> bool:
+        return self.thread.is_alive()
@@ -0,0 +1,167 @@
+import os
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+
+def uses_sha256(
+    git_dir: Path,
+) -> bool:
+    try:
+        config = (git_dir / "config").read_text()
+    except OSError:
+        return False
+    return re.search(r"objectformat\s*=\s*sha256", config, re.I) is not None
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    size: int
+    mtime_ns: int
+    inode: int
+    digest: str | None = None
+
+
+class Manifest:
+    FILENAME = "bolthole-manifest"
+    HEADER = b"bolthole-manifest 1\n"
+
+    def __init__(
+        self,
+        path: Path,
+        objects_dir: Path | None = None,
+    ):
+        self.path = path
+        # where copies are stored as blobs as they are made
+        self.objects_dir = objects_dir
+        self.entries: dict[str, ManifestEntry] = {}
+        self.lock = threading.Lock()
+        self.journal: BinaryIO | None = None
+
+    @classmethod
+    def for_repo(
+        cls,
+        repo_path: Path,
+        hash_copies: bool = False,
+    ) -> "Manifest | None":
+        git_dir = repo_path / ".git"
+        if not git_dir.is_dir():
+            return None
+        objects_dir = git_dir / "objects"
+        if (not hash_copies or not objects_dir.is_dir()
+                or uses_sha256(git_dir)):
+            objects_dir = None
+        return cls(git_dir / cls.FILENAME, objects_dir)
+
+    @staticmethod
+    def encode(
+        rel_path: str,
+        entry: ManifestEntry,
+    ) -> bytes:
+        digest = entry.digest or "-"
+        return b"+%d %d %d %s %s\0" % (
+            entry.size,
+            entry.mtime_ns,
+            entry.inode,
+            digest.encode(),
+            os.fsencode(rel_path),
+        )
+
+    def load(self) -> bool:
+        try:
+            data = self.path.read_bytes()
+        except FileNotFoundError:
+            return False
+        if not data.startswith(self.HEADER):
+            return False
+
+        # records are NUL terminated, so anything after the final NUL is
+        # a partial write that never completed
+        records = data[len(self.HEADER):].split(b"\0")[:-1]
+        entries = {}
+        for record in records:
+            if record.startswith(b"-"):
+                entries.pop(os.fsdecode(record[1:]), None)
+                continue
+            size, mtime_ns, inode, digest, path = record[1:].split(b" ", 4)
+            if digest == b"-":
+                digest = None
+            else:
+                digest = digest.decode()
+            entries[os.fsdecode(path)] = ManifestEntry(
+                int(size), int(mtime_ns), int(inode), digest,
+            )
+        self.entries = entries
+        return True
+
+    def save(self):
+        with self.lock:
+            temp = self.path.with_name(self.path.name + ".tmp")
+            with open(temp, "wb") as handle:
+                handle.write(self.HEADER)
+                for rel_path, entry in self.entries.items():
+                    handle.write(self.encode(rel_path, entry))
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(temp, self.path)
+
+            # further changes are appended to the freshly written file
+            if self.journal:
+                self.journal.close()
+            self.journal = open(self.path, "ab")
+
+    def close(self):
+        with self.lock:
+            if self.journal:
+                self.journal.close()
+                self.journal = None
+
+    def append(
+        self,
+        record: bytes,
+    ):
+        if self.journal:
+            self.journal.write(record)
+            self.journal.flush()
+
+    def matches(
+        self,
+        rel_path: str,
+        stat_result: os.stat_result,
+    ) -> bool:
+        entry = self.entries.get(rel_path)
+        if entry is None:
+            return False
+        return (
+            entry.size == stat_result.st_size
+            and entry.mtime_ns == stat_result.st_mtime_ns
+            and entry.inode == stat_result.st_ino
+        )
+
+    def record(
+        self,
+        rel_path: str,
+        stat_result: os.stat_result,
+        digest: str | None = None,
+    ):
+        with self.lock:
+            if digest is None and self.matches(rel_path, stat_result):
+                digest = self.entries[rel_path].digest
+            entry = ManifestEntry(
+                stat_result.st_size,
+                stat_result.st_mtime_ns,
+                stat_result.st_ino,
+                digest,
+            )
+            self.entries[rel_path] = entry
+            self.append(self.encode(rel_path, entry))
+
+    def forget(
+        self,
+        rel_path: str,
+    ):
+        with self.lock:
+            if self.entries.pop(rel_path, None) is not None:
+                self.append(b"-" + os.fsencode(rel_path) + b"\0")
@@ -0,0 +1,266 @@
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+COUNTS = (1, 2, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+# name: (type, help, histogram buckets)
+DEFINITIONS = {
+    "bolthole_events_total": (
+        "counter", "Filesystem events received.", None,
+    ),
+    "bolthole_pending_events": (
+        "gauge", "Events waiting for the next flush.", None,
+    ),
+    "bolthole_flush_events": (
+        "histogram", "Changes left in each flush after collapsing.", COUNTS,
+    ),
+    "bolthole_rescans_total": (
+        "counter", "Directories rescanned after events were lost.", None,
+    ),
+    "bolthole_scrub_bytes_total": (
+        "counter", "Bytes read to check the copy matches the source.", None,
+    ),
+    "bolthole_scrub_differences_total": (
+        "counter", "Files found to differ from their copy.", None,
+    ),
+    "bolthole_scrub_verified_ratio": (
+        "gauge", "Share of files whose copy was verified in the last day.",
+        None,
+    ),
+    "bolthole_grace_pending": (
+        "gauge", "Files waiting out their grace period.", None,
+    ),
+    "bolthole_copied_files_total": (
+        "counter", "Files copied to the destination.", None,
+    ),
+    "bolthole_copied_bytes_total": (
+        "counter", "Bytes copied to the destination.", None,
+    ),
+    "bolthole_git_commands_total": (
+        "counter", "Git commands run.", None,
+    ),
+    "bolthole_git_command_seconds": (
+        "histogram", "Time taken by each git command.", SECONDS,
+    ),
+    "bolthole_commit_seconds": (
+        "histogram", "Time taken to commit a set of changes.", SECONDS,
+    ),
+    "bolthole_event_to_commit_seconds": (
+        "histogram", "Time from a file changing to it being committed.",
+        SECONDS,
+    ),
+    "bolthole_push_seconds": (
+        "histogram", "Time taken by each push.", SECONDS,
+    ),
+    "bolthole_push_failures_total": (
+        "counter", "Pushes that failed.", None,
+    ),
+}
+
+# seconds between rewrites of a textfile collector file
+WRITE_INTERVAL = 15
+
+
+def tree_labels(
+    label: str | None,
+) -> dict[str, str]:
+    # when several trees are watched, what is measured for each is kept
+    # apart by its name
+    if label:
+        return {"tree": label}
+    return {}
+
+
+def format_value(
+    value: float,
+) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(
+    labels: tuple[tuple[str, str], ...],
+) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = (
+            str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n")
+        )
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, labels): value, or [bucket counts, sum, count]
+        self.values: dict[tuple, float | list] = {}
+
+    def inc(
+        self,
+        name: str,
+        amount: float = 1,
+        **labels: str,
+    ):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(
+        self,
+        name: str,
+        value: float,
+        **labels: str,
+    ):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        **labels: str,
+    ):
+        buckets = DEFINITIONS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = [[0] * len(buckets), 0, 0]
+                self.values[key] = histogram
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][index] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+    def render(self) -> str:
+        with self.lock:
+            values = {
+                key: [value[0][:], value[1], value[2]]
+                    if isinstance(value, list) else value
+                    for key, value in self.values.items()
+            }
+        lines = []
+        for name, (kind, description, buckets) in DEFINITIONS.items():
+            series = sorted(key for key in values if key[0] == name)
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key in series:
+                labels = key[1]
+                value = values[key]
+                if kind != "histogram":
+                    lines.append(
+                        f"{name}{format_labels(labels)} {format_value(value)}"
+                    )
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket in zip((*buckets, math.inf), (*counts, 0)):
+                    # values above the last bucket are only in the count
+                    cumulative = count if bound == math.inf else cumulative + bucket
+                    bucket_labels = format_labels(
+                        (*labels, ("le", format_value(bound)))
+                    )
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(
+                    f"{name}_sum{format_labels(labels)} {format_value(total)}"
+                )
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+# everything records into the one set of metrics, which is only
+# exported when asked for
+registry = Metrics()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrapes would otherwise fill the output
+        pass
+
+
+class MetricsServer:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+    ):
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.server.serve_forever,
+            name="metrics",
+            daemon=True,
+        )
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class MetricsFile:
+    def __init__(
+        self,
+        path: Path,
+        interval: float = WRITE_INTERVAL,
+    ):
+        self.path = path
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run,
+            name="metrics",
+            daemon=True,
+        )
+        self.thread.start()
+
+    def write(self):
+        # replaced in one go, so the collector never reads half a file
+        temp = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+        temp.write_text(registry.render())
+        os.replace(temp, self.path)
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.write()
+
+    def close(self):
+        self.stopping.set()
+        self.thread.join()
+        self.write()
@@ -0,0 +1,464 @@
+import hashlib
+import itertools
+import os
+import subprocess
+import zlib
+from pathlib import Path
+
+from bolthole.fastimport import FastImportRepo, exact_chunks, timestamp
+from bolthole.git import GitRepo
+
+
+TREE_MODE = b"40000"
+GITLINK_MODE = b"160000"
+
+# parsed trees kept between commits, enough to hold the directories a
+# busy tree keeps touching without growing forever
+TREE_CACHE_SIZE = 4096
+
+
+def tree_sort_key(
+    item: tuple[bytes, tuple[bytes, str]],
+) -> bytes:
+    # git sorts directories as if their names ended with a slash
+    name, (mode, _) = item
+    if mode == TREE_MODE:
+        return name + b"/"
+    return name
+
+
+def entry_kind(
+    mode: bytes,
+) -> str:
+    if mode == TREE_MODE:
+        return "tree"
+    if mode == GITLINK_MODE:
+        return "commit"
+    return "blob"
+
+
+_temp_names = itertools.count()
+
+
+def temp_object_path(
+    directory: Path,
+) -> Path:
+    return directory / f"tmp_obj_{os.getpid()}_{next(_temp_names)}"
+
+
+def open_object(
+    path: Path,
+) -> int:
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL
+    try:
+        return os.open(path, flags, 0o444)
+    except FileNotFoundError:
+        path.parent.mkdir(exist_ok=True)
+        return os.open(path, flags, 0o444)
+
+
+# streams a blob into a loose object while its contents are being read for
+# something else, so nothing has to read the file a second time
+class BlobWriter:
+    def __init__(
+        self,
+        objects_dir: Path,
+        size: int,
+    ):
+        header = b"blob %d\0" % size
+        self.objects_dir = objects_dir
+        self.size = size
+        self.written = 0
+        self.digest = hashlib.sha1(header)
+        self.compressor = zlib.compressobj(1)
+        self.temp = temp_object_path(objects_dir)
+        self.handle = os.fdopen(open_object(self.temp), "wb")
+        self.handle.write(self.compressor.compress(header))
+
+    def update(
+        self,
+        data: bytes | memoryview,
+    ):
+        self.digest.update(data)
+        self.handle.write(self.compressor.compress(data))
+        self.written += len(data)
+
+    def abort(self):
+        self.handle.close()
+        self.temp.unlink(missing_ok=True)
+
+    def finish(self) -> str | None:
+        # a file that changed size while being read doesn't match the
+        # header written at the start, so it isn't kept
+        if self.written != self.size:
+            self.abort()
+            return None
+        self.handle.write(self.compressor.flush())
+        self.handle.close()
+        sha = self.digest.hexdigest()
+        target = self.objects_dir / sha[:2] / sha[2:]
+        if target.exists():
+            self.temp.unlink()
+        else:
+            target.parent.mkdir(exist_ok=True)
+            os.replace(self.temp, target)
+        return sha
+
+
+# writes blobs, trees and commits straight into the object store as loose
+# objects, only rebuilding the trees of directories that changed
+class ObjectRepo(FastImportRepo):
+    def __init__(
+        self,
+        path,
+        dry_run=False,
+        show_git=False,
+        author=None,
+        message=None,
+        manifest=None,
+        max_files=0,
+        max_bytes=0,
+        summarise_over=0,
+    ):
+        super().__init__(
+            path,
+            dry_run=dry_run,
+            show_git=show_git,
+            author=author,
+            message=message,
+            manifest=manifest,
+            max_files=max_files,
+            max_bytes=max_bytes,
+            summarise_over=summarise_over,
+        )
+        self.objects_dir: Path | None = None
+        self.trees: dict[str, dict[bytes, tuple[bytes, str]]] = {}
+        self.reader: subprocess.Popen | None = None
+
+    def start(self):
+        super().start()
+        self.objects_dir = self.common_dir / "objects"
+
+    def close(self):
+        if self.reader:
+            self.reader.stdin.close()
+            self.reader.wait()
+            self.reader = None
+        super().close()
+
+    def object_path(
+        self,
+        sha: str,
+    ) -> Path:
+        return self.objects_dir / sha[:2] / sha[2:]
+
+    def read_object(
+        self,
+        sha: str,
+    ) -> tuple[str, bytes]:
+        try:
+            raw = zlib.decompress(self.object_path(sha).read_bytes())
+        except FileNotFoundError:
+            return self.read_packed(sha)
+        header, _, data = raw.partition(b"\0")
+        kind, _ = header.split(b" ")
+        return kind.decode(), data
+
+    def read_packed(
+        self,
+        sha: str,
+    ) -> tuple[str, bytes]:
+        # packs are left to git itself, through one long-lived reader
+        if self.reader is None:
+            self.reader = subprocess.Popen(
+                ["git", "-C", str(self.path), "cat-file", "--batch"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+        self.reader.stdin.write(sha.encode() + b"\n")
+        self.reader.stdin.flush()
+        header = self.reader.stdout.readline().split()
+        if len(header) != 3:
+            raise KeyError(sha)
+        _, kind, size = header
+        data = self.reader.stdout.read(int(size) + 1)[:-1]
+        return kind.decode(), data
+
+    def write_object(
+        self,
+        kind: str,
+        data: bytes,
+    ) -> str:
+        raw = b"%s %d\0" % (kind.encode(), len(data)) + data
+        sha = hashlib.new(self.object_format, raw).hexdigest()
+        target = self.object_path(sha)
+        if target.exists():
+            return sha
+        temp = temp_object_path(target.parent)
+        fd = open_object(temp)
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(zlib.compress(raw, 1))
+            os.replace(temp, target)
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+        return sha
+
+    def write_file(
+        self,
+        full: Path,
+    ) -> str:
+        # compressed a chunk at a time rather than read into memory whole
+        try:
+            handle = open(full, "rb")
+        except (FileNotFoundError, NotADirectoryError):
+            return self.write_object("blob", b"")
+        temp = temp_object_path(self.objects_dir)
+        try:
+            with handle, os.fdopen(open_object(temp), "wb") as writer:
+                size = os.fstat(handle.fileno()).st_size
+                header = b"blob %d\0" % size
+                digest = hashlib.new(self.object_format, header)
+                compressor = zlib.compressobj(1)
+                writer.write(compressor.compress(header))
+                for chunk in exact_chunks(handle, size):
+                    digest.update(chunk)
+                    writer.write(compressor.compress(chunk))
+                writer.write(compressor.flush())
+            sha = digest.hexdigest()
+            target = self.object_path(sha)
+            if target.exists():
+                temp.unlink()
+            else:
+                target.parent.mkdir(exist_ok=True)
+                os.replace(temp, target)
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+        return sha
+
+    def read_tree(
+        self,
+        sha: str,
+    ) -> dict[bytes, tuple[bytes, str]]:
+        tree = self.trees.get(sha)
+        if tree is not None:
+            return tree
+        kind, data = self.read_object(sha)
+        if kind != "tree":
+            raise ValueError(f"{sha} is a {kind}, not a tree")
+        size = hashlib.new(self.object_format).digest_size
+        tree = {}
+        offset = 0
+        while offset < len(data):
+            end = data.index(b"\0", offset)
+            mode, name = data[offset:end].split(b" ", 1)
+            tree[name] = (mode, data[end + 1:end + 1 + size].hex())
+            offset = end + 1 + size
+        self.remember_tree(sha, tree)
+        return tree
+
+    def remember_tree(
+        self,
+        sha: str,
+        tree: dict[bytes, tuple[bytes, str]],
+    ):
+        if len(self.trees) >= TREE_CACHE_SIZE:
+            self.trees.clear()
+        self.trees[sha] = tree
+
+    def write_tree(
+        self,
+        tree: dict[bytes, tuple[bytes, str]],
+    ) -> str:
+        data = b"".join(
+            b"%s %s\0%s" % (mode, name, bytes.fromhex(sha))
+                for name, (mode, sha) in sorted(tree.items(), key=tree_sort_key)
+        )
+        sha = self.write_object("tree", data)
+        self.remember_tree(sha, tree)
+        return sha
+
+    def commit_tree(
+        self,
+        commit: str | None,
+    ) -> str | None:
+        if commit is None:
+            return None
+        _, data = self.read_object(commit)
+        # the tree is always the first header line
+        return data[5:data.index(b"\n")].decode()
+
+    def lookup(
+        self,
+        tree: str | None,
+        path: str,
+    ) -> tuple[bytes, str] | None:
+        entry = None
+        for name in os.fsencode(path).split(b"/"):
+            if tree is None:
+                return None
+            entry = self.read_tree(tree).get(name)
+            if entry is None:
+                return None
+            if entry[0] == TREE_MODE:
+                tree = entry[1]
+            else:
+                tree = None
+        return entry
+
+    def ls(
+        self,
+        parent: str | None,
+        paths: list[str],
+    ) -> dict[str, tuple[str, str, str]]:
+        root = self.commit_tree(parent)
+        entries = {}
+        for path in paths:
+            entry = self.lookup(root, path)
+            if entry:
+                mode, sha = entry
+                entries[path] = (mode.decode(), entry_kind(mode), sha)
+        return entries
+
+    def tracked_under(
+        self,
+        parent: str,
+        directories: list[str],
+    ) -> list[str]:
+        root = self.commit_tree(parent)
+        found = []
+        pending = []
+        for directory in directories:
+            entry = self.lookup(root, directory)
+            if entry and entry[0] == TREE_MODE:
+                pending.append((os.fsencode(directory), entry[1]))
+        while pending:
+            prefix, sha = pending.pop()
+            for name, (mode, child) in self.read_tree(sha).items():
+                path = prefix + b"/" + name
+                if mode == TREE_MODE:
+                    pending.append((path, child))
+                elif mode != GITLINK_MODE:
+                    found.append(os.fsdecode(path))
+        return sorted(found)
+
+    def update_tree(
+        self,
+        tree: str | None,
+        changes: dict[bytes, tuple[bytes, str] | None],
+    ) -> str | None:
+        if tree is None:
+            entries = {}
+        else:
+            entries = dict(self.read_tree(tree))
+
+        nested: dict[bytes, dict[bytes, tuple[bytes, str] | None]] = {}
+        for path, entry in changes.items():
+            name, slash, rest = path.partition(b"/")
+            if slash:
+                nested.setdefault(name, {})[rest] = entry
+            elif entry is None:
+                entries.pop(name, None)
+            else:
+                entries[name] = entry
+
+        # only the directories something changed in are read and written
+        for name, subchanges in nested.items():
+            current = entries.get(name)
+            if current and current[0] == TREE_MODE:
+                subtree = current[1]
+            else:
+                subtree = None
+            subtree = self.update_tree(subtree, subchanges)
+            if subtree is not None:
+                entries[name] = (TREE_MODE, subtree)
+            elif current and current[0] == TREE_MODE:
+                # everything in it went; anything else under the name was
+                # never a directory, so deletes beneath it change nothing
+                entries.pop(name)
+
+        # git has no empty directories
+        if not entries:
+            return None
+        return self.write_tree(entries)
+
+    def write_commit(
+        self,
+        ref: str,
+        parent: str | None,
+        deletes: list[str],
+        writes: list[tuple[str, str, bytes | Path | None, str]],
+        message: str,
+    ):
+        changes = {}
+        for path in deletes:
+            changes[os.fsencode(path)] = None
+        for path, mode, data, sha in writes:
+            if isinstance(data, Path):
+                sha = self.write_file(data)
+            elif data is not None:
+                sha = self.write_object("blob", data)
+            changes[os.fsencode(path)] = (mode.encode(), sha)
+        tree = self.update_tree(self.commit_tree(parent), changes)
+        if tree is None:
+            tree = self.write_tree({})
+
+        if not message.endswith("\n"):
+            message += "\n"
+        when = timestamp()
+        lines = [f"tree {tree}"]
+        if parent:
+            lines.append(f"parent {parent}")
+        lines.append(f"author {self.author_ident} {when}")
+        lines.append(f"committer {self.committer_ident} {when}")
+        lines.append("")
+        lines.append(message)
+        commit = self.write_object("commit", "\n".join(lines).encode())
+
+        self.update_ref(ref, parent, commit, message.split("\n", 1)[0])
+
+    def update_ref(
+        self,
+        ref: str,
+        old: str | None,
+        new: str,
+        subject: str,
+    ):
+        target = self.common_dir / ref
+        target.parent.mkdir(parents=True, exist_ok=True)
+        lock = target.with_name(target.name + ".lock")
+
+        # the same lock file git takes, so nobody else can move the ref
+        # between checking where it points and replacing it
+        fd = os.open(lock, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            with os.fdopen(fd, "w") as handle:
+                if self.resolve(ref) != old:
+                    raise RuntimeError(f"{ref} moved while committing")
+                handle.write(new + "\n")
+            os.replace(lock, target)
+        except BaseException:
+            lock.unlink(missing_ok=True)
+            raise
+
+        zero = "0" * len(new)
+        entry = (
+            f"{old or zero} {new} {self.committer_ident} {timestamp()}"
+            f"\tcommit: {subject}\n"
+        )
+        for log in (self.common_dir / "logs" / ref, self.git_dir / "logs/HEAD"):
+            log.parent.mkdir(parents=True, exist_ok=True)
+            with open(log, "a") as handle:
+                handle.write(entry)
+
+    def commit_batch(self, events):
+        if not events or self.dry_run:
+            return super().commit_batch(events)
+        if self.git_dir is None:
+            self.start()
+        if (self.common_dir / "reftable").is_dir():
+            # refs aren't plain files to lock and replace
+            return GitRepo.commit_batch(self, events)
+        return super().commit_batch(events)
@@ -0,0 +1,210 @@
+import queue
+import threading
+import traceback
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Executor
+from typing import Any
+
+
+# batches allowed to wait between two stages; when a stage falls behind,
+# the one feeding it blocks, or with a pool sets its result aside and
+# stops, rather than letting work pile up
+QUEUE_SIZE = 4
+
+_STOP = object()
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        work: Callable[[Any], Any],
+        output: "Stage | None" = None,
+        size: int = QUEUE_SIZE,
+        pool: Executor | None = None,
+    ):
+        # whatever work returns, other than None, is passed to output;
+        # with a pool, the work is done by its workers rather than a
+        # thread of the stage's own, still one item at a time in order
+        self.name = name
+        self.work = work
+        self.output = output
+        self.pool = pool
+        self.queue: queue.Queue = queue.Queue(size)
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        self.running = False
+        self.thread: threading.Thread | None = None
+        # called once there is room, for those whose offer was turned down
+        self.waiting: list[Callable[[], None]] = []
+        # with a pool, a result output had no room for; the stage stops
+        # until it is handed on, so a worker is never left waiting
+        self.held: Any = None
+        self.parked = False
+        self.woken = False
+
+    def start(self):
+        # called with the lock held
+        if self.pool:
+            if not self.running:
+                self.running = True
+                self.pool.submit(self.run_next)
+        elif self.thread is None:
+            self.thread = threading.Thread(target=self.run, name=self.name)
+            self.thread.start()
+
+    def put(
+        self,
+        item: Any,
+    ):
+        if self.pool:
+            # taken together with starting, or a worker finishing in
+            # between could see the item, go idle, and leave a run_next
+            # with nothing to take
+            while True:
+                with self.lock:
+                    try:
+                        self.queue.put_nowait(item)
+                    except queue.Full:
+                        pass
+                    else:
+                        self.start()
+                        return
+                    self.not_full.wait()
+        with self.lock:
+            self.start()
+        self.queue.put(item)
+
+    def offer(
+        self,
+        item: Any,
+        waiter: Callable[[], None],
+    ) -> bool:
+        # like put, but rather than block when full, returns False and
+        # calls waiter once an item has been taken
+        with self.lock:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self.waiting.append(waiter)
+                return False
+            self.start()
+        return True
+
+    def taken(self):
+        with self.lock:
+            waiting, self.waiting = self.waiting, []
+            self.not_full.notify_all()
+        for waiter in waiting:
+            waiter()
+
+    def process(
+        self,
+        item: Any,
+    ):
+        try:
+            result = self.work(item)
+        except Exception:
+            # keep going, one failure shouldn't stop everything else
+            traceback.print_exc()
+            return
+        if result is None or not self.output:
+            return
+        if not self.pool:
+            self.output.put(result)
+        elif not self.output.offer(result, self.resume):
+            self.held = result
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            self.taken()
+            if item is _STOP:
+                return
+            self.process(item)
+
+    def run_next(self):
+        # the worker is handed back after each item, so stages sharing
+        # the pool take turns rather than one keeping it busy
+        if self.held is None:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                # nothing was left after all, so this goes idle below
+                pass
+            else:
+                self.taken()
+                self.process(item)
+        elif self.output.offer(self.held, self.resume):
+            self.held = None
+        with self.lock:
+            if self.held is not None:
+                if self.woken:
+                    # room was made while this was finishing
+                    self.woken = False
+                    self.pool.submit(self.run_next)
+                else:
+                    self.parked = True
+            elif self.queue.empty():
+                self.running = False
+                self.idle.notify_all()
+            else:
+                self.pool.submit(self.run_next)
+
+    def resume(self):
+        # output has taken an item, so may have room for the one held
+        with self.lock:
+            if self.parked:
+                self.parked = False
+                self.pool.submit(self.run_next)
+            else:
+                self.woken = True
+
+    def close(self):
+        # everything already queued is worked through first
+        with self.lock:
+            thread = self.thread
+            while self.running:
+                self.idle.wait()
+        if thread:
+            self.queue.put(_STOP)
+            thread.join()
+
+
+class Feeder:
+    # hands items to a stage for callers that mustn't block, such as the
+    # timer thread every tree shares; what the stage has no room for waits
+    # here, in order, until it has
+    def __init__(
+        self,
+        stage: Stage,
+    ):
+        self.stage = stage
+        self.held: deque = deque()
+        self.lock = threading.Lock()
+        self.drained = threading.Condition(self.lock)
+
+    def put(
+        self,
+        item: Any,
+    ):
+        with self.lock:
+            self.held.append(item)
+        self.drain()
+
+    def drain(self):
+        with self.lock:
+            while self.held:
+                if not self.stage.offer(self.held[0], self.drain):
+                    return
+                self.held.popleft()
+            self.drained.notify_all()
+
+    def close(self):
+        # anything still waiting is handed over first, as the stage makes
+        # room for it
+        with self.lock:
+            while self.held:
+                self.drained.wait()
@@ -0,0 +1,308 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from watchdog.events import (
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+    FileSystemEvent,
+)
+
+from bolthole.profile import profiler
+
+
+# seconds between looking at a directory that has just changed; each
+# look that finds nothing doubles it, up to the maximum
+POLL_INTERVAL = 1
+POLL_MAX_INTERVAL = 30
+
+# a directory changed this recently might change again without its
+# modification time moving on, so is listed again next time regardless
+RACY_WINDOW_NS = 2_000_000_000
+
+
+def join_path(
+    directory: str,
+    name: str,
+) -> str:
+    if directory:
+        return f"{directory}/{name}"
+    return name
+
+
+@dataclass
+class Directory:
+    # modification time when last listed, None to list it again
+    mtime_ns: int | None = None
+    # name: (size, mtime_ns, inode)
+    files: dict[str, tuple[int, int, int]] = field(default_factory=dict)
+    subdirs: set[str] = field(default_factory=set)
+    interval: float = POLL_INTERVAL
+
+
+class PolledTree:
+    def __init__(
+        self,
+        handler,
+        root: Path,
+    ):
+        self.handler = handler
+        self.root = root
+        self.ignore = handler.ignore
+        self.directories: dict[str, Directory] = {}
+
+    def absolute(
+        self,
+        rel: str,
+    ) -> str:
+        return os.path.join(self.root, rel) if rel else str(self.root)
+
+    def dispatch(
+        self,
+        event: FileSystemEvent,
+    ):
+        # as if watchdog had seen it, so the handler keeps track of
+        # which files exist just as it would
+        self.handler.dispatch(event)
+
+    def list_directory(
+        self,
+        rel_dir: str,
+    ) -> tuple[int | None, dict[str, tuple[int, int, int]], set[str]]:
+        # the same pruning as walk_files, so ignored directories are
+        # never looked inside
+        path = self.root / rel_dir
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            with os.scandir(path) as scanner:
+                entries = list(scanner)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            return None, {}, set()
+        if time.time_ns() - mtime_ns < RACY_WINDOW_NS:
+            mtime_ns = None
+        files = {}
+        subdirs = set()
+        for entry in entries:
+            rel = join_path(rel_dir, entry.name)
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not self.ignore.directory_ignored(rel):
+                        subdirs.add(entry.name)
+                elif entry.is_file() and not self.ignore(rel):
+                    stat = entry.stat()
+                    files[entry.name] = (
+                        stat.st_size, stat.st_mtime_ns, stat.st_ino,
+                    )
+            except FileNotFoundError:
+                continue
+        return mtime_ns, files, subdirs
+
+    def add_directory(
+        self,
+        rel_dir: str,
+        report: bool,
+    ) -> list[str]:
+        # returns every directory added, which need scheduling
+        mtime_ns, files, subdirs = self.list_directory(rel_dir)
+        self.directories[rel_dir] = Directory(mtime_ns, files, subdirs)
+        if report:
+            for name in sorted(files):
+                self.dispatch(FileCreatedEvent(
+                    self.absolute(join_path(rel_dir, name)),
+                ))
+        added = [rel_dir]
+        for name in sorted(subdirs):
+            added.extend(self.add_directory(join_path(rel_dir, name), report))
+        return added
+
+    def remove_directory(
+        self,
+        rel_dir: str,
+    ):
+        directory = self.directories.pop(rel_dir, None)
+        if directory is None:
+            return
+        for name in sorted(directory.files):
+            self.dispatch(FileDeletedEvent(
+                self.absolute(join_path(rel_dir, name)),
+            ))
+        for name in sorted(directory.subdirs):
+            self.remove_directory(join_path(rel_dir, name))
+
+    def check_files(
+        self,
+        rel_dir: str,
+        directory: Directory,
+    ) -> bool:
+        # the directory is unchanged, so the same files are still there
+        # and only their contents can have changed
+        changed = False
+        for name, known in directory.files.items():
+            try:
+                stat = os.stat(self.root / rel_dir / name)
+            except FileNotFoundError:
+                continue
+            current = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+            if current != known:
+                directory.files[name] = current
+                self.dispatch(FileModifiedEvent(
+                    self.absolute(join_path(rel_dir, name)),
+                ))
+                changed = True
+        return changed
+
+    def scan(
+        self,
+        rel_dir: str,
+    ) -> tuple[bool, list[str]]:
+        # returns whether anything changed, and any directories added
+        directory = self.directories.get(rel_dir)
+        if directory is None:
+            return False, []
+        try:
+            mtime_ns = os.stat(self.root / rel_dir).st_mtime_ns
+        except FileNotFoundError:
+            # noticed when its parent is listed
+            return False, []
+        if directory.mtime_ns is not None and mtime_ns == directory.mtime_ns:
+            return self.check_files(rel_dir, directory), []
+
+        mtime_ns, files, subdirs = self.list_directory(rel_dir)
+        old_files = directory.files
+        directory.mtime_ns = mtime_ns
+        directory.files = files
+        changed = False
+
+        gone = {
+            known[2]: name
+                for name, known in old_files.items()
+                if name not in files
+        }
+        for name in sorted(files):
+            current = files[name]
+            known = old_files.get(name)
+            path = join_path(rel_dir, name)
+            if known is None:
+                origin = gone.pop(current[2], None)
+                if origin is not None:
+                    self.dispatch(FileMovedEvent(
+                        self.absolute(join_path(rel_dir, origin)),
+                        self.absolute(path),
+                    ))
+                else:
+                    self.dispatch(FileCreatedEvent(self.absolute(path)))
+                changed = True
+            elif current != known:
+                self.dispatch(FileModifiedEvent(self.absolute(path)))
+                changed = True
+        for name in sorted(gone.values()):
+            self.dispatch(FileDeletedEvent(
+                self.absolute(join_path(rel_dir, name)),
+            ))
+            changed = True
+
+        added = []
+        for name in sorted(directory.subdirs - subdirs):
+            self.remove_directory(join_path(rel_dir, name))
+            changed = True
+        for name in sorted(subdirs - directory.subdirs):
+            added.extend(self.add_directory(join_path(rel_dir, name), True))
+            changed = True
+        directory.subdirs = subdirs
+        return changed, added
+
+
+class PollingObserver:
+    # stands in for watchdog's observer where filesystem events are not
+    # delivered, such as on network filesystems; directories that change
+    # are looked at often, and those that don't less and less
+    def __init__(
+        self,
+        interval: float = POLL_INTERVAL,
+        max_interval: float = POLL_MAX_INTERVAL,
+    ):
+        self.interval = interval
+        self.max_interval = max_interval
+        self.trees: list[PolledTree] = []
+        self.heap: list[tuple[float, int, PolledTree, str]] = []
+        self.counter = itertools.count()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="poll")
+
+    def schedule(
+        self,
+        handler,
+        path: str,
+        recursive: bool = True,
+    ):
+        self.trees.append(PolledTree(handler, Path(path)))
+
+    def queue_scan(
+        self,
+        tree: PolledTree,
+        rel_dir: str,
+        delay: float,
+    ):
+        due = time.monotonic() + delay
+        heapq.heappush(self.heap, (due, next(self.counter), tree, rel_dir))
+
+    def start(self):
+        # what is there now is the starting point, not a change
+        for tree in self.trees:
+            for rel_dir in tree.add_directory("", False):
+                self.queue_scan(tree, rel_dir, self.interval)
+        self.thread.start()
+
+    def poll_next(self):
+        due, _, tree, rel_dir = heapq.heappop(self.heap)
+        directory = tree.directories.get(rel_dir)
+        if directory is None:
+            return
+        try:
+            with profiler.span("poll"):
+                changed, added = tree.scan(rel_dir)
+        except Exception:
+            traceback.print_exc()
+            # what the scan had got through is lost, so the handler looks
+            # for anything changed since the one before
+            since_ns = time.time_ns() - int(directory.interval * 1e9)
+            tree.handler.request_rescan(rel_dir, since_ns)
+            changed, added = True, []
+        if changed:
+            directory.interval = self.interval
+        else:
+            directory.interval = min(directory.interval * 2, self.max_interval)
+        self.queue_scan(tree, rel_dir, directory.interval)
+        for new_dir in added:
+            self.queue_scan(tree, new_dir, self.interval)
+
+    def run(self):
+        while self.heap:
+            wait = self.heap[0][0] - time.monotonic()
+            if self.stopping.wait(max(0, wait)):
+                return
+            try:
+                self.poll_next()
+            except Exception:
+                # keep going, one failure shouldn't stop everything else
+                traceback.print_exc()
+
+    def stop(self):
+        self.stopping.set()
+
+    def join(
+        self,
+        timeout: float | None = None,
+    ):
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def is_alive(self) -> bool:
+        return self.thread.is_alive()
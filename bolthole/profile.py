@@ -0,0 +1,155 @@
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+
+PERCENTILES = (50, 90, 99)
+
+NO_SPAN = nullcontext()
+
+
+def format_duration(
+    seconds: float,
+) -> str:
+    if seconds < 1:
+        return f"{seconds * 1000:.1f}ms"
+    return f"{seconds:.2f}s"
+
+
+def percentile(
+    durations: list[float],
+    percent: float,
+) -> float:
+    # nearest rank, from durations already sorted
+    rank = max(0, -(-len(durations) * percent // 100) - 1)
+    return durations[int(rank)]
+
+
+class Span:
+    def __init__(
+        self,
+        profiler: "Profiler",
+        name: str,
+        attributes: dict,
+    ):
+        self.profiler = profiler
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(
+            self.name, self.start, time.monotonic(), **self.attributes,
+        )
+
+
+class Profiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.file = None
+        self.durations: dict[str, list[float]] = {}
+        # each flush is a batch, so its spans from debouncing through to
+        # committing can be joined up again
+        self.batches = itertools.count(1)
+        self.current = threading.local()
+
+    def start(
+        self,
+        path: Path,
+    ):
+        # line buffered, so the spans can be followed as they happen
+        self.file = open(path, "w", buffering=1)
+        self.durations = {}
+
+    def new_batch(self) -> int:
+        with self.lock:
+            return next(self.batches)
+
+    @contextmanager
+    def batch(
+        self,
+        batch: int,
+    ):
+        # spans recorded by this thread within carry the batch
+        previous = getattr(self.current, "batch", None)
+        self.current.batch = batch
+        try:
+            yield
+        finally:
+            self.current.batch = previous
+
+    def span(
+        self,
+        name: str,
+        **attributes,
+    ):
+        if self.file is None:
+            return NO_SPAN
+        return Span(self, name, attributes)
+
+    def record(
+        self,
+        name: str,
+        start: float,
+        end: float,
+        **attributes,
+    ):
+        # start and end are from time.monotonic(), for a wait that has
+        # already happened as much as for work just finished
+        if self.file is None:
+            return
+        duration = end - start
+        batch = getattr(self.current, "batch", None)
+        if batch is not None:
+            attributes.setdefault("batch", batch)
+        line = json.dumps({
+            "span": name,
+            "start": round(time.time() - (time.monotonic() - start), 6),
+            "duration": round(duration, 6),
+            "thread": threading.current_thread().name,
+            **attributes,
+        })
+        with self.lock:
+            if self.file is None:
+                return
+            self.durations.setdefault(name, []).append(duration)
+            self.file.write(line + "\n")
+
+    def summary(self) -> list[str]:
+        with self.lock:
+            durations = {
+                name: sorted(values)
+                    for name, values in self.durations.items()
+            }
+        if not durations:
+            return []
+        width = max(len(name) for name in durations)
+        columns = [f"p{percent}" for percent in PERCENTILES] + ["max"]
+        lines = [
+            f"{'span':<{width}} {'count':>7} "
+            + " ".join(f"{column:>9}" for column in columns)
+        ]
+        for name, values in sorted(durations.items()):
+            figures = [percentile(values, percent) for percent in PERCENTILES]
+            figures.append(values[-1])
+            lines.append(
+                f"{name:<{width}} {len(values):>7} "
+                + " ".join(f"{format_duration(f):>9}" for f in figures)
+            )
+        return lines
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+            self.file = None
+
+
+# spans are only recorded once started with somewhere to write them
+profiler = Profiler()
@@ -0,0 +1,122 @@
+import threading
+import traceback
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+from bolthole.git import GitRepo, output, output_label
+from bolthole.scheduler import Scheduler
+
+
+# seconds to wait before retrying a failed push, doubling each time
+RETRY_DELAY = 1
+RETRY_LIMIT = 300
+
+
+class PushQueue:
+    def __init__(
+        self,
+        repo: GitRepo,
+        remotes: list[str],
+        retry_delay: float = RETRY_DELAY,
+        retry_limit: float = RETRY_LIMIT,
+        scheduler: Scheduler | None = None,
+        pool: Executor | None = None,
+        label: str | None = None,
+    ):
+        # with a scheduler and pool shared with other trees, retries are
+        # timed by one thread for them all, and the pool's size limits how
+        # many push at once; otherwise the queue has its own
+        self.repo = repo
+        self.remotes = remotes
+        self.retry_delay = retry_delay
+        self.retry_limit = retry_limit
+        self.own_scheduler = scheduler is None
+        self.timers = (scheduler or Scheduler(name="push")).timers(self.retry)
+        self.own_pool = pool is None
+        self.pool = pool or ThreadPoolExecutor(
+            max(len(remotes), 1),
+            thread_name_prefix="push",
+        )
+        self.label = label
+        # remotes with commits they haven't been sent
+        self.pending: set[str] = set()
+        self.pushing: set[str] = set()
+        self.failures: dict[str, int] = {}
+        self.condition = threading.Condition()
+        self.closing = False
+
+    def request(self):
+        if not self.remotes:
+            return
+        if self.repo.dry_run:
+            # nothing is really pushed, so keep the output in order
+            self.repo.push(self.remotes)
+            return
+        with self.condition:
+            # a remote already waiting to push will send the newest
+            # commit anyway, so asking again doesn't add another push
+            self.pending.update(self.remotes)
+            for remote in self.remotes:
+                if remote not in self.pushing and remote not in self.timers:
+                    self.start(remote)
+
+    def start(
+        self,
+        remote: str,
+    ):
+        # called with the condition held
+        self.pending.discard(remote)
+        self.pushing.add(remote)
+        self.pool.submit(self.push, remote)
+
+    def push(
+        self,
+        remote: str,
+    ):
+        with output_label(self.label):
+            try:
+                pushed = self.repo.push_remote(remote)
+            except Exception:
+                traceback.print_exc()
+                pushed = False
+            if not pushed:
+                output(f"!! push to {remote} failed")
+        with self.condition:
+            self.pushing.discard(remote)
+            if pushed:
+                self.failures[remote] = 0
+            if self.closing or pushed:
+                # once closing, anything committed since gets one last
+                # attempt, while a failure isn't retried
+                if remote in self.pending:
+                    self.start(remote)
+            else:
+                failures = self.failures.get(remote, 0)
+                delay = min(self.retry_delay * 2 ** failures, self.retry_limit)
+                self.failures[remote] = failures + 1
+                self.timers.schedule(remote, delay)
+            self.condition.notify_all()
+
+    def retry(
+        self,
+        remote: str,
+    ):
+        with self.condition:
+            if not self.closing and remote not in self.pushing:
+                self.start(remote)
+
+    def close(self):
+        # anything committed but not yet pushed gets one last attempt,
+        # while remotes that are only waiting to retry are given up on
+        with self.condition:
+            self.closing = True
+            for remote in self.remotes:
+                self.timers.cancel(remote)
+                if remote in self.pending and remote not in self.pushing:
+                    self.start(remote)
+            while self.pushing:
+                self.condition.wait()
+        self.timers.close()
+        if self.own_scheduler:
+            self.timers.scheduler.close()
+        if self.own_pool:
+            self.pool.shutdown()
@@ -0,0 +1,199 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from collections.abc import Callable, Hashable
+
+
+def run_timer(
+    item: tuple["Timers", Hashable],
+):
+    timers, key = item
+    timers.callback(key)
+
+
+class Scheduler:
+    def __init__(
+        self,
+        callback: Callable[[Hashable], None] = run_timer,
+        name: str = "scheduler",
+    ):
+        # without a callback of its own, the scheduler is shared through
+        # timers, and each key goes back to the one that scheduled it
+        self.callback = callback
+        self.name = name
+        self.heap: list[tuple[float, int, Hashable]] = []
+        self.deadlines: dict[Hashable, float] = {}
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.closing = False
+        self.thread: threading.Thread | None = None
+        # the key whose callback is under way
+        self.running: Hashable | None = None
+
+    def __contains__(
+        self,
+        key: Hashable,
+    ) -> bool:
+        with self.condition:
+            return key in self.deadlines
+
+    def __len__(self) -> int:
+        with self.condition:
+            return len(self.deadlines)
+
+    def schedule(
+        self,
+        key: Hashable,
+        delay: float,
+    ):
+        deadline = time.monotonic() + delay
+        with self.condition:
+            # rescheduling leaves the earlier heap entry behind, it is
+            # skipped when it reaches the top
+            self.deadlines[key] = deadline
+            heapq.heappush(self.heap, (deadline, next(self.counter), key))
+            if len(self.heap) > 2 * len(self.deadlines) + 64:
+                self.compact()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name=self.name)
+                self.thread.start()
+            # anyone draining waits on the same condition
+            self.condition.notify_all()
+
+    def deadline(
+        self,
+        key: Hashable,
+    ) -> float | None:
+        with self.condition:
+            return self.deadlines.get(key)
+
+    def cancel(
+        self,
+        key: Hashable,
+    ):
+        with self.condition:
+            self.deadlines.pop(key, None)
+            self.condition.notify_all()
+
+    def compact(self):
+        self.heap = [
+            entry
+                for entry in self.heap
+                if self.deadlines.get(entry[2]) == entry[0]
+        ]
+        heapq.heapify(self.heap)
+
+    def next_due(self) -> Hashable | None:
+        # called with the condition held; returns None once closed and
+        # there is nothing left to wait for
+        while True:
+            if not self.heap:
+                if self.closing:
+                    return None
+                self.condition.wait()
+                continue
+            deadline, _, key = self.heap[0]
+            if self.deadlines.get(key) != deadline:
+                heapq.heappop(self.heap)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                self.condition.wait(remaining)
+                continue
+            heapq.heappop(self.heap)
+            del self.deadlines[key]
+            return key
+
+    def run(self):
+        while True:
+            with self.condition:
+                key = self.next_due()
+                self.running = key
+            if key is None:
+                return
+            try:
+                self.callback(key)
+            except Exception:
+                # keep going, one failure shouldn't stop everything else
+                traceback.print_exc()
+            with self.condition:
+                self.running = None
+                self.condition.notify_all()
+
+    def timers(
+        self,
+        callback: Callable[[Hashable], None],
+    ) -> "Timers":
+        return Timers(self, callback)
+
+    def owns_any(
+        self,
+        owner: "Timers",
+    ) -> bool:
+        # called with the condition held
+        keys = list(self.deadlines)
+        if self.running is not None:
+            keys.append(self.running)
+        return any(key[0] is owner for key in keys)
+
+    def drain(
+        self,
+        owner: "Timers",
+    ):
+        with self.condition:
+            while self.owns_any(owner):
+                self.condition.wait()
+
+    def close(self):
+        # anything still scheduled runs when it falls due, as the
+        # thread only finishes once nothing is left
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+            thread = self.thread
+        if thread:
+            thread.join()
+
+
+class Timers:
+    # one user's share of a scheduler that several use, so one thread can
+    # keep time for every tree; keys are kept apart from everyone else's
+    def __init__(
+        self,
+        scheduler: Scheduler,
+        callback: Callable[[Hashable], None],
+    ):
+        self.scheduler = scheduler
+        self.callback = callback
+
+    def __contains__(
+        self,
+        key: Hashable,
+    ) -> bool:
+        return (self, key) in self.scheduler
+
+    def schedule(
+        self,
+        key: Hashable,
+        delay: float,
+    ):
+        self.scheduler.schedule((self, key), delay)
+
+    def deadline(
+        self,
+        key: Hashable,
+    ) -> float | None:
+        return self.scheduler.deadline((self, key))
+
+    def cancel(
+        self,
+        key: Hashable,
+    ):
+        self.scheduler.cancel((self, key))
+
+    def close(self):
+        # as with the scheduler's own close, anything still scheduled
+        # runs when it falls due, but others' keys aren't waited for
+        self.scheduler.drain(self)
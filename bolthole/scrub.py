@@ -0,0 +1,397 @@
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from bolthole.debounce import Event
+from bolthole.git import hash_blob, output, output_label
+from bolthole.metrics import registry, tree_labels
+from bolthole.profile import profiler
+from bolthole.walk import walk_files
+
+
+# seconds to rest between passes over the tree
+SCRUB_REST = 900
+# a file is read again once it was last read this many seconds ago, so
+# damage that leaves its size and time alone is still found; the health
+# report counts what was verified within it as recent
+SCRUB_WINDOW = 24 * 60 * 60
+# files changed this recently may not have been seen to change yet; once
+# seen, they are left alone until committed
+SETTLE_NS = 5_000_000_000
+
+
+def join_path(
+    directory: str,
+    name: str,
+) -> str:
+    if directory:
+        return f"{directory}/{name}"
+    return name
+
+
+class Budget:
+    # bytes that may be read, topped up at rate a second and never more
+    # than a second's worth, so reading is spread out evenly
+    def __init__(
+        self,
+        rate: int,
+        stopping: threading.Event,
+    ):
+        self.rate = rate
+        self.stopping = stopping
+        self.available = float(rate)
+        self.last = time.monotonic()
+
+    def spend(
+        self,
+        size: int,
+    ) -> bool:
+        # returns False if stopped while waiting
+        now = time.monotonic()
+        self.available = min(
+            self.rate,
+            self.available + (now - self.last) * self.rate,
+        )
+        self.last = now
+        self.available -= size
+        if self.available < 0:
+            return not self.stopping.wait(-self.available / self.rate)
+        return True
+
+
+@dataclass
+class Listing:
+    # a directory as it is now on both sides, from listing and stat alone;
+    # each side's stat hash covers the names, sizes, times and inodes of
+    # everything beneath it, so any change to the subtree changes it
+    rel_dir: str
+    source_files: dict[str, os.stat_result]
+    dest_files: dict[str, os.stat_result]
+    # directories only in the copy
+    extra: list[str]
+    children: dict[str, "Listing"] = field(default_factory=dict)
+    source_stat: str = ""
+    dest_stat: str = ""
+
+
+@dataclass
+class Node:
+    # a directory in the Merkle tree as last verified; each side's content
+    # hash covers the names and contents of everything beneath it
+    source_stat: str
+    dest_stat: str
+    source_hash: str
+    dest_hash: str
+    files: int
+    verified: int
+    # when the least recently read file beneath it was read, or None
+    # unless everything beneath it matched its copy
+    read: float | None
+
+
+def stat_line(
+    name: str,
+    st: os.stat_result,
+) -> str:
+    # the change time moves with any write, even one that puts the size
+    # and modification time back
+    return f"{name} {st.st_size} {st.st_mtime_ns} {st.st_ctime_ns} {st.st_ino}\n"
+
+
+class Stopped(Exception):
+    pass
+
+
+class Scrubber:
+    # checks in the background that the copy still matches the source,
+    # reading both a little at a time, and queues a change for anything
+    # that doesn't as if the source had just changed. Each pass lists the
+    # whole tree, but only reads within subtrees that have changed since
+    # they were last verified, or were last verified too long ago
+    def __init__(
+        self,
+        handler,
+        rate: int,
+    ):
+        self.handler = handler
+        self.source = handler.base_path
+        self.dest = handler.dest_path
+        self.ignore = handler.ignore
+        self.labels = tree_labels(handler.label)
+        self.stopping = threading.Event()
+        self.budget = Budget(rate, self.stopping)
+        # (side, path): ((size, mtime_ns, ctime_ns, inode), digest, when
+        # read), for this pass and the one before
+        self.digests: dict[tuple[str, str], tuple[tuple, str, float]] = {}
+        self.previous: dict[tuple[str, str], tuple[tuple, str, float]] = {}
+        # directory: its node, for this pass and the one before
+        self.nodes: dict[str, Node] = {}
+        self.previous_nodes: dict[str, Node] = {}
+        self.differences = 0
+        self.thread = threading.Thread(target=self.run, name="scrub")
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def run(self):
+        with output_label(self.handler.label):
+            while not self.stopping.is_set():
+                try:
+                    with profiler.span("scrub"):
+                        root = self.scrub()
+                except Stopped:
+                    return
+                self.report(root)
+                self.stopping.wait(SCRUB_REST)
+
+    def scrub(self) -> Node:
+        # anything not seen again this pass has gone
+        self.previous, self.digests = self.digests, {}
+        self.previous_nodes, self.nodes = self.nodes, {}
+        self.differences = 0
+        return self.verify(self.list_tree(""))
+
+    def report(
+        self,
+        root: Node,
+    ):
+        ratio = root.verified / root.files if root.files else 1
+        registry.set("bolthole_scrub_verified_ratio", ratio, **self.labels)
+        if root.source_hash == root.dest_hash and not self.differences:
+            outcome = "copy matches"
+        else:
+            outcome = f"{self.differences:,} to correct"
+        output(
+            f"   Scrubbed {root.files:,} files, {ratio:.1%} verified in "
+            f"the last day, {outcome}"
+        )
+
+    def list_directory(
+        self,
+        root: Path,
+        rel_dir: str,
+    ) -> tuple[dict[str, os.stat_result], set[str]]:
+        files = {}
+        subdirs = set()
+        try:
+            with os.scandir(root / rel_dir) as scanner:
+                entries = list(scanner)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            return files, subdirs
+        for entry in entries:
+            rel = join_path(rel_dir, entry.name)
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not self.ignore.directory_ignored(rel):
+                        subdirs.add(entry.name)
+                elif entry.is_file() and not self.ignore(rel):
+                    files[entry.name] = entry.stat()
+            except FileNotFoundError:
+                continue
+        return files, subdirs
+
+    def list_tree(
+        self,
+        rel_dir: str,
+    ) -> Listing:
+        if self.stopping.is_set():
+            raise Stopped
+        source_files, source_dirs = self.list_directory(self.source, rel_dir)
+        dest_files, dest_dirs = self.list_directory(self.dest, rel_dir)
+        listing = Listing(
+            rel_dir, source_files, dest_files, sorted(dest_dirs - source_dirs),
+        )
+        source_hash = hashlib.sha1()
+        dest_hash = hashlib.sha1()
+        for name in sorted(source_dirs):
+            child = self.list_tree(join_path(rel_dir, name))
+            listing.children[name] = child
+            source_hash.update(f"{name}/ {child.source_stat}\n".encode())
+            dest_hash.update(f"{name}/ {child.dest_stat}\n".encode())
+        for name in listing.extra:
+            dest_hash.update(f"{name}/ extra\n".encode())
+        for name in sorted(source_files):
+            source_hash.update(stat_line(name, source_files[name]).encode())
+        for name in sorted(dest_files):
+            dest_hash.update(stat_line(name, dest_files[name]).encode())
+        listing.source_stat = source_hash.hexdigest()
+        listing.dest_stat = dest_hash.hexdigest()
+        return listing
+
+    def unchanged(
+        self,
+        listing: Listing,
+    ) -> Node | None:
+        # the node from last time, if nothing beneath it has changed since
+        # and all of it matched recently enough to be trusted still
+        known = self.previous_nodes.get(listing.rel_dir)
+        if known is None or known.read is None:
+            return None
+        if time.monotonic() - known.read >= SCRUB_WINDOW:
+            return None
+        if (known.source_stat, known.dest_stat) != (
+            listing.source_stat, listing.dest_stat,
+        ):
+            return None
+        return known
+
+    def keep(
+        self,
+        listing: Listing,
+    ):
+        # a subtree that wasn't verified again is carried into this pass
+        self.nodes[listing.rel_dir] = self.previous_nodes[listing.rel_dir]
+        for side, files in (
+            ("source", listing.source_files), ("dest", listing.dest_files),
+        ):
+            for name in files:
+                key = (side, join_path(listing.rel_dir, name))
+                if key in self.previous:
+                    self.digests[key] = self.previous[key]
+        for child in listing.children.values():
+            self.keep(child)
+
+    def unsettled(
+        self,
+        rel_path: str,
+        source_stat: os.stat_result | None,
+    ) -> bool:
+        handler = self.handler
+        if rel_path in handler.first_seen or rel_path in handler.grace_events:
+            return True
+        if source_stat is None:
+            return False
+        touched = max(source_stat.st_mtime_ns, source_stat.st_ctime_ns)
+        return time.time_ns() - touched < SETTLE_NS
+
+    def digest(
+        self,
+        side: str,
+        root: Path,
+        rel_path: str,
+        stat_result: os.stat_result,
+    ) -> str | None:
+        # contents are only read again if the file has changed, or was
+        # last read too long ago
+        key = (side, rel_path)
+        signature = (
+            stat_result.st_size, stat_result.st_mtime_ns,
+            stat_result.st_ctime_ns, stat_result.st_ino,
+        )
+        known = self.previous.get(key)
+        now = time.monotonic()
+        if known and known[0] == signature and now - known[2] < SCRUB_WINDOW:
+            self.digests[key] = known
+            return known[1]
+        if not self.budget.spend(stat_result.st_size):
+            raise Stopped
+        try:
+            digest = hash_blob(root / rel_path)
+        except FileNotFoundError:
+            return None
+        registry.inc(
+            "bolthole_scrub_bytes_total", stat_result.st_size, **self.labels,
+        )
+        self.digests[key] = (signature, digest, now)
+        return digest
+
+    def diverged(
+        self,
+        event: Event,
+        reason: str,
+    ):
+        self.differences += 1
+        registry.inc("bolthole_scrub_differences_total", **self.labels)
+        output(f'!! "{event.path}" {reason}')
+        if event.type == "created":
+            self.handler.known_files.add(event.path)
+        elif event.type == "deleted":
+            self.handler.known_files.discard(event.path)
+        self.handler.queue_event(event)
+
+    def verify(
+        self,
+        listing: Listing,
+    ) -> Node:
+        known = self.unchanged(listing)
+        if known:
+            self.keep(listing)
+            return known
+
+        rel_dir = listing.rel_dir
+        source_hash = hashlib.sha1()
+        dest_hash = hashlib.sha1()
+        node = Node(listing.source_stat, listing.dest_stat, "", "", 0, 0, None)
+        read = [time.monotonic()]
+        clean = True
+
+        for name, child_listing in listing.children.items():
+            child = self.verify(child_listing)
+            source_hash.update(f"{name}/ {child.source_hash}\n".encode())
+            dest_hash.update(f"{name}/ {child.dest_hash}\n".encode())
+            node.files += child.files
+            node.verified += child.verified
+            if child.read is None:
+                clean = False
+            else:
+                read.append(child.read)
+        for name in listing.extra:
+            # nothing in it should be there any more
+            prefix = join_path(rel_dir, name) + "/"
+            for rel_path, _ in walk_files(self.dest / prefix, self.ignore, prefix):
+                if not self.unsettled(rel_path, None):
+                    self.diverged(Event("deleted", rel_path), "is only in the copy")
+            dest_hash.update(f"{name}/ extra\n".encode())
+            clean = False
+
+        source_files = listing.source_files
+        dest_files = listing.dest_files
+        for name in sorted(source_files.keys() | dest_files.keys()):
+            rel_path = join_path(rel_dir, name)
+            source_stat = source_files.get(name)
+            dest_stat = dest_files.get(name)
+            if source_stat:
+                node.files += 1
+            if self.unsettled(rel_path, source_stat):
+                clean = False
+                continue
+            source_digest = dest_digest = None
+            if source_stat:
+                source_digest = self.digest(
+                    "source", self.source, rel_path, source_stat,
+                )
+                source_hash.update(f"{name} {source_digest}\n".encode())
+            if dest_stat:
+                dest_digest = self.digest(
+                    "dest", self.dest, rel_path, dest_stat,
+                )
+                dest_hash.update(f"{name} {dest_digest}\n".encode())
+
+            if source_digest == dest_digest:
+                node.verified += 1
+                for side in ("source", "dest"):
+                    if (side, rel_path) in self.digests:
+                        read.append(self.digests[side, rel_path][2])
+                continue
+            clean = False
+            if source_digest and not dest_digest:
+                self.diverged(Event("created", rel_path), "is missing from the copy")
+            elif dest_digest and not source_digest:
+                self.diverged(Event("deleted", rel_path), "is only in the copy")
+            else:
+                self.diverged(Event("modified", rel_path), "differs from the copy")
+
+        node.source_hash = source_hash.hexdigest()
+        node.dest_hash = dest_hash.hexdigest()
+        if clean:
+            node.read = min(read)
+        self.nodes[rel_dir] = node
+        return node
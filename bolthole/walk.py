@@ -0,0 +1,45 @@
+import os
+from collections.abc import Iterator
+from pathlib import Path
+
+from bolthole.ignore import IgnoreMatcher
+
+
+def entry_sort_key(
+    entry: os.DirEntry,
+) -> str:
+    # sorting directories as "name/" keeps the overall walk in the same
+    # order as sorting the full relative paths
+    if entry.is_dir(follow_symlinks=False):
+        return entry.name + "/"
+    return entry.name
+
+
+def walk_files(
+    directory: Path,
+    ignore: IgnoreMatcher,
+    prefix: str = "",
+    recursive: bool = True,
+) -> Iterator[tuple[str, os.DirEntry]]:
+    try:
+        with os.scandir(directory) as scanner:
+            entries = sorted(scanner, key=entry_sort_key)
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return
+
+    for entry in entries:
+        rel = prefix + entry.name
+        if entry.is_dir(follow_symlinks=False):
+            if not recursive or ignore.directory_ignored(rel):
+                continue
+            yield from walk_files(entry.path, ignore, rel + "/")
+        elif entry.is_file():
+            if not ignore(rel):
+                yield rel, entry
+
+
+def list_files(
+    directory: Path,
+    ignore: IgnoreMatcher,
+) -> set[str]:
+    return {rel for rel, _ in walk_files(directory, ignore)}
@@ -1,30 +1,70 @@
 import filecmp
-import fnmatch
 import os
-import shutil
+import posixpath
 import signal
 import stat
 import threading
 import time
+from collections import OrderedDict, deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from types import FrameType
 
 from watchdog.events import FileSystemEvent, FileSystemEventHandler
 from watchdog.observers import Observer
 
+from bolthole.copy import copy_file
 from bolthole.debounce import Event, collapse_events
-from bolthole.git import GitRepo, output
+from bolthole.fastimport import FastImportRepo
+from bolthole.git import GitRepo, hash_blob, output, output_label
+from bolthole.ignore import IgnoreMatcher
+from bolthole.inotify import InotifyObserver
+from bolthole.manifest import Manifest
+from bolthole.metrics import registry, tree_labels
+from bolthole.objects import ObjectRepo
+from bolthole.pipeline import Feeder, Stage
+from bolthole.poll import PollingObserver
+from bolthole.profile import profiler
+from bolthole.push import PushQueue
+from bolthole.scheduler import Scheduler
+from bolthole.scrub import Scrubber
+from bolthole.walk import list_files, walk_files
 
 
-def should_ignore(rel_path: str, patterns: list[str]) -> bool:
-    parts = Path(rel_path).parts
-    for pattern in patterns:
-        if fnmatch.fnmatch(rel_path, pattern):
-            return True
-        for part in parts:
-            if fnmatch.fnmatch(part, pattern):
-                return True
-    return False
+REPO_BACKENDS = {
+    "git": GitRepo,
+    "fast-import": FastImportRepo,
+    "python": ObjectRepo,
+}
+
+COMPARE_WORKERS = 8
+COMPARE_WINDOW = 256
+OBSERVERS = {
+    "native": Observer,
+    "poll": PollingObserver,
+    "inotify": InotifyObserver,
+}
+
+COPY_BATCH = 256
+COPY_WORKERS = 8
+COLLAPSE_WORKERS = 2
+
+# seconds to let a burst that lost events die down before rescanning
+RESCAN_DELAY = 0.5
+# filesystems record times coarsely, so anything changed this close to
+# when events were lost is looked at too
+RESCAN_SLACK_NS = 2_000_000_000
+# seconds after changes start before the directories they were in are
+# looked over, for observers that can't tell when they have lost events
+SWEEP_DELAY = 5
+
+
+def run_work(
+    work: Callable[[], None],
+):
+    work()
 
 
 def report_event(event: Event):
@@ -45,111 +85,313 @@ def report_action(event: Event):
         output(f'++ "{event.path}"')
 
 
-def list_files(
-    directory: Path,
-    ignore_patterns: list[str],
-) -> set[str]:
-    files = set()
-    for path in directory.rglob("*"):
-        if path.is_file():
-            rel = str(path.relative_to(directory))
-            if not should_ignore(rel, ignore_patterns):
-                files.add(rel)
-    return files
-
-
-def remove_empty_parents(
-    path: Path,
+def remove_empty_directories(
+    paths: list[Path],
     root: Path,
 ):
-    parent = path.parent
-    while parent != root:
-        if not any(parent.iterdir()):
+    # deepest first, so each directory is checked once after everything
+    # below it has been tidied away
+    parents = {path.parent for path in paths}
+    for parent in sorted(parents, key=lambda p: len(p.parts), reverse=True):
+        while (parent != root
+                and parent.is_dir()
+                and not any(parent.iterdir())):
             parent.rmdir()
             parent = parent.parent
+
+
+def report_dry_run(event: Event):
+    if event.type in ("created", "modified"):
+        output(f'#  copy "{event.path}"')
+    elif event.type == "deleted":
+        output(f'#  delete "{event.path}"')
+    elif event.type == "renamed":
+        output(f'#  rename "{event.path}" to "{event.new_path}"')
+
+
+def stat_or_none(
+    path: Path,
+) -> os.stat_result | None:
+    try:
+        return path.stat()
+    except FileNotFoundError:
+        return None
+
+
+def mirror_file(
+    rel_path: str,
+    source: Path,
+    dest: Path,
+    manifest: Manifest | None = None,
+    labels: dict[str, str] | None = None,
+):
+    labels = labels or {}
+    src = source / rel_path
+    dst = dest / rel_path
+    # stat before copying, so a change made mid-copy is not recorded
+    # as already mirrored
+    source_stat = src.stat()
+    if dst.exists() and not os.access(dst, os.W_OK):
+        os.chmod(dst, stat.S_IWUSR | stat.S_IRUSR)
+    registry.inc("bolthole_copied_files_total", **labels)
+    registry.inc("bolthole_copied_bytes_total", source_stat.st_size, **labels)
+    if manifest is None:
+        copy_file(src, dst)
+        return
+    digest = copy_file(src, dst, manifest.objects_dir)
+    if digest is None:
+        digest = hash_blob(dst)
+    manifest.record(rel_path, source_stat, digest)
+
+
+def staging_path(
+    dest: Path,
+    number: int,
+) -> Path:
+    git_dir = dest / ".git"
+    if not git_dir.is_dir():
+        git_dir = dest
+    return git_dir / f"bolthole-rename-{number}"
+
+
+def same_stat(
+    first: os.stat_result,
+    second: os.stat_result,
+) -> bool:
+    return (
+        first.st_size == second.st_size
+        and first.st_mtime_ns == second.st_mtime_ns
+    )
+
+
+def rename_files(
+    renames: list[Event],
+    source: Path,
+    dest: Path,
+    manifest: Manifest | None = None,
+) -> list[str]:
+    # files are moved within the destination rather than copied again;
+    # anything that can't be moved, or has changed since, needs copying
+    to_copy = []
+    targets = {event.new_path for event in renames}
+    moves = []
+    for number, event in enumerate(renames):
+        old_dst = dest / event.path
+        if not old_dst.exists():
+            to_copy.append(event.new_path)
+            continue
+        if event.path in targets:
+            # something else is moving here, as in a chain, swap or
+            # cycle, so move it out of the way first
+            staged = staging_path(dest, number)
+            os.rename(old_dst, staged)
+            moves.append((staged, event))
+        else:
+            moves.append((old_dst, event))
+
+    # what was known of each file is taken before any is recorded under
+    # its new name, as in a chain or swap a later move would otherwise
+    # find the entry an earlier one left in its place
+    entries = {}
+    if manifest:
+        for _, event in moves:
+            entries[event.path] = manifest.entries.get(event.path)
+        for _, event in moves:
+            manifest.forget(event.path)
+
+    for current, event in moves:
+        new_dst = dest / event.new_path
+        new_dst.parent.mkdir(parents=True, exist_ok=True)
+        os.rename(current, new_dst)
+        entry = entries.get(event.path)
+        source_stat = stat_or_none(source / event.new_path)
+        if source_stat is None:
+            continue
+        if same_stat(new_dst.stat(), source_stat):
+            if manifest:
+                digest = entry.digest if entry else None
+                manifest.record(event.new_path, source_stat, digest)
         else:
-            break
+            to_copy.append(event.new_path)
 
+    return to_copy
 
-def apply_event(
-    event: Event,
+
+def apply_events(
+    events: list[Event],
     source: Path,
     dest: Path,
     dry_run: bool = False,
     verbose: bool = False,
+    manifest: Manifest | None = None,
+    pool: ThreadPoolExecutor | None = None,
+    labels: dict[str, str] | None = None,
 ):
-    if verbose:
-        report_event(event)
-    report_action(event)
-
+    for event in events:
+        if verbose:
+            report_event(event)
+        report_action(event)
+        if dry_run:
+            report_dry_run(event)
     if dry_run:
-        if event.type in ("created", "modified"):
-            output(f'#  copy "{event.path}"')
-        elif event.type == "deleted":
-            output(f'#  delete "{event.path}"')
-        elif event.type == "renamed":
-            output(f'#  rename "{event.path}" to "{event.new_path}"')
         return
 
-    if event.type in ("created", "modified"):
-        src = source / event.path
-        dst = dest / event.path
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        if dst.exists() and not os.access(dst, os.W_OK):
-            os.chmod(dst, stat.S_IWUSR | stat.S_IRUSR)
-        shutil.copy2(src, dst)
-    elif event.type == "deleted":
-        dst = dest / event.path
-        dst.unlink(missing_ok=True)
-        remove_empty_parents(dst, dest)
-    elif event.type == "renamed":
-        old_dst = dest / event.path
-        new_dst = dest / event.new_path
-        old_dst.unlink(missing_ok=True)
-        remove_empty_parents(old_dst, dest)
-        new_dst.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(source / event.new_path, new_dst)
+    renames = [event for event in events if event.type == "renamed"]
+    to_copy = rename_files(renames, source, dest, manifest=manifest)
+
+    removed = [dest / event.path for event in renames]
+    for event in events:
+        if event.type == "deleted":
+            dst = dest / event.path
+            dst.unlink(missing_ok=True)
+            removed.append(dst)
+            if manifest:
+                manifest.forget(event.path)
+        elif event.type in ("created", "modified"):
+            to_copy.append(event.path)
+    remove_empty_directories(removed, dest)
+
+    parents = {(dest / rel_path).parent for rel_path in to_copy}
+    for parent in sorted(parents):
+        parent.mkdir(parents=True, exist_ok=True)
+
+    if pool and len(to_copy) > 1:
+        futures = [
+            pool.submit(mirror_file, rel_path, source, dest, manifest, labels)
+                for rel_path in to_copy
+        ]
+        for future in futures:
+            future.result()
+    else:
+        for rel_path in to_copy:
+            mirror_file(rel_path, source, dest, manifest, labels)
+
+
+def contents_differ(
+    source_file: Path,
+    dest_file: Path,
+) -> bool:
+    return not filecmp.cmp(source_file, dest_file, shallow=False)
+
+
+def settle_comparison(
+    rel_path: str,
+    outcome: str | Future,
+) -> Event | None:
+    if isinstance(outcome, Future):
+        if not outcome.result():
+            return None
+        return Event("modified", rel_path)
+    return Event(outcome, rel_path)
 
 
 def initial_sync(
     source: Path,
     dest: Path,
-    ignore_patterns: list[str],
+    ignore: IgnoreMatcher,
+    repo: GitRepo,
     dry_run: bool = False,
-    show_git: bool = False,
-    author: str | None = None,
-    message: str | None = None,
-    remotes: list[str] = [],
-):
+    pusher: PushQueue | None = None,
+    paranoid: bool = False,
+    manifest: Manifest | None = None,
+    label: str | None = None,
+) -> set[str]:
     if not dry_run:
         dest.mkdir(parents=True, exist_ok=True)
 
-    source_files = list_files(source, ignore_patterns)
-    if dest.exists():
-        dest_files = list_files(dest, ignore_patterns)
-    else:
+    if manifest and not paranoid and manifest.load():
+        # the manifest records what was mirrored last time, so there is
+        # no need to walk the destination
+        dest_entries = None
         dest_files = set()
+        for rel_path in list(manifest.entries):
+            if ignore(rel_path):
+                manifest.forget(rel_path)
+            else:
+                dest_files.add(rel_path)
+        trusted = manifest
+    else:
+        dest_entries = dict(walk_files(dest, ignore))
+        dest_files = dest_entries.keys()
+        trusted = None
+        if manifest:
+            manifest.entries = {}
+    source_files = set()
 
     events = []
-    for rel_path in sorted(source_files):
-        if rel_path not in dest_files:
-            events.append(Event("created", rel_path))
-        elif not filecmp.cmp(source / rel_path, dest / rel_path, shallow=False):
-            events.append(Event("modified", rel_path))
+    batch = []
+    pending: deque[tuple[str, str | Future, os.stat_result]] = deque()
 
-    for rel_path in sorted(dest_files - source_files):
-        events.append(Event("deleted", rel_path))
+    def settle_next():
+        rel_path, outcome, source_stat = pending.popleft()
+        event = settle_comparison(rel_path, outcome)
+        if event:
+            batch.append(event)
+        elif manifest:
+            manifest.record(rel_path, source_stat)
 
-    for event in events:
-        apply_event(event, source, dest, dry_run=dry_run, verbose=False)
+    def apply_batch():
+        apply_events(
+            batch, source, dest,
+            dry_run=dry_run,
+            manifest=manifest,
+            pool=pool,
+            labels=tree_labels(label),
+        )
+        events.extend(batch)
+        batch.clear()
+
+    with ThreadPoolExecutor(max_workers=COMPARE_WORKERS) as pool:
+        for rel_path, entry in walk_files(source, ignore):
+            source_files.add(rel_path)
+            source_stat = entry.stat()
+            if trusted and trusted.matches(rel_path, source_stat):
+                # unchanged since it was last mirrored
+                continue
+
+            if dest_entries is None:
+                dest_stat = stat_or_none(dest / rel_path)
+            elif rel_path in dest_entries:
+                dest_stat = dest_entries[rel_path].stat()
+            else:
+                dest_stat = None
+
+            if dest_stat is None:
+                outcome = "created"
+            elif source_stat.st_size != dest_stat.st_size:
+                outcome = "modified"
+            elif (not paranoid
+                    and source_stat.st_mtime_ns == dest_stat.st_mtime_ns):
+                # same size and time, trust that nothing has changed
+                if manifest:
+                    manifest.record(rel_path, source_stat)
+                continue
+            else:
+                outcome = pool.submit(
+                    contents_differ, source / rel_path, dest / rel_path,
+                )
+
+            # comparisons run ahead in the pool, but changes are still
+            # applied in order
+            pending.append((rel_path, outcome, source_stat))
+            if len(pending) > COMPARE_WINDOW:
+                settle_next()
+            if len(batch) >= COPY_BATCH:
+                apply_batch()
+
+        while pending:
+            settle_next()
+        apply_batch()
+
+        batch.extend(
+            Event("deleted", rel_path)
+                for rel_path in sorted(dest_files - source_files)
+        )
+        apply_batch()
+
+    if manifest:
+        manifest.save()
 
-    repo = GitRepo(
-        dest,
-        dry_run=dry_run,
-        show_git=show_git,
-        author=author,
-        message=message,
-    )
     committed = False
     if dry_run:
         if events:
@@ -161,49 +403,169 @@ def initial_sync(
             repo.commit_changes(uncommitted)
             committed = True
 
-    if remotes and committed:
-        repo.push(remotes)
+    if pusher and committed:
+        pusher.request()
+
+    return source_files
+
+
+class SharedPools:
+    # workers shared by every tree being watched, rather than each having
+    # its own threads; jobs limits how many commit, or push, at once, and
+    # one thread keeps time for them all
+    def __init__(
+        self,
+        jobs: int,
+    ):
+        self.copy = ThreadPoolExecutor(COPY_WORKERS, thread_name_prefix="copy")
+        self.collapse = ThreadPoolExecutor(
+            COLLAPSE_WORKERS,
+            thread_name_prefix="collapse",
+        )
+        self.mirror = ThreadPoolExecutor(jobs, thread_name_prefix="mirror")
+        self.commit = ThreadPoolExecutor(jobs, thread_name_prefix="commit")
+        self.push = ThreadPoolExecutor(jobs, thread_name_prefix="push")
+        self.scheduler = Scheduler(name="timers")
+
+    def close(self):
+        # called once every tree is closed, so nothing is left to schedule
+        self.scheduler.close()
+        for pool in (self.collapse, self.mirror, self.commit, self.copy, self.push):
+            pool.shutdown()
+
+
+def sync_tree(
+    source: Path,
+    dest: Path | None,
+    ignore: IgnoreMatcher,
+    repo: GitRepo,
+    pusher: PushQueue,
+    dry_run: bool = False,
+    paranoid: bool = False,
+    manifest: Manifest | None = None,
+    label: str | None = None,
+) -> set[str] | None:
+    # brings the repository up to date before watching for changes
+    with profiler.span("initial_sync"):
+        if dest:
+            return initial_sync(
+                source, dest,
+                dry_run=dry_run,
+                ignore=ignore,
+                repo=repo,
+                pusher=pusher,
+                paranoid=paranoid,
+                manifest=manifest,
+                label=label,
+            )
+        events = repo.get_uncommitted()
+        if events:
+            repo.commit_changes(events)
+            pusher.request()
+        return None
 
 
 class DebouncingEventHandler(FileSystemEventHandler):
+    FLUSH = "flush"
+    SWEEP = "sweep"
+
     def __init__(
         self,
         base_path: Path,
-        ignore_patterns: list[str],
+        ignore: IgnoreMatcher,
+        repo: GitRepo,
         dest_path: Path | None = None,
         debounce_delay: float = 0.1,
         dry_run: bool = False,
         verbose: bool = False,
         watchdog_debug: bool = False,
-        show_git: bool = False,
-        author: str | None = None,
-        message: str | None = None,
-        remotes: list[str] = [],
+        pusher: PushQueue | None = None,
         grace: float = 0,
         bundle: float = 0,
+        known_files: set[str] | None = None,
+        manifest: Manifest | None = None,
+        max_wait: float = 0,
+        pools: SharedPools | None = None,
+        label: str | None = None,
+        sweep: bool = False,
     ):
         super().__init__()
         self.base_path = base_path
         self.dest_path = dest_path
         self.debounce_delay = debounce_delay
+        self.max_wait = max_wait
         self.dry_run = dry_run
         self.verbose = verbose
         self.watchdog_debug = watchdog_debug
-        self.show_git = show_git
-        self.author = author
-        self.message = message
-        self.remotes = remotes
-        self.ignore_patterns = ignore_patterns
+        self.repo = repo
+        self.pusher = pusher
+        self.ignore = ignore
         self.grace = grace
         self.bundle = bundle
         self.pending_events: list[Event] = []
+        self.pending_since: float | None = None
+        # when each path waiting to be committed first changed
+        self.first_seen: dict[str, float] = {}
         self.lock = threading.Lock()
-        self.timer: threading.Timer | None = None
-        self.known_files = list_files(self.base_path, self.ignore_patterns)
+        self.closing = False
+        if known_files is None:
+            known_files = list_files(self.base_path, self.ignore)
+        self.known_files = known_files
+        self.manifest = manifest
+        self.label = label
+        self.metric_labels = tree_labels(label)
+        self.pools = pools
+        if pools:
+            self.copy_pool = pools.copy
+            self.scheduler = pools.scheduler
+        else:
+            self.copy_pool = ThreadPoolExecutor(max_workers=COPY_WORKERS)
+            self.scheduler = Scheduler(name="timers")
+        # timer callbacks run on a thread every tree may share, so hand
+        # work on without waiting for room
+        self.flush_scheduler = self.scheduler.timers(self.flush_due)
         self.grace_events: dict[str, Event] = {}
-        self.grace_timers: dict[str, threading.Timer] = {}
-        self.grace_timestamps: dict[str, float] = {}
-        self.commit_lock = threading.Lock()
+        self.grace_scheduler = self.scheduler.timers(self.commit_after_grace)
+        # kept in order of last change, oldest first
+        self.grace_timestamps: OrderedDict[str, float] = OrderedDict()
+        # directory: wall clock time from which its events may be missing
+        self.rescan_since: dict[str, int] = {}
+        self.rescan_scheduler = self.scheduler.timers(self.rescan_due)
+        # with an observer that loses events without saying so, the
+        # directories changes were seen in since the last sweep
+        self.sweep = sweep
+        self.active_dirs: set[str] = set()
+        self.active_since = 0
+        self.sweep_scheduler = self.scheduler.timers(self.sweep_due)
+
+        # each stage has its own thread, so copying one batch can overlap
+        # with committing the one before
+        self.commit_stage = Stage(
+            "commit",
+            self.commit,
+            pool=pools and pools.commit,
+        )
+        self.mirror_stage = Stage(
+            "mirror",
+            self.mirror,
+            self.commit_stage,
+            pool=pools and pools.mirror,
+        )
+        self.collapse_stage = Stage(
+            "collapse",
+            self.collapse,
+            self.mirror_stage,
+            pool=pools and pools.collapse,
+        )
+        self.grace_feeder = Feeder(self.commit_stage)
+        # walking a directory takes a while, so isn't done on the timer;
+        # each item is a rescan or sweep to run
+        self.rescan_stage = Stage(
+            "rescan",
+            run_work,
+            pool=pools and pools.mirror,
+        )
+        self.rescan_feeder = Feeder(self.rescan_stage)
 
     def relative_path(
         self,
@@ -222,64 +584,341 @@ class DebouncingEventHandler(FileSystemEventHandler):
         else:
             output(f"watchdog: {event.type} {event.path}")
 
+    def dispatch(
+        self,
+        event: FileSystemEvent,
+    ):
+        with output_label(self.label):
+            if self.sweep:
+                self.note_activity(event)
+            with profiler.span("watchdog", type=event.event_type):
+                super().dispatch(event)
+
+    def note_activity(
+        self,
+        event: FileSystemEvent,
+    ):
+        # a burst big enough to lose events is still seen to start, so
+        # the directories it touched are looked over once it has passed
+        active = set()
+        for path in (event.src_path, event.dest_path):
+            if not path:
+                continue
+            try:
+                rel = self.relative_path(path)
+            except ValueError:
+                continue
+            if rel == ".":
+                rel = ""
+            if not event.is_directory:
+                rel = posixpath.dirname(rel)
+            if rel and self.ignore.directory_ignored(rel):
+                continue
+            active.add(rel)
+        if not active:
+            return
+        with self.lock:
+            if self.closing:
+                return
+            if not self.active_dirs:
+                self.active_since = time.time_ns()
+            self.active_dirs |= active
+            if self.SWEEP not in self.sweep_scheduler:
+                self.sweep_scheduler.schedule(self.SWEEP, SWEEP_DELAY)
+
     def queue_event(
         self,
         event: Event,
     ):
-        self.log_debug(event)
-        with self.lock:
-            self.pending_events.append(event)
-            if self.timer:
-                self.timer.cancel()
-            self.timer = threading.Timer(self.debounce_delay, self.flush_events)
-            self.timer.start()
+        with profiler.span("queue_event"):
+            self.log_debug(event)
+            registry.inc(
+                "bolthole_events_total",
+                type=event.type,
+                **self.metric_labels,
+            )
+            now = time.monotonic()
+            with self.lock:
+                self.pending_events.append(event)
+                self.first_seen.setdefault(event.new_path or event.path, now)
+                registry.set(
+                    "bolthole_pending_events",
+                    len(self.pending_events),
+                    **self.metric_labels,
+                )
+                if self.pending_since is None:
+                    self.pending_since = now
+                delay = self.debounce_delay
+                if self.max_wait > 0:
+                    # a constant stream of changes would otherwise put the
+                    # flush off forever
+                    ceiling = self.pending_since + self.max_wait - now
+                    delay = max(0, min(delay, ceiling))
+                self.flush_scheduler.schedule(self.FLUSH, delay)
+
+    def flush_due(
+        self,
+        key: str,
+    ):
+        self.flush_events()
 
     def flush_events(
         self,
+        wait: bool = False,
     ):
-        with self.lock:
-            if not self.pending_events:
+        batch = profiler.new_batch()
+        with profiler.batch(batch), profiler.span("flush_events"):
+            with self.lock:
+                if not self.pending_events:
+                    return
+                events = self.pending_events[:]
+                since = self.pending_since
+                self.pending_events = []
+                self.pending_since = None
+                registry.set(
+                    "bolthole_pending_events", 0, **self.metric_labels,
+                )
+            if wait:
+                self.collapse_stage.put((batch, events))
+            elif not self.collapse_stage.offer(
+                (batch, events), self.flush_soon,
+            ):
+                # collapsing has fallen behind, so the events wait with
+                # anything newer until it has room
+                with self.lock:
+                    self.pending_events[:0] = events
+                    self.pending_since = since
+                    registry.set(
+                        "bolthole_pending_events",
+                        len(self.pending_events),
+                        **self.metric_labels,
+                    )
                 return
-            events = self.pending_events[:]
-            self.pending_events = []
+            profiler.record(
+                "debounce", since, time.monotonic(), events=len(events),
+            )
+
+    def flush_soon(self):
+        # collapsing has room again for the events flush_events put back
+        with self.lock:
+            if not self.closing:
+                self.flush_scheduler.schedule(self.FLUSH, 0)
 
-        collapsed = collapse_events(events)
-        for event in collapsed:
+    def collapse(
+        self,
+        item: tuple[int, list[Event]],
+    ) -> tuple[int, list[Event]] | None:
+        # each item is a batch id and its events, passed on together
+        batch, events = item
+        with profiler.batch(batch):
+            with profiler.span("collapse_events", events=len(events)):
+                collapsed = collapse_events(events)
+        registry.observe(
+            "bolthole_flush_events", len(collapsed), **self.metric_labels,
+        )
+        kept = {event.new_path or event.path for event in collapsed}
+        with self.lock:
+            # changes that cancelled each other out will never be committed
+            for event in events:
+                path = event.new_path or event.path
+                if path not in kept:
+                    self.first_seen.pop(path, None)
+        if not collapsed:
+            return None
+        return batch, collapsed
+
+    def mirror(
+        self,
+        item: tuple[int, list[Event]],
+    ) -> tuple[int, list[Event]] | None:
+        batch, collapsed = item
+        with output_label(self.label), profiler.batch(batch):
             if self.dest_path:
-                apply_event(
-                    event, self.base_path, self.dest_path,
-                    dry_run=self.dry_run,
-                    verbose=self.verbose,
-                )
+                with profiler.span("apply_events", events=len(collapsed)):
+                    apply_events(
+                        collapsed, self.base_path, self.dest_path,
+                        dry_run=self.dry_run,
+                        verbose=self.verbose,
+                        manifest=self.manifest,
+                        pool=self.copy_pool,
+                        labels=self.metric_labels,
+                    )
             elif self.verbose:
-                report_event(event)
+                for event in collapsed:
+                    report_event(event)
 
-        if not collapsed:
+            if self.grace > 0:
+                self.schedule_grace_commits(collapsed)
+                return None
+            return item
+
+    def commit(
+        self,
+        item: tuple[int, list[Event]],
+    ):
+        batch, events = item
+        with output_label(self.label), profiler.batch(batch):
+            with profiler.span("commit", events=len(events)):
+                self.repo.commit_changes(events)
+            now = time.monotonic()
+            with self.lock:
+                seen = [
+                    self.first_seen.pop(path)
+                        for event in events
+                        for path in (event.path, event.new_path)
+                        if path in self.first_seen
+                ]
+            for first in seen:
+                registry.observe(
+                    "bolthole_event_to_commit_seconds",
+                    now - first,
+                    **self.metric_labels,
+                )
+            if self.pusher:
+                self.pusher.request()
+
+    def request_rescan(
+        self,
+        rel_dir: str,
+        since_ns: int,
+    ):
+        # called by observers that lost events under rel_dir, rather than
+        # walking the whole tree again
+        with self.lock:
+            earlier = self.rescan_since.get(rel_dir, since_ns)
+            self.rescan_since[rel_dir] = min(earlier, since_ns)
+        if rel_dir not in self.rescan_scheduler:
+            self.rescan_scheduler.schedule(rel_dir, RESCAN_DELAY)
+
+    def rescan_due(
+        self,
+        rel_dir: str,
+    ):
+        self.rescan_feeder.put(partial(self.run_rescan, rel_dir))
+
+    def sweep_due(
+        self,
+        key: str,
+    ):
+        with self.lock:
+            active, self.active_dirs = self.active_dirs, set()
+            since_ns = self.active_since
+        if active:
+            self.rescan_feeder.put(partial(self.run_sweep, active, since_ns))
+
+    def run_sweep(
+        self,
+        active: set[str],
+        since_ns: int,
+    ):
+        # only the files directly in each directory are looked at; any
+        # directory created in it was active itself
+        known: dict[str, set[str]] = {rel_dir: set() for rel_dir in active}
+        # copied first, as the observer can be adding to it
+        for rel_path in list(self.known_files):
+            parent = posixpath.dirname(rel_path)
+            if parent in known:
+                known[parent].add(rel_path)
+        with output_label(self.label):
+            with profiler.span("sweep", directories=len(active)):
+                for rel_dir in sorted(active):
+                    self.rescan(rel_dir, since_ns, known[rel_dir])
+
+    def run_rescan(
+        self,
+        rel_dir: str,
+    ):
+        with self.lock:
+            # a second request while the first was waiting is covered by it
+            since_ns = self.rescan_since.pop(rel_dir, None)
+        if since_ns is None:
             return
+        with output_label(self.label):
+            self.rescan(rel_dir, since_ns)
 
-        if self.grace > 0:
-            self.schedule_grace_commits(collapsed)
-        else:
-            if self.dest_path:
-                repo_path = self.dest_path
-            else:
-                repo_path = self.base_path
-            repo = GitRepo(
-                repo_path,
-                dry_run=self.dry_run,
-                show_git=self.show_git,
-                author=self.author,
-                message=self.message,
-            )
-            repo.commit_changes(collapsed)
-            if self.remotes:
-                repo.push(self.remotes)
+    def changed_since(
+        self,
+        rel_path: str,
+        source_stat: os.stat_result,
+        since_ns: int,
+    ) -> bool:
+        if self.dest_path is None:
+            # nothing to compare with, so anything touched since events
+            # were lost may have changed
+            touched = max(source_stat.st_mtime_ns, source_stat.st_ctime_ns)
+            return touched >= since_ns - RESCAN_SLACK_NS
+        if self.manifest and self.manifest.matches(rel_path, source_stat):
+            return False
+        dest_stat = stat_or_none(self.dest_path / rel_path)
+        return dest_stat is None or not same_stat(source_stat, dest_stat)
+
+    def rescan(
+        self,
+        rel_dir: str,
+        since_ns: int,
+        known: set[str] | None = None,
+    ):
+        # what is there now is compared with what was known, and the
+        # differences queued as if they had just been seen; given the
+        # files known directly in rel_dir, only those are looked at
+        registry.inc("bolthole_rescans_total", **self.metric_labels)
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        recursive = known is None
+        with profiler.span("rescan", directory=rel_dir):
+            found = set()
+            for rel_path, entry in walk_files(
+                self.base_path / rel_dir, self.ignore, prefix, recursive,
+            ):
+                found.add(rel_path)
+                try:
+                    source_stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if rel_path not in self.known_files:
+                    self.known_files.add(rel_path)
+                    self.queue_event(Event("created", rel_path))
+                elif self.changed_since(rel_path, source_stat, since_ns):
+                    self.queue_event(Event("modified", rel_path))
+            if known is None:
+                # copied first, as the observer can be adding to it
+                known = {
+                    rel_path
+                        for rel_path in list(self.known_files)
+                        if rel_path.startswith(prefix)
+                }
+            missing = known - found
+            for rel_path in sorted(missing):
+                # unless it has come back since the walk went past
+                if not (self.base_path / rel_path).exists():
+                    self.known_files.discard(rel_path)
+                    self.queue_event(Event("deleted", rel_path))
+
+    def close(self):
+        with self.lock:
+            self.closing = True
+        self.sweep_scheduler.cancel(self.SWEEP)
+        self.sweep_scheduler.close()
+        self.rescan_scheduler.close()
+        self.rescan_feeder.close()
+        self.rescan_stage.close()
+        # a flush already under way finishes before the final one
+        self.flush_scheduler.cancel(self.FLUSH)
+        self.flush_scheduler.close()
+        self.flush_events(wait=True)
+        self.collapse_stage.close()
+        self.mirror_stage.close()
+        self.grace_scheduler.close()
+        self.grace_feeder.close()
+        self.commit_stage.close()
+        if not self.pools:
+            self.copy_pool.shutdown()
+            self.scheduler.close()
 
     def schedule_grace_commits(
         self,
         events: list[Event],
     ):
-        now = time.time()
+        now = time.monotonic()
         with self.lock:
             for event in events:
                 if event.type == "renamed":
@@ -289,24 +928,24 @@ class DebouncingEventHandler(FileSystemEventHandler):
                     path = event.path
                     old_path = None
 
-                if old_path and old_path in self.grace_timers:
-                    self.grace_timers[old_path].cancel()
-                    del self.grace_timers[old_path]
+                if old_path and old_path in self.grace_scheduler:
+                    self.grace_scheduler.cancel(old_path)
                     old_event = self.grace_events.pop(old_path, None)
                     del self.grace_timestamps[old_path]
+                    self.first_seen.pop(old_path, None)
                     if old_event and old_event.type == "created":
                         # create + rename = create with new name
                         event = Event("created", path)
 
-                if path in self.grace_timers:
-                    self.grace_timers[path].cancel()
-                    del self.grace_timers[path]
+                if path in self.grace_scheduler:
+                    self.grace_scheduler.cancel(path)
                     old_event = self.grace_events.get(path)
                     if old_event:
                         if old_event.type == "created" and event.type == "deleted":
                             # create + delete = nothing
                             del self.grace_events[path]
                             del self.grace_timestamps[path]
+                            self.first_seen.pop(path, None)
                             continue
                         elif old_event.type == "created":
                             # create + anything else = still created
@@ -317,13 +956,13 @@ class DebouncingEventHandler(FileSystemEventHandler):
 
                 self.grace_events[path] = event
                 self.grace_timestamps[path] = now
-                timer = threading.Timer(
-                    self.grace,
-                    self.commit_after_grace,
-                    args=[path],
-                )
-                self.grace_timers[path] = timer
-                timer.start()
+                self.grace_timestamps.move_to_end(path)
+                self.grace_scheduler.schedule(path, self.grace)
+            registry.set(
+                "bolthole_grace_pending",
+                len(self.grace_events),
+                **self.metric_labels,
+            )
 
     def commit_after_grace(
         self,
@@ -336,61 +975,46 @@ class DebouncingEventHandler(FileSystemEventHandler):
         with self.lock:
             if path not in self.grace_events:
                 return
+            if path in self.grace_scheduler:
+                # changed again since this deadline was taken
+                return
             event = self.grace_events.pop(path)
-            del self.grace_timers[path]
-            del self.grace_timestamps[path]
-
-        with self.commit_lock:
-            if self.dest_path:
-                repo_path = self.dest_path
-            else:
-                repo_path = self.base_path
-            repo = GitRepo(
-                repo_path,
-                dry_run=self.dry_run,
-                show_git=self.show_git,
-                author=self.author,
-                message=self.message,
+            waited = self.grace_timestamps.pop(path)
+            registry.set(
+                "bolthole_grace_pending",
+                len(self.grace_events),
+                **self.metric_labels,
             )
-            repo.commit_changes([event])
-            if self.remotes:
-                repo.push(self.remotes)
+
+        # committed on its own after the wait, so as a batch of its own
+        batch = profiler.new_batch()
+        profiler.record("grace", waited, time.monotonic(), batch=batch)
+        self.grace_feeder.put((batch, [event]))
 
     def commit_bundled_files(self):
-        now = time.time()
+        now = time.monotonic()
+        batch = profiler.new_batch()
         with self.lock:
             events_to_commit = []
-            paths_to_remove = []
-            for path, timestamp in self.grace_timestamps.items():
-                age = now - timestamp
-                if age >= self.bundle:
-                    events_to_commit.append(self.grace_events[path])
-                    paths_to_remove.append(path)
-
-            for path in paths_to_remove:
-                del self.grace_events[path]
-                del self.grace_timestamps[path]
-                if path in self.grace_timers:
-                    del self.grace_timers[path]
+            while self.grace_timestamps:
+                path, timestamp = next(iter(self.grace_timestamps.items()))
+                if now - timestamp < self.bundle:
+                    # everything after this was changed more recently
+                    break
+                self.grace_timestamps.popitem(last=False)
+                events_to_commit.append(self.grace_events.pop(path))
+                self.grace_scheduler.cancel(path)
+                profiler.record("grace", timestamp, now, batch=batch)
+            registry.set(
+                "bolthole_grace_pending",
+                len(self.grace_events),
+                **self.metric_labels,
+            )
 
         if not events_to_commit:
             return
 
-        with self.commit_lock:
-            if self.dest_path:
-                repo_path = self.dest_path
-            else:
-                repo_path = self.base_path
-            repo = GitRepo(
-                repo_path,
-                dry_run=self.dry_run,
-                show_git=self.show_git,
-                author=self.author,
-                message=self.message,
-            )
-            repo.commit_changes(events_to_commit)
-            if self.remotes:
-                repo.push(self.remotes)
+        self.grace_feeder.put((batch, events_to_commit))
 
     def on_created(
         self,
@@ -399,7 +1023,7 @@ class DebouncingEventHandler(FileSystemEventHandler):
         if event.is_directory:
             return
         path = self.relative_path(event.src_path)
-        if should_ignore(path, self.ignore_patterns):
+        if self.ignore(path):
             return
         if path in self.known_files:
             self.queue_event(Event("modified", path))
@@ -414,7 +1038,7 @@ class DebouncingEventHandler(FileSystemEventHandler):
         if event.is_directory:
             return
         path = self.relative_path(event.src_path)
-        if should_ignore(path, self.ignore_patterns):
+        if self.ignore(path):
             return
         self.queue_event(Event("modified", path))
 
@@ -425,7 +1049,7 @@ class DebouncingEventHandler(FileSystemEventHandler):
         if event.is_directory:
             return
         path = self.relative_path(event.src_path)
-        if should_ignore(path, self.ignore_patterns):
+        if self.ignore(path):
             return
         self.known_files.discard(path)
         self.queue_event(Event("deleted", path))
@@ -438,8 +1062,8 @@ class DebouncingEventHandler(FileSystemEventHandler):
             return
         src_path = self.relative_path(event.src_path)
         dst_path = self.relative_path(event.dest_path)
-        src_ignored = should_ignore(src_path, self.ignore_patterns)
-        dst_ignored = should_ignore(dst_path, self.ignore_patterns)
+        src_ignored = self.ignore(src_path)
+        dst_ignored = self.ignore(dst_path)
 
         if src_ignored and dst_ignored:
             return
@@ -471,34 +1095,47 @@ def watch(
     remotes: list[str] = [],
     grace: float = 0,
     bundle: float = 0,
+    paranoid: bool = False,
+    hash_copies: bool = False,
+    max_wait: float = 0,
+    backend: str = "git",
+    max_files: int = 0,
+    max_bytes: int = 0,
+    summarise_over: int = 0,
+    observer: str = "native",
+    scrub_rate: int = 0,
 ):
-    ignore_patterns = [".git", ".gitignore"] + ignore_patterns
+    ignore = IgnoreMatcher([".git", ".gitignore"] + ignore_patterns)
+    manifest = None
 
-    if dest:
-        initial_sync(
-            source, dest,
-            dry_run=dry_run,
-            ignore_patterns=ignore_patterns,
-            show_git=show_git,
-            author=author,
-            message=message,
-            remotes=remotes,
-        )
-    else:
-        repo = GitRepo(
-            source,
-            dry_run=dry_run,
-            show_git=show_git,
-            author=author,
-            message=message,
-        )
-        events = repo.get_uncommitted()
-        if events:
-            repo.commit_changes(events)
-            if remotes:
-                repo.push(remotes)
+    if dest and not dry_run:
+        manifest = Manifest.for_repo(dest, hash_copies)
+
+    repo = REPO_BACKENDS[backend](
+        dest or source,
+        dry_run=dry_run,
+        show_git=show_git,
+        author=author,
+        message=message,
+        manifest=manifest,
+        max_files=max_files,
+        max_bytes=max_bytes,
+        summarise_over=summarise_over,
+    )
+    pusher = PushQueue(repo, remotes)
+
+    known_files = sync_tree(
+        source, dest, ignore, repo, pusher,
+        dry_run=dry_run,
+        paranoid=paranoid,
+        manifest=manifest,
+    )
 
     if once:
+        pusher.close()
+        repo.close()
+        if manifest:
+            manifest.close()
         return
 
     handler = DebouncingEventHandler(
@@ -507,16 +1144,18 @@ def watch(
         dry_run=dry_run,
         verbose=verbose,
         watchdog_debug=watchdog_debug,
-        ignore_patterns=ignore_patterns,
-        show_git=show_git,
-        author=author,
-        message=message,
-        remotes=remotes,
+        ignore=ignore,
+        repo=repo,
+        pusher=pusher,
         grace=grace,
         bundle=bundle,
+        known_files=known_files,
+        manifest=manifest,
+        max_wait=max_wait,
+        sweep=observer == "native",
     )
-    observer = Observer()
-    observer.schedule(handler, str(source), recursive=True)
+    watcher = OBSERVERS[observer]()
+    watcher.schedule(handler, str(source), recursive=True)
 
     def sigterm_handler(
         signum: int,
@@ -526,21 +1165,32 @@ def watch(
 
     signal.signal(signal.SIGTERM, sigterm_handler)
 
-    observer.start()
+    watcher.start()
 
     if dest_label:
         output(f"   Copying {source_label} to {dest_label}...")
     else:
         output(f"   Watching {source_label}...")
 
+    scrubber = None
+    if dest and scrub_rate and not dry_run:
+        scrubber = Scrubber(handler, scrub_rate)
+        scrubber.start()
+
     try:
         while True:
-            observer.join(timeout=1)
-            if not observer.is_alive():
+            watcher.join(timeout=1)
+            if not watcher.is_alive():
                 break
     except KeyboardInterrupt:
         pass
     finally:
-        observer.stop()
-        observer.join()
-        handler.flush_events()
+        watcher.stop()
+        watcher.join()
+        if scrubber:
+            scrubber.close()
+        handler.close()
+        pusher.close()
+        repo.close()
+        if manifest:
+            manifest.close()
@@ -11,9 +11,16 @@ bats_require_minimum_version 1.7.0
     if [ "$python_minor" -ge 13 ]; then
         expected_output=$(sed -e 's/^        //' <<-EOF
         usage: bolthole [-h] [--version] [--watchdog-debug] [-n] [-v] [--timeless]
-                        [--ignore PATTERN] [--show-git] [--once] [-a AUTHOR]
-                        [-b SECONDS] [-g SECONDS] [-m MESSAGE] [-r REMOTE]
-                        source [dest]
+                        [--ignore PATTERN] [--paranoid] [--hash-copies]
+                        [--backend {git,fast-import,python}]
+                        [--observer {native,poll,inotify}] [--show-git] [--once]
+                        [-a AUTHOR] [-b SECONDS] [-g SECONDS] [--max-wait SECONDS]
+                        [--max-files COUNT] [--max-bytes SIZE]
+                        [--summarise-over COUNT] [--scrub-rate SIZE]
+                        [--metrics-listen [HOST:]PORT] [--metrics-file PATH]
+                        [--profile PATH] [-m MESSAGE] [-r REMOTE] [--config PATH]
+                        [--jobs COUNT]
+                        [source] [dest]
 
         positional arguments:
           source
@@ -27,22 +34,52 @@ bats_require_minimum_version 1.7.0
           -v, --verbose         show file updates as well as actions taken
           --timeless            omit timestamps from output
           --ignore PATTERN      ignore files matching pattern (repeatable)
+          --paranoid            always compare file contents at startup
+          --hash-copies         store copies in the repository as they are made
+          --backend {git,fast-import,python}
+                                how commits are written (default: git)
+          --observer {native,poll,inotify}
+                                how changes are noticed, poll for network filesystems
+                                or inotify to skip ignored directories on Linux
+                                (default: native)
           --show-git            display git commands and their output
           --once                commit and exit without watching for changes
           -a, --author AUTHOR   override commit author (format: 'Name <email>')
           -b, --bundle SECONDS  bundle files older than threshold into single commit
           -g, --grace SECONDS   delay commits by grace period (default: 0)
+          --max-wait SECONDS    act on changes at least this often (default: 5)
+          --max-files COUNT     split commits with more files than this
+          --max-bytes SIZE      split commits larger than this, e.g. 500M
+          --summarise-over COUNT
+                                summarise commit messages listing more files than this
+                                by directory, such as 100 (default: list them all)
+          --scrub-rate SIZE     check the copy matches in the background, reading at
+                                most this much a second, e.g. 10M
+          --metrics-listen [HOST:]PORT
+                                serve prometheus metrics (default host: 127.0.0.1)
+          --metrics-file PATH   write prometheus metrics to a textfile collector file
+          --profile PATH        record how long each stage takes, as JSON lines
           -m, --message MESSAGE
                                 override commit message
           -r, --remote REMOTE   push to remote after commit (repeatable)
+          --config PATH         watch every tree listed in a config file
+          --jobs COUNT          trees committing or pushing at once with --config
+                                (default: 4)
 	EOF
         )
     else
         expected_output=$(sed -e 's/^        //' <<-EOF
         usage: bolthole [-h] [--version] [--watchdog-debug] [-n] [-v] [--timeless]
-                        [--ignore PATTERN] [--show-git] [--once] [-a AUTHOR]
-                        [-b SECONDS] [-g SECONDS] [-m MESSAGE] [-r REMOTE]
-                        source [dest]
+                        [--ignore PATTERN] [--paranoid] [--hash-copies]
+                        [--backend {git,fast-import,python}]
+                        [--observer {native,poll,inotify}] [--show-git] [--once]
+                        [-a AUTHOR] [-b SECONDS] [-g SECONDS] [--max-wait SECONDS]
+                        [--max-files COUNT] [--max-bytes SIZE]
+                        [--summarise-over COUNT] [--scrub-rate SIZE]
+                        [--metrics-listen [HOST:]PORT] [--metrics-file PATH]
+                        [--profile PATH] [-m MESSAGE] [-r REMOTE] [--config PATH]
+                        [--jobs COUNT]
+                        [source] [dest]
 
         positional arguments:
           source
@@ -56,6 +93,14 @@ bats_require_minimum_version 1.7.0
           -v, --verbose         show file updates as well as actions taken
           --timeless            omit timestamps from output
           --ignore PATTERN      ignore files matching pattern (repeatable)
+          --paranoid            always compare file contents at startup
+          --hash-copies         store copies in the repository as they are made
+          --backend {git,fast-import,python}
+                                how commits are written (default: git)
+          --observer {native,poll,inotify}
+                                how changes are noticed, poll for network filesystems
+                                or inotify to skip ignored directories on Linux
+                                (default: native)
           --show-git            display git commands and their output
           --once                commit and exit without watching for changes
           -a AUTHOR, --author AUTHOR
@@ -64,10 +109,25 @@ bats_require_minimum_version 1.7.0
                                 bundle files older than threshold into single commit
           -g SECONDS, --grace SECONDS
                                 delay commits by grace period (default: 0)
+          --max-wait SECONDS    act on changes at least this often (default: 5)
+          --max-files COUNT     split commits with more files than this
+          --max-bytes SIZE      split commits larger than this, e.g. 500M
+          --summarise-over COUNT
+                                summarise commit messages listing more files than this
+                                by directory, such as 100 (default: list them all)
+          --scrub-rate SIZE     check the copy matches in the background, reading at
+                                most this much a second, e.g. 10M
+          --metrics-listen [HOST:]PORT
+                                serve prometheus metrics (default host: 127.0.0.1)
+          --metrics-file PATH   write prometheus metrics to a textfile collector file
+          --profile PATH        record how long each stage takes, as JSON lines
           -m MESSAGE, --message MESSAGE
                                 override commit message
           -r REMOTE, --remote REMOTE
                                 push to remote after commit (repeatable)
+          --config PATH         watch every tree listed in a config file
+          --jobs COUNT          trees committing or pushing at once with --config
+                                (default: 4)
 	EOF
         )
     fi
@@ -80,9 +140,16 @@ bats_require_minimum_version 1.7.0
 @test "rejects missing source" {
     expected_output=$(sed -e 's/^        //' <<-EOF
         usage: bolthole [-h] [--version] [--watchdog-debug] [-n] [-v] [--timeless]
-                        [--ignore PATTERN] [--show-git] [--once] [-a AUTHOR]
-                        [-b SECONDS] [-g SECONDS] [-m MESSAGE] [-r REMOTE]
-                        source [dest]
+                        [--ignore PATTERN] [--paranoid] [--hash-copies]
+                        [--backend {git,fast-import,python}]
+                        [--observer {native,poll,inotify}] [--show-git] [--once]
+                        [-a AUTHOR] [-b SECONDS] [-g SECONDS] [--max-wait SECONDS]
+                        [--max-files COUNT] [--max-bytes SIZE]
+                        [--summarise-over COUNT] [--scrub-rate SIZE]
+                        [--metrics-listen [HOST:]PORT] [--metrics-file PATH]
+                        [--profile PATH] [-m MESSAGE] [-r REMOTE] [--config PATH]
+                        [--jobs COUNT]
+                        [source] [dest]
         bolthole: error: the following arguments are required: source
 	EOF
     )
@@ -168,6 +235,70 @@ bats_require_minimum_version 1.7.0
     [ $status -eq 2 ]
 }
 
+@test "rejects negative max files" {
+    expected_output=$(sed -e 's/^        //' <<-EOF
+        error: max files cannot be negative
+	EOF
+    )
+
+    mkdir -p "$BATS_TEST_TMPDIR/source"
+
+    run bolthole --max-files -1 "$BATS_TEST_TMPDIR/source"
+    diff -u <(echo "$expected_output") <(echo "$output")
+    [ $status -eq 2 ]
+}
+
+@test "rejects negative summarise over" {
+    expected_output=$(sed -e 's/^        //' <<-EOF
+        error: summarise over cannot be negative
+	EOF
+    )
+
+    mkdir -p "$BATS_TEST_TMPDIR/source"
+
+    run bolthole --summarise-over -1 "$BATS_TEST_TMPDIR/source"
+    diff -u <(echo "$expected_output") <(echo "$output")
+    [ $status -eq 2 ]
+}
+
+@test "rejects invalid max bytes" {
+    mkdir -p "$BATS_TEST_TMPDIR/source"
+
+    run bolthole --max-bytes lots "$BATS_TEST_TMPDIR/source"
+    [[ "$output" == *"argument --max-bytes: invalid size: 'lots'"* ]]
+    [ $status -eq 2 ]
+}
+
+@test "rejects invalid metrics address" {
+    mkdir -p "$BATS_TEST_TMPDIR/source"
+
+    run bolthole --metrics-listen localhost:http "$BATS_TEST_TMPDIR/source"
+    [[ "$output" == *"argument --metrics-listen: invalid address: 'localhost:http'"* ]]
+    [ $status -eq 2 ]
+}
+
+@test "rejects metrics file in a missing directory" {
+    mkdir -p "$BATS_TEST_TMPDIR/source"
+
+    run bolthole --metrics-file "$BATS_TEST_TMPDIR/missing/bolthole.prom" \
+        "$BATS_TEST_TMPDIR/source"
+    [[ "$output" == "error: metrics directory does not exist: "* ]]
+    [ $status -eq 2 ]
+}
+
+@test "rejects negative max wait" {
+    expected_output=$(sed -e 's/^        //' <<-EOF
+        error: max wait cannot be negative
+	EOF
+    )
+
+    mkdir -p "$BATS_TEST_TMPDIR/source"
+
+    run bolthole --max-wait -1 "$BATS_TEST_TMPDIR/source"
+    diff -u <(echo "$expected_output") <(echo "$output")
+    [ $status -eq 2 ]
+}
+
 @test "rejects bundle without grace" {
     expected_output=$(sed -e 's/^        //' <<-EOF
         error: bundle requires grace period
@@ -0,0 +1,145 @@
+bats_require_minimum_version 1.7.0
+
+load helpers.bash
+
+setup() {
+    mkdir -p "$BATS_TEST_TMPDIR/source" "$BATS_TEST_TMPDIR/notes"
+}
+
+teardown() {
+    teardown_bolthole
+}
+
+function write_config {
+    cat > "$BATS_TEST_TMPDIR/bolthole.ini" <<-EOF
+	[DEFAULT]
+	author = Backup <backup@example.com>
+
+	[mirror]
+	source = $BATS_TEST_TMPDIR/source
+	dest = $BATS_TEST_TMPDIR/dest
+	ignore =
+	    *.tmp
+	    scratch
+
+	[notes]
+	source = $BATS_TEST_TMPDIR/notes
+	$1
+	EOF
+}
+
+@test "commits every tree in the config and exits" {
+    expected_output=$(sed -e 's/^        //' <<-EOF
+        [mirror] ++ "file.txt"
+	EOF
+    )
+
+    create_file "source/file.txt" "content"
+    create_file "source/ignored.tmp" "ignored"
+    create_file "notes/existing.txt" "existing"
+    git -C "$BATS_TEST_TMPDIR/notes" init --quiet -b main
+    git -C "$BATS_TEST_TMPDIR/notes" add -A
+    git -C "$BATS_TEST_TMPDIR/notes" commit -m "initial" --quiet
+    create_file "notes/new.txt" "new"
+    write_config
+
+    run timeout 5 bolthole --once --timeless --config "$BATS_TEST_TMPDIR/bolthole.ini"
+    diff -u <(echo "$expected_output") <(echo "$output")
+    [ $status -eq 0 ]
+    check_commit_message "$BATS_TEST_TMPDIR/dest" "Add file.txt"
+    check_commit_author "$BATS_TEST_TMPDIR/dest" "Backup <backup@example.com>"
+    [ ! -f "$BATS_TEST_TMPDIR/dest/ignored.tmp" ]
+    check_commit_message "$BATS_TEST_TMPDIR/notes" "Add new.txt"
+    check_commit_author "$BATS_TEST_TMPDIR/notes" "Backup <backup@example.com>"
+}
+
+@test "watches every tree in the config" {
+    expected_output=$(sed -e 's/^        //' <<-EOF
+        [mirror] ++ "changed.txt"
+	EOF
+    )
+
+    git -C "$BATS_TEST_TMPDIR/notes" init --quiet -b main
+    git -C "$BATS_TEST_TMPDIR/notes" commit --allow-empty -m "initial" --quiet
+    write_config
+
+    start_bolthole --config "$BATS_TEST_TMPDIR/bolthole.ini"
+
+    create_file "source/changed.txt" "changed"
+    wait_for_debounce
+    create_file "notes/changed.txt" "changed"
+    wait_for_debounce
+
+    diff -u <(echo "$expected_output") <(bolthole_log)
+    check_commit_message "$BATS_TEST_TMPDIR/dest" "Add changed.txt"
+    check_commit_message "$BATS_TEST_TMPDIR/notes" "Add changed.txt"
+}
+
+@test "tree settings override the defaults" {
+    git -C "$BATS_TEST_TMPDIR/notes" init --quiet -b main
+    git -C "$BATS_TEST_TMPDIR/notes" commit --allow-empty -m "initial" --quiet
+    write_config "grace = 1"
+
+    start_bolthole --config "$BATS_TEST_TMPDIR/bolthole.ini"
+
+    create_file "source/quick.txt" "quick"
+    create_file "notes/slow.txt" "slow"
+    wait_for_debounce
+
+    check_commit_message "$BATS_TEST_TMPDIR/dest" "Add quick.txt"
+    check_commit_message "$BATS_TEST_TMPDIR/notes" "initial"
+    sleep 1.2
+    check_commit_message "$BATS_TEST_TMPDIR/notes" "Add slow.txt"
+}
+
+@test "command line options apply to every tree" {
+    create_file "source/file.txt" "content"
+    git -C "$BATS_TEST_TMPDIR/notes" init --quiet -b main
+    git -C "$BATS_TEST_TMPDIR/notes" commit --allow-empty -m "initial" --quiet
+    create_file "notes/new.txt" "new"
+    write_config "message = Notes"
+
+    # unless the config file sets them itself
+    run timeout 5 bolthole --once --timeless --message "Backup" \
+        --author "Someone Else <someone@example.com>" \
+        --config "$BATS_TEST_TMPDIR/bolthole.ini"
+    [ $status -eq 0 ]
+    check_commit_message "$BATS_TEST_TMPDIR/dest" "Backup"
+    check_commit_message "$BATS_TEST_TMPDIR/notes" "Notes"
+    check_commit_author "$BATS_TEST_TMPDIR/notes" "Backup <backup@example.com>"
+}
+
+@test "rejects a source with --config" {
+    write_config
+
+    run bolthole --config "$BATS_TEST_TMPDIR/bolthole.ini" "$BATS_TEST_TMPDIR/source"
+    [[ "${lines[-1]}" == "bolthole: error: a source cannot be given with --config" ]]
+    [ $status -eq 2 ]
+}
+
+@test "rejects an invalid tree" {
+    expected_output=$(sed -e 's/^        //' <<-EOF
+        error: [notes] source must be a git repository in single-directory mode
+	EOF
+    )
+
+    write_config
+
+    run bolthole --config "$BATS_TEST_TMPDIR/bolthole.ini"
+    diff -u <(echo "$expected_output") <(echo "$output")
+    [ $status -eq 2 ]
+}
+
+@test "rejects unknown settings" {
+    expected_output=$(sed -e 's/^        //' <<-EOF
+        error: [notes] unknown setting 'colour'
+	EOF
+    )
+
+    git -C "$BATS_TEST_TMPDIR/notes" init --quiet -b main
+    write_config "colour = blue"
+
+    run bolthole --config "$BATS_TEST_TMPDIR/bolthole.ini"
+    diff -u <(echo "$expected_output") <(echo "$output")
+    [ $status -eq 2 ]
+}
@@ -0,0 +1,27 @@
+import subprocess
+
+import pytest
+
+
+@pytest.fixture
+def git_dir(tmp_path, monkeypatch):
+    # an empty repository, committed to as a fixed user
+    for role in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{role}_NAME", "Test User")
+        monkeypatch.setenv(f"GIT_{role}_EMAIL", "test@example.com")
+    dest = tmp_path / "dest"
+    subprocess.run(["git", "init", "--quiet", "-b", "main", dest], check=True)
+    return dest
+
+
+def git(repo, *args):
+    return subprocess.run(
+        ["git", "-C", str(repo.path), *args],
+        capture_output=True, text=True, check=True,
+    ).stdout
+
+
+def write(repo, path, content):
+    target = repo.path / path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_text(content)
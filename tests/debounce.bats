@@ -61,3 +61,20 @@ teardown() {
     echo "$output" | grep -q "watchdog: created debug.txt"
     echo "$output" | grep -q "watchdog: deleted debug.txt"
 }
+
+@test "constant changes still flush after max wait" {
+    kill $pid 2>/dev/null || true
+    wait $pid 2>/dev/null || true
+
+    start_bolthole --max-wait 0.3 "$BATS_TEST_TMPDIR/source"
+
+    for i in {1..20}; do
+        echo "line $i" >> "$BATS_TEST_TMPDIR/source/log.txt"
+        sleep 0.05
+    done
+
+    # changes never stopped for the debounce period, but have been
+    # committed regardless
+    commits=$(git -C "$BATS_TEST_TMPDIR/source" rev-list --count HEAD)
+    [ "$commits" -gt 1 ]
+}
@@ -253,3 +253,35 @@ teardown() {
     diff -u <(echo "$expected_output") <(bolthole_log)
     check_commit_message "$BATS_TEST_TMPDIR/dest" "Add existing.txt and new.txt"
 }
+
+@test "trusts files with matching size and time" {
+    expected_output=""
+
+    create_file "source/file.txt" "new"
+    init_dest_repo
+    add_file_to_repo "dest/file.txt" "old"
+    touch -r "$BATS_TEST_TMPDIR/source/file.txt" "$BATS_TEST_TMPDIR/dest/file.txt"
+
+    start_bolthole "$BATS_TEST_TMPDIR/source" "$BATS_TEST_TMPDIR/dest"
+
+    diff -u <(echo -n "$expected_output") <(bolthole_log)
+    [ "$(cat "$BATS_TEST_TMPDIR/dest/file.txt")" = "old" ]
+}
+
+@test "paranoid compares files with matching size and time" {
+    expected_output=$(sed -e 's/^        //' <<-EOF
+        ++ "file.txt"
+	EOF
+    )
+
+    create_file "source/file.txt" "new"
+    init_dest_repo
+    add_file_to_repo "dest/file.txt" "old"
+    touch -r "$BATS_TEST_TMPDIR/source/file.txt" "$BATS_TEST_TMPDIR/dest/file.txt"
+
+    start_bolthole --paranoid "$BATS_TEST_TMPDIR/source" "$BATS_TEST_TMPDIR/dest"
+
+    diff -u <(echo "$expected_output") <(bolthole_log)
+    diff -u "$BATS_TEST_TMPDIR/source/file.txt" "$BATS_TEST_TMPDIR/dest/file.txt"
+    check_commit_message "$BATS_TEST_TMPDIR/dest" "Update file.txt"
+}
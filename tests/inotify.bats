@@ -0,0 +1,77 @@
+bats_require_minimum_version 1.7.0
+
+load helpers.bash
+
+setup() {
+    mkdir -p "$BATS_TEST_TMPDIR/source"
+}
+
+teardown() {
+    teardown_bolthole
+}
+
+@test "inotify notices changes" {
+    create_file "source/existing.txt" "existing"
+    init_source_repo
+
+    start_bolthole --observer inotify "$BATS_TEST_TMPDIR/source"
+
+    create_file "source/sub/new.txt" "new content"
+    wait_for_debounce
+
+    check_commit_message "$BATS_TEST_TMPDIR/source" "Add sub/new.txt"
+}
+
+@test "inotify follows renamed directories" {
+    expected_output=$(sed -e 's/^        //' <<-EOF
+        ++ "sub/file.txt"
+        ++ "sub/file.txt" -> "moved/file.txt"
+        ++ "moved/later.txt"
+	EOF
+    )
+
+    create_file "source/sub/file.txt" "content"
+    init_dest_repo
+
+    start_bolthole --observer inotify "$BATS_TEST_TMPDIR/source" "$BATS_TEST_TMPDIR/dest"
+
+    mv "$BATS_TEST_TMPDIR/source/sub" "$BATS_TEST_TMPDIR/source/moved"
+    wait_for_debounce
+    create_file "source/moved/later.txt" "later"
+    wait_for_debounce
+
+    diff -u <(echo "$expected_output") <(bolthole_log)
+    check_commit_message "$BATS_TEST_TMPDIR/dest" "Add moved/later.txt"
+}
+
+@test "inotify skips ignored directories" {
+    create_file "source/existing.txt" "existing"
+    create_file "source/build/old.o" "ignored"
+    init_source_repo
+
+    start_bolthole --observer inotify --ignore build "$BATS_TEST_TMPDIR/source"
+
+    create_file "source/build/output.o" "ignored"
+    wait_for_debounce
+
+    check_commit_message "$BATS_TEST_TMPDIR/source" "initial"
+}
+
+@test "inotify waits for files to be closed" {
+    create_file "source/existing.txt" "existing"
+    init_source_repo
+
+    start_bolthole --observer inotify "$BATS_TEST_TMPDIR/source"
+
+    exec 3>"$BATS_TEST_TMPDIR/source/slow.txt"
+    echo "first half" >&3
+    wait_for_debounce
+    check_commit_message "$BATS_TEST_TMPDIR/source" "initial"
+
+    echo "second half" >&3
+    exec 3>&-
+    wait_for_debounce
+
+    check_commit_message "$BATS_TEST_TMPDIR/source" "Add slow.txt"
+    [ "$(git -C "$BATS_TEST_TMPDIR/source" show HEAD:slow.txt)" = "$(printf 'first half\nsecond half')" ]
+}
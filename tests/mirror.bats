@@ -107,3 +107,15 @@ teardown() {
     diff -u <(echo "$expected_output") <(bolthole_log)
     check_commit_message "$BATS_TEST_TMPDIR/dest" "Add one.txt and two.txt"
 }
+
+@test "--hash-copies stores copies as they are made" {
+    teardown_bolthole
+    start_bolthole --hash-copies "$BATS_TEST_TMPDIR/source" "$BATS_TEST_TMPDIR/dest"
+
+    echo "hashed" > "$BATS_TEST_TMPDIR/source/hashed.txt"
+    wait_for_debounce
+
+    diff -u "$BATS_TEST_TMPDIR/source/hashed.txt" "$BATS_TEST_TMPDIR/dest/hashed.txt"
+    check_commit_message "$BATS_TEST_TMPDIR/dest" "Add hashed.txt"
+    [ -z "$(git -C "$BATS_TEST_TMPDIR/dest" status --porcelain)" ]
+}
@@ -67,3 +67,98 @@ setup() {
     diff -u <(echo "$expected_output") <(echo "$output")
     [ $status -eq 0 ]
 }
+
+@test "mirror restart only copies changed files" {
+    expected_output=$(sed -e 's/^        //' <<-EOF
+        ++ "changed.txt"
+        -- "removed.txt"
+	EOF
+    )
+
+    create_file "source/changed.txt" "original"
+    create_file "source/removed.txt" "removed"
+    create_file "source/same.txt" "same"
+    init_dest_repo
+
+    run timeout 5 bolthole --once --timeless "$BATS_TEST_TMPDIR/source" "$BATS_TEST_TMPDIR/dest"
+    [ $status -eq 0 ]
+    [ -f "$BATS_TEST_TMPDIR/dest/.git/bolthole-manifest" ]
+
+    echo "changed" > "$BATS_TEST_TMPDIR/source/changed.txt"
+    rm "$BATS_TEST_TMPDIR/source/removed.txt"
+
+    run timeout 5 bolthole --once --timeless "$BATS_TEST_TMPDIR/source" "$BATS_TEST_TMPDIR/dest"
+    diff -u <(echo "$expected_output") <(echo "$output")
+    [ $status -eq 0 ]
+    diff -u "$BATS_TEST_TMPDIR/source/changed.txt" "$BATS_TEST_TMPDIR/dest/changed.txt"
+    [ ! -e "$BATS_TEST_TMPDIR/dest/removed.txt" ]
+    check_commit_message "$BATS_TEST_TMPDIR/dest" "Update changed.txt, remove removed.txt"
+}
+
+@test "fast-import backend commits and exits" {
+    create_file "source/existing.txt" "existing"
+    init_source_repo
+    create_file "source/new.txt" "new content"
+
+    run timeout 5 bolthole --once --timeless --backend fast-import "$BATS_TEST_TMPDIR/source"
+    [ -z "$output" ]
+    [ $status -eq 0 ]
+    check_commit_message "$BATS_TEST_TMPDIR/source" "Add new.txt"
+    [ -z "$(git -C "$BATS_TEST_TMPDIR/source" status --porcelain)" ]
+}
+
+@test "python backend commits and exits" {
+    create_file "source/existing.txt" "existing"
+    init_source_repo
+    create_file "source/new.txt" "new content"
+
+    run timeout 5 bolthole --once --timeless --backend python "$BATS_TEST_TMPDIR/source"
+    [ -z "$output" ]
+    [ $status -eq 0 ]
+    check_commit_message "$BATS_TEST_TMPDIR/source" "Add new.txt"
+    git -C "$BATS_TEST_TMPDIR/source" fsck --strict --no-dangling
+    [ -z "$(git -C "$BATS_TEST_TMPDIR/source" status --porcelain)" ]
+}
+
+@test "large change sets are split into several commits" {
+    create_file "source/existing.txt" "existing"
+    init_source_repo
+    create_file "source/one.txt" "one"
+    create_file "source/sub/two.txt" "two"
+    create_file "source/sub/three.txt" "three"
+
+    run timeout 5 bolthole --once --timeless --max-files 2 "$BATS_TEST_TMPDIR/source"
+    [ -z "$output" ]
+    [ $status -eq 0 ]
+    [ "$(git -C "$BATS_TEST_TMPDIR/source" rev-list --count HEAD)" -eq 3 ]
+    [ -z "$(git -C "$BATS_TEST_TMPDIR/source" status --porcelain)" ]
+}
+
+@test "metrics are written to a file" {
+    create_file "source/existing.txt" "existing"
+    init_source_repo
+    create_file "source/new.txt" "new"
+
+    run timeout 5 bolthole --once --timeless \
+        --metrics-file "$BATS_TEST_TMPDIR/bolthole.prom" \
+        "$BATS_TEST_TMPDIR/source"
+    [ -z "$output" ]
+    [ $status -eq 0 ]
+    grep -q '^bolthole_commit_seconds_count 1$' "$BATS_TEST_TMPDIR/bolthole.prom"
+    grep -q '^bolthole_git_commands_total{command="commit"} 1$' \
+        "$BATS_TEST_TMPDIR/bolthole.prom"
+}
+
+@test "profile records each stage" {
+    create_file "source/existing.txt" "existing"
+    init_source_repo
+    create_file "source/new.txt" "new"
+
+    run timeout 5 bolthole --once --timeless \
+        --profile "$BATS_TEST_TMPDIR/profile.jsonl" \
+        "$BATS_TEST_TMPDIR/source"
+    [[ "${lines[0]}" == "   span "*" count       p50       p90       p99       max" ]]
+    [[ "$output" == *"   initial_sync "* ]]
+    [ $status -eq 0 ]
+    grep -q '"span": "git commit"' "$BATS_TEST_TMPDIR/profile.jsonl"
+}
@@ -0,0 +1,64 @@
+bats_require_minimum_version 1.7.0
+
+load helpers.bash
+
+setup() {
+    mkdir -p "$BATS_TEST_TMPDIR/source"
+}
+
+teardown() {
+    teardown_bolthole
+}
+
+function wait_for_poll {
+    # directories are looked at a second after starting, then two
+    # seconds after that if nothing had changed
+    sleep 4
+}
+
+@test "polling notices changes" {
+    create_file "source/existing.txt" "existing"
+    create_file "source/gone.txt" "gone"
+    init_source_repo
+
+    start_bolthole --observer poll "$BATS_TEST_TMPDIR/source"
+
+    create_file "source/sub/new.txt" "new content"
+    echo "changed" > "$BATS_TEST_TMPDIR/source/existing.txt"
+    rm "$BATS_TEST_TMPDIR/source/gone.txt"
+    wait_for_poll
+
+    check_commit_message "$BATS_TEST_TMPDIR/source" \
+        "Change 3 files"
+}
+
+@test "polling mirrors renames" {
+    expected_output=$(sed -e 's/^        //' <<-EOF
+        ++ "old.txt"
+        ++ "old.txt" -> "new.txt"
+	EOF
+    )
+
+    create_file "source/old.txt" "content"
+    init_dest_repo
+
+    start_bolthole --observer poll "$BATS_TEST_TMPDIR/source" "$BATS_TEST_TMPDIR/dest"
+
+    mv "$BATS_TEST_TMPDIR/source/old.txt" "$BATS_TEST_TMPDIR/source/new.txt"
+    wait_for_poll
+
+    diff -u <(echo "$expected_output") <(bolthole_log)
+    check_commit_message "$BATS_TEST_TMPDIR/dest" "Rename old.txt to new.txt"
+}
+
+@test "polling skips ignored directories" {
+    create_file "source/existing.txt" "existing"
+    init_source_repo
+
+    start_bolthole --observer poll --ignore build "$BATS_TEST_TMPDIR/source"
+
+    create_file "source/build/output.o" "ignored"
+    wait_for_poll
+
+    check_commit_message "$BATS_TEST_TMPDIR/source" "initial"
+}
@@ -101,6 +101,27 @@ teardown() {
     check_commit_message "$BATS_TEST_TMPDIR/source" "Add new.txt"
 }
 
+@test "failed push is retried in watch mode" {
+    create_file "source/file.txt" "content"
+    init_source_repo
+    add_remote "source" "origin"
+
+    start_bolthole -r origin "$BATS_TEST_TMPDIR/source"
+
+    create_file "source/new.txt" "new content"
+    wait_for_debounce
+    grep -q "!! push to origin failed" "$BATS_TEST_TMPDIR/out.txt"
+
+    # the remote appears, and the next attempt catches up
+    create_bare_remote "origin"
+    sleep 1.5
+
+    local origin_head source_head
+    origin_head=$(get_remote_head "origin")
+    source_head=$(git -C "$BATS_TEST_TMPDIR/source" rev-parse HEAD)
+    [ "$origin_head" = "$source_head" ]
+}
+
 @test "dry run shows push commands" {
     expected_output=$(sed -e 's/^        //' <<-EOF
         #  git add -- new.txt
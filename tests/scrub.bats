@@ -0,0 +1,50 @@
+bats_require_minimum_version 1.7.0
+
+load helpers.bash
+
+setup() {
+    mkdir -p "$BATS_TEST_TMPDIR/source"
+}
+
+teardown() {
+    teardown_bolthole
+}
+
+function wait_for_settle {
+    # files changed in the last few seconds are left for the watcher
+    sleep 5.5
+}
+
+@test "scrub restores a damaged copy" {
+    expected_output=$(sed -e 's/^        //' <<-EOF
+        !! "file.txt" differs from the copy
+        ++ "file.txt"
+           Scrubbed 2 files, 50.0% verified in the last day, 1 to correct
+	EOF
+    )
+
+    create_file "source/file.txt" "content"
+    create_file "source/other.txt" "other"
+    init_dest_repo
+    bolthole --once --timeless "$BATS_TEST_TMPDIR/source" "$BATS_TEST_TMPDIR/dest" >/dev/null
+
+    # the same size and time, so only reading it shows the damage
+    echo "CONTENT" > "$BATS_TEST_TMPDIR/dest/file.txt"
+    touch -r "$BATS_TEST_TMPDIR/source/file.txt" "$BATS_TEST_TMPDIR/dest/file.txt"
+    wait_for_settle
+
+    start_bolthole --scrub-rate 1M "$BATS_TEST_TMPDIR/source" "$BATS_TEST_TMPDIR/dest"
+    sleep 0.5
+
+    # the copy is put right alongside the report
+    diff -u <(echo "$expected_output" | sort) <(bolthole_log | sort)
+    diff -u "$BATS_TEST_TMPDIR/source/file.txt" "$BATS_TEST_TMPDIR/dest/file.txt"
+}
+
+@test "rejects scrub rate without a destination" {
+    create_file "source/file.txt" "content"
+    init_source_repo
+
+    run -2 bolthole --scrub-rate 1M "$BATS_TEST_TMPDIR/source"
+    [ "$output" = "error: scrub rate requires a destination directory" ]
+}
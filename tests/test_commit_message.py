@@ -201,3 +201,82 @@ class TestCombinations:
             - Add project/source/components/button.tsx
             - Update project/source/components/input.tsx
         """).strip()
+
+
+class TestLargeChangeSets:
+    def test_one_line_per_directory(self):
+        events = [
+            Event("modified", f"assets/images/{n}.png")
+                for n in range(12_345)
+        ]
+        events += [
+            Event("created", f"docs/page{n}.md")
+                for n in range(150)
+        ]
+        events.append(Event("deleted", "notes.txt"))
+        assert GitRepo.generate_commit_message(events, 100) == dedent("""
+            Change 12,496 files
+
+            - Remove notes.txt
+            - Update 12,345 files under assets/images/
+            - Add 150 files under docs/
+        """).strip()
+
+    def test_single_operation_subject(self):
+        events = [
+            Event("deleted", f"cache/{n}.tmp")
+                for n in range(200)
+        ]
+        assert GitRepo.generate_commit_message(events, 100) == dedent("""
+            Remove 200 files
+
+            - Remove 200 files under cache/
+        """).strip()
+
+    def test_directories_merge_until_under_the_limit(self):
+        events = [
+            Event("created", f"src/module{n}/file{m}.py")
+                for n in range(150)
+                for m in range(2)
+        ]
+        events += [
+            Event("created", f"top{n}.txt")
+                for n in range(3)
+        ]
+        assert GitRepo.generate_commit_message(events, 100) == dedent("""
+            Add 303 files
+
+            - Add 3 files at the top level
+            - Add 300 files under src/
+        """).strip()
+
+    def test_threshold_can_be_lowered(self):
+        events = [
+            Event("created", f"docs/page{n}.md")
+                for n in range(3)
+        ]
+        assert GitRepo.generate_commit_message(events, 2) == dedent("""
+            Add 3 files
+
+            - Add 3 files under docs/
+        """).strip()
+
+    def test_every_file_listed_by_default(self):
+        events = [
+            Event("created", f"docs/page{n:03}.md")
+                for n in range(150)
+        ]
+        body = GitRepo.generate_commit_message(events).split("\n\n")[1]
+        assert body.splitlines() == [
+            f"- Add docs/page{n:03}.md"
+                for n in range(150)
+        ]
+
+    def test_body_is_capped(self):
+        events = [
+            Event("created", f"dir{n}/sub{m}/file.txt")
+                for n in range(500)
+                for m in range(2)
+        ]
+        body = GitRepo.generate_commit_message(events, 100).split("\n\n")[1]
+        assert body == "- Add 1,000 files"
@@ -0,0 +1,139 @@
+import subprocess
+from pathlib import Path
+from textwrap import dedent
+
+import pytest
+
+from bolthole.config import ConfigError, Tree, load_config
+
+
+@pytest.fixture
+def config(tmp_path):
+    (tmp_path / "source").mkdir()
+    (tmp_path / "repo").mkdir()
+    subprocess.run(["git", "init", "--quiet", tmp_path / "repo"], check=True)
+    path = tmp_path / "bolthole.ini"
+
+    def write(text):
+        path.write_text(dedent(text).format(root=tmp_path))
+        return path
+
+    return write
+
+
+def test_reads_each_tree(config, tmp_path):
+    path = config("""
+        [DEFAULT]
+        grace = 30
+        remote = origin
+
+        [mirror]
+        source = {root}/source
+        dest = {root}/backup
+        ignore =
+            *.tmp
+            build
+        max-bytes = 500M
+        hash-copies = yes
+
+        [repo]
+        source = {root}/repo
+        grace = 0
+        summarise-over = 100
+        remote =
+            origin
+            offsite
+        paranoid = yes
+    """)
+    assert load_config(path) == [
+        Tree(
+            name="mirror",
+            source=tmp_path / "source",
+            dest=tmp_path / "backup",
+            ignore=["*.tmp", "build"],
+            grace=30,
+            max_bytes=500 * 1024 ** 2,
+            remotes=["origin"],
+            hash_copies=True,
+        ),
+        Tree(
+            name="repo",
+            source=tmp_path / "repo",
+            summarise_over=100,
+            remotes=["origin", "offsite"],
+            paranoid=True,
+        ),
+    ]
+
+
+def test_options_are_defaults(config, tmp_path):
+    path = config("""
+        [DEFAULT]
+        grace = 30
+
+        [repo]
+        source = {root}/repo
+        max-files = 10
+    """)
+    defaults = {"grace": "5", "max-files": "100", "max-bytes": "1G"}
+    assert load_config(path, defaults) == [
+        Tree(
+            name="repo",
+            source=tmp_path / "repo",
+            grace=30,
+            max_files=10,
+            max_bytes=1024 ** 3,
+        ),
+    ]
+
+
+def test_expands_home_directory(config, tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    path = config("""
+        [repo]
+        source = ~/repo
+    """)
+    assert load_config(path)[0].source == tmp_path / "repo"
+
+
+@pytest.mark.parametrize("text, message", [
+    ("[repo]\nsource = {root}/repo\ncolour = blue",
+        "[repo] unknown setting 'colour'"),
+    ("[repo]\ndest = {root}/backup",
+        "[repo] source is required"),
+    ("[repo]\nsource = {root}/repo\ngrace = soon",
+        "[repo] could not convert string to float: 'soon'"),
+    ("[repo]\nsource = {root}/repo\nmax-bytes = lots",
+        "[repo] invalid size: 'lots'"),
+    ("[repo]\nsource = {root}/repo\nsummarise-over = -1",
+        "[repo] summarise over cannot be negative"),
+    ("[repo]\nsource = {root}/repo\nbackend = svn",
+        "[repo] unknown backend 'svn'"),
+    ("[repo]\nsource = {root}/repo\nobserver = fsevents",
+        "[repo] unknown observer 'fsevents'"),
+    ("[repo]\nsource = {root}/repo\nscrub-rate = 10M",
+        "[repo] scrub rate requires a destination directory"),
+    ("[repo]\nsource = {root}/repo\nbundle = 5",
+        "[repo] bundle requires grace period"),
+    ("[plain]\nsource = {root}/source",
+        "[plain] source must be a git repository in single-directory mode"),
+    ("[one]\nsource = {root}/repo\n[two]\nsource = {root}/repo",
+        "[two] uses the same repository as [one]"),
+])
+def test_rejects_invalid_trees(config, text, message):
+    with pytest.raises(ConfigError) as error:
+        load_config(config(text))
+    assert str(error.value) == message
+
+
+def test_rejects_empty_config(config):
+    path = config("")
+    with pytest.raises(ConfigError) as error:
+        load_config(path)
+    assert str(error.value) == f"no trees in {path}"
+
+
+def test_rejects_missing_config(tmp_path):
+    with pytest.raises(ConfigError) as error:
+        load_config(Path(tmp_path / "missing.ini"))
+    assert str(error.value).startswith("cannot read ")
@@ -0,0 +1,144 @@
+import os
+import zlib
+
+from bolthole import copy
+from bolthole.copy import copy_file
+from bolthole.git import hash_blob
+
+
+def test_copies_contents_and_times(tmp_path):
+    source = tmp_path / "source.bin"
+    dest = tmp_path / "dest.bin"
+    source.write_bytes(os.urandom(100_000))
+    os.utime(source, ns=(1_000_000_000, 2_000_000_000))
+
+    copy_file(source, dest)
+
+    assert dest.read_bytes() == source.read_bytes()
+    assert dest.stat().st_mtime_ns == 2_000_000_000
+
+
+def test_copies_empty_file(tmp_path):
+    source = tmp_path / "empty"
+    dest = tmp_path / "copy"
+    source.write_bytes(b"")
+    copy_file(source, dest)
+    assert dest.read_bytes() == b""
+
+
+def test_replaces_existing_file(tmp_path):
+    source = tmp_path / "source.txt"
+    dest = tmp_path / "dest.txt"
+    source.write_text("short")
+    dest.write_text("much longer original content")
+    copy_file(source, dest)
+    assert dest.read_text() == "short"
+
+
+def test_falls_back_to_plain_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(copy, "reflink", lambda *args: False)
+    monkeypatch.setattr(copy, "copy_range", lambda *args: False)
+    monkeypatch.setattr(copy, "send_file", lambda *args: False)
+    monkeypatch.setattr(copy, "_no_reflink", set())
+    monkeypatch.setattr(copy, "_no_copy_range", set())
+    monkeypatch.setattr(copy, "_no_sendfile", set())
+
+    source = tmp_path / "source.bin"
+    dest = tmp_path / "dest.bin"
+    source.write_bytes(os.urandom(50_000))
+    copy_file(source, dest)
+
+    assert dest.read_bytes() == source.read_bytes()
+    assert os.stat(dest).st_dev in copy._no_sendfile
+
+
+def read_object(objects_dir, digest):
+    path = objects_dir / digest[:2] / digest[2:]
+    return zlib.decompress(path.read_bytes())
+
+
+def test_stores_blob_while_copying(tmp_path, monkeypatch):
+    monkeypatch.setattr(copy, "reflink", lambda *args: False)
+    objects_dir = tmp_path / "objects"
+    objects_dir.mkdir()
+    source = tmp_path / "source.bin"
+    dest = tmp_path / "dest.bin"
+    data = os.urandom(3 * copy.HASH_CHUNK_SIZE + 17)
+    source.write_bytes(data)
+
+    digest = copy_file(source, dest, objects_dir)
+
+    assert dest.read_bytes() == data
+    assert digest == hash_blob(source)
+    assert read_object(objects_dir, digest) == b"blob %d\0" % len(data) + data
+    assert [p.name for p in objects_dir.iterdir()] == [digest[:2]]
+
+
+def test_stores_blob_of_empty_file(tmp_path):
+    objects_dir = tmp_path / "objects"
+    objects_dir.mkdir()
+    source = tmp_path / "empty"
+    source.write_bytes(b"")
+    digest = copy_file(source, tmp_path / "copy", objects_dir)
+    assert digest == "e69de29bb2d1d6434b8b29ae775ad8c2e48c5391"
+    assert read_object(objects_dir, digest) == b"blob 0\0"
+
+
+def test_clones_are_not_read_to_store_them(tmp_path, monkeypatch):
+    def clone(source_fd, dest_fd):
+        os.copy_file_range(source_fd, dest_fd, 50_000)
+        return True
+
+    monkeypatch.setattr(copy, "reflink", clone)
+    monkeypatch.setattr(copy, "_no_reflink", set())
+    objects_dir = tmp_path / "objects"
+    objects_dir.mkdir()
+    source = tmp_path / "source.bin"
+    dest = tmp_path / "dest.bin"
+    source.write_bytes(os.urandom(50_000))
+
+    assert copy_file(source, dest, objects_dir) is None
+    assert dest.read_bytes() == source.read_bytes()
+    assert list(objects_dir.iterdir()) == []
+
+
+def test_falls_back_when_nothing_is_copied(tmp_path, monkeypatch):
+    # as some filesystems do, rather than reporting an error
+    monkeypatch.setattr(copy, "reflink", lambda *args: False)
+    monkeypatch.setattr(os, "copy_file_range", lambda *args: 0)
+    monkeypatch.setattr(os, "sendfile", lambda *args: 0)
+    monkeypatch.setattr(copy, "_no_reflink", set())
+    monkeypatch.setattr(copy, "_no_copy_range", set())
+    monkeypatch.setattr(copy, "_no_sendfile", set())
+
+    source = tmp_path / "source.bin"
+    dest = tmp_path / "dest.bin"
+    source.write_bytes(os.urandom(50_000))
+    copy_file(source, dest)
+
+    assert dest.read_bytes() == source.read_bytes()
+    assert os.stat(dest).st_dev in copy._no_sendfile
+
+
+def test_falls_back_when_copying_stops_part_way(tmp_path, monkeypatch):
+    real_copy_file_range = os.copy_file_range
+    calls = []
+
+    def copy_once(source_fd, dest_fd, count):
+        calls.append(count)
+        if len(calls) > 1:
+            return 0
+        return real_copy_file_range(source_fd, dest_fd, 1000)
+
+    monkeypatch.setattr(copy, "reflink", lambda *args: False)
+    monkeypatch.setattr(os, "copy_file_range", copy_once)
+    monkeypatch.setattr(copy, "_no_reflink", set())
+    monkeypatch.setattr(copy, "_no_copy_range", set())
+    monkeypatch.setattr(copy, "_no_sendfile", set())
+
+    source = tmp_path / "source.bin"
+    dest = tmp_path / "dest.bin"
+    source.write_bytes(os.urandom(50_000))
+    copy_file(source, dest)
+
+    assert dest.read_bytes() == source.read_bytes()
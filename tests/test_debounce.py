@@ -351,3 +351,29 @@ def test_atomic_replace_unrelated_filenames():
     ]) == [
         Event("modified", "config.json"),
     ]
+
+
+def test_two_renames_onto_same_path_then_deleted():
+    assert collapse_events([
+        Event("renamed", "a.txt", "c.txt"),
+        Event("renamed", "b.txt", "c.txt"),
+        Event("deleted", "c.txt"),
+    ]) == [
+        Event("renamed", "b.txt", "c.txt"),
+        Event("deleted", "a.txt"),
+    ]
+
+
+def test_directory_rename_of_many_files():
+    count = 20000
+    events = [
+        Event("renamed", f"old/{n}.txt", f"new/{n}.txt")
+            for n in range(count)
+    ] + [
+        Event("renamed", f"new/{n}.txt", f"final/{n}.txt")
+            for n in range(count)
+    ]
+    assert collapse_events(events) == [
+        Event("renamed", f"old/{n}.txt", f"final/{n}.txt")
+            for n in sorted(range(count), key=str)
+    ]
@@ -0,0 +1,151 @@
+import pytest
+from conftest import git, write
+
+import bolthole.fastimport
+from bolthole.debounce import Event
+from bolthole.fastimport import FastImportRepo, quote_path
+
+
+@pytest.fixture
+def repo(git_dir):
+    repo = FastImportRepo(git_dir)
+    yield repo
+    repo.close()
+
+
+def test_quotes_only_when_needed():
+    assert quote_path("plain name.txt") == b"plain name.txt"
+    assert quote_path('"start') == b'"\\"start"'
+    assert quote_path("new\nline") == b'"new\\nline"'
+
+
+def test_first_commit_on_unborn_branch(repo):
+    write(repo, "a.txt", "a")
+    repo.commit_changes([Event("created", "a.txt")])
+    assert git(repo, "log", "--format=%s%n%an <%ae>") == (
+        "Add a.txt\nTest User <test@example.com>\n"
+    )
+    assert git(repo, "show", "HEAD:a.txt") == "a"
+
+
+def test_commits_on_top_of_existing_history(repo):
+    write(repo, "a.txt", "a")
+    git(repo, "add", "a.txt")
+    git(repo, "commit", "--quiet", "-m", "initial")
+    write(repo, "a.txt", "changed")
+    write(repo, "b.txt", "b")
+    repo.commit_changes([Event("modified", "a.txt"), Event("created", "b.txt")])
+    assert git(repo, "log", "--format=%s") == (
+        "Update a.txt, add b.txt\ninitial\n"
+    )
+
+
+def test_skips_unchanged_files(repo):
+    write(repo, "a.txt", "a")
+    repo.commit_changes([Event("created", "a.txt")])
+    repo.commit_changes([Event("modified", "a.txt")])
+    assert git(repo, "rev-list", "--count", "HEAD") == "1\n"
+
+
+def test_records_deletes_and_renames(repo):
+    write(repo, "a.txt", "a")
+    write(repo, "b.txt", "b")
+    repo.commit_changes([Event("created", "a.txt"), Event("created", "b.txt")])
+    (repo.path / "a.txt").rename(repo.path / "moved.txt")
+    (repo.path / "b.txt").unlink()
+    repo.commit_changes([
+        Event("renamed", "a.txt", "moved.txt"),
+        Event("deleted", "b.txt"),
+    ])
+    assert git(repo, "log", "-1", "--format=%s") == (
+        "Rename a.txt to moved.txt, remove b.txt\n"
+    )
+    assert git(repo, "ls-tree", "--name-only", "HEAD") == "moved.txt\n"
+
+
+def test_removed_directory_deletes_tracked_files(repo):
+    write(repo, "sub/a.txt", "a")
+    write(repo, "sub/deeper/b.txt", "b")
+    repo.commit_changes([Event("created", "sub/")])
+    assert git(repo, "ls-tree", "-r", "--name-only", "HEAD") == (
+        "sub/a.txt\nsub/deeper/b.txt\n"
+    )
+    (repo.path / "sub" / "deeper" / "b.txt").unlink()
+    (repo.path / "sub" / "deeper").rmdir()
+    repo.commit_changes([Event("deleted", "sub/deeper")])
+    assert git(repo, "ls-tree", "-r", "--name-only", "HEAD") == "sub/a.txt\n"
+
+
+def test_directory_replaced_by_file(repo):
+    write(repo, "sub/a.txt", "a")
+    repo.commit_changes([Event("created", "sub/")])
+    (repo.path / "sub" / "a.txt").unlink()
+    (repo.path / "sub").rmdir()
+    write(repo, "sub", "now a file")
+    repo.commit_changes([Event("deleted", "sub/a.txt"), Event("created", "sub")])
+    assert git(repo, "ls-tree", "-r", "--name-only", "HEAD") == "sub\n"
+    assert git(repo, "show", "HEAD:sub") == "now a file"
+
+
+def test_file_replaced_by_directory(repo):
+    write(repo, "sub", "a file")
+    repo.commit_changes([Event("created", "sub")])
+    (repo.path / "sub").unlink()
+    write(repo, "sub/a.txt", "a")
+    repo.commit_changes([Event("created", "sub/")])
+    assert git(repo, "ls-tree", "-r", "--name-only", "HEAD") == "sub/a.txt\n"
+
+
+def test_large_files_are_streamed(repo, monkeypatch):
+    monkeypatch.setattr(bolthole.fastimport, "CHUNK_SIZE", 1000)
+    content = "".join(f"line {n}\n" for n in range(10_000))
+    write(repo, "big.txt", content)
+    repo.commit_changes([Event("created", "big.txt")])
+    assert git(repo, "show", "HEAD:big.txt") == content
+    assert git(repo, "rev-parse", "HEAD:big.txt").strip() == (
+        git(repo, "hash-object", "big.txt").strip()
+    )
+
+
+def test_respects_gitignore(repo):
+    write(repo, ".gitignore", "*.log\n")
+    write(repo, "a.txt", "a")
+    write(repo, "debug.log", "noise")
+    repo.commit_changes([
+        Event("created", ".gitignore"),
+        Event("created", "a.txt"),
+        Event("created", "debug.log"),
+    ])
+    assert git(repo, "ls-tree", "--name-only", "HEAD") == ".gitignore\na.txt\n"
+
+
+def test_keeps_executable_bit(repo):
+    write(repo, "run.sh", "#!/bin/sh\n")
+    (repo.path / "run.sh").chmod(0o755)
+    repo.commit_changes([Event("created", "run.sh")])
+    assert git(repo, "ls-tree", "HEAD").startswith("100755 ")
+
+
+def test_close_updates_index(repo):
+    write(repo, "a.txt", "a")
+    repo.commit_changes([Event("created", "a.txt")])
+    repo.close()
+    assert git(repo, "status", "--porcelain") == ""
+
+
+def test_close_leaves_other_staged_changes(repo):
+    write(repo, "mine.txt", "staged by hand")
+    git(repo, "add", "mine.txt")
+    write(repo, "a.txt", "a")
+    repo.commit_changes([Event("created", "a.txt")])
+    repo.close()
+    assert git(repo, "status", "--porcelain") == "A  mine.txt\n"
+
+
+def test_follows_outside_commits(repo):
+    write(repo, "a.txt", "a")
+    repo.commit_changes([Event("created", "a.txt")])
+    git(repo, "commit", "--quiet", "--allow-empty", "-m", "outside")
+    write(repo, "c.txt", "c")
+    repo.commit_changes([Event("created", "c.txt")])
+    assert git(repo, "log", "--format=%s") == "Add c.txt\noutside\nAdd a.txt\n"
@@ -0,0 +1,118 @@
+import os
+
+import pytest
+from conftest import git, write
+
+from bolthole.copy import copy_file
+from bolthole.debounce import Event
+from bolthole.git import GitRepo
+from bolthole.manifest import Manifest
+
+
+@pytest.fixture
+def repo(git_dir):
+    return GitRepo(
+        git_dir, show_git=True, manifest=Manifest.for_repo(git_dir, True),
+    )
+
+
+def mirror(repo, path, content):
+    source = repo.path.parent / "source"
+    source.mkdir(exist_ok=True)
+    (source / path).write_text(content)
+    digest = copy_file(source / path, repo.path / path, repo.manifest.objects_dir)
+    repo.manifest.record(path, (source / path).stat(), digest)
+
+
+def test_commits_copied_blobs_without_adding(repo, capsys):
+    mirror(repo, "a.txt", "a")
+    mirror(repo, "b.txt", "b")
+    repo.commit_changes([Event("created", "a.txt"), Event("created", "b.txt")])
+    assert "git add" not in capsys.readouterr().out
+    assert git(repo, "log", "--format=%s") == "Add a.txt and b.txt\n"
+    assert git(repo, "show", "HEAD:b.txt") == "b"
+    assert git(repo, "reflog", "--format=%gs") == "commit: Add a.txt and b.txt\n"
+    # the index knows the files are unchanged without reading them
+    assert git(repo, "diff-files", "--name-only") == ""
+    git(repo, "fsck", "--strict", "--no-dangling")
+
+
+def test_copied_blobs_are_not_read_again(repo):
+    mirror(repo, "a.txt", "a")
+    # the same size and time, so only reading it would show the change
+    copy = repo.path / "a.txt"
+    times = copy.stat()
+    copy.write_text("b")
+    past = times.st_mtime_ns - 10_000_000_000
+    os.utime(copy, ns=(past, past))
+    entry = repo.manifest.entries["a.txt"]
+    repo.manifest.record("a.txt", copy.stat(), entry.digest)
+
+    repo.commit_changes([Event("created", "a.txt")])
+    assert git(repo, "show", "HEAD:a.txt") == "a"
+    assert git(repo, "diff-files", "--name-only") == ""
+
+
+def test_adds_files_changed_since_copying(repo, capsys):
+    mirror(repo, "a.txt", "a")
+    (repo.path / "a.txt").write_text("changed afterwards")
+    repo.commit_changes([Event("created", "a.txt")])
+    assert "git add -- a.txt" in capsys.readouterr().out
+    assert git(repo, "show", "HEAD:a.txt") == "changed afterwards"
+
+
+def test_copied_blobs_respect_gitignore(repo):
+    (repo.path / ".gitignore").write_text("*.log\n")
+    mirror(repo, "a.txt", "a")
+    mirror(repo, "debug.log", "noise")
+    repo.commit_changes([Event("created", "a.txt"), Event("created", "debug.log")])
+    assert git(repo, "ls-tree", "--name-only", "HEAD") == "a.txt\n"
+
+
+def test_copied_blobs_on_existing_history(repo):
+    mirror(repo, "a.txt", "a")
+    repo.commit_changes([Event("created", "a.txt")])
+    mirror(repo, "a.txt", "changed")
+    repo.author = "Someone Else <someone@example.com>"
+    repo.commit_changes([Event("modified", "a.txt")])
+    assert git(repo, "log", "--format=%s %an") == (
+        "Update a.txt Someone Else\nAdd a.txt Test User\n"
+    )
+    assert git(repo, "status", "--porcelain") == ""
+
+
+def test_commits_more_paths_than_fit_on_a_command_line(repo):
+    repo.manifest = None
+    repo.show_git = False
+    events = []
+    for n in range(10_000):
+        path = f"{'long-directory-name-' * 4}{n // 1000}/{'file-' * 10}{n}.txt"
+        write(repo, path, str(n))
+        events.append(Event("created", path))
+    repo.commit_changes(events)
+    assert git(repo, "ls-files").count("\n") == 10_000
+
+
+def test_splits_commits_by_file_count(repo):
+    repo.manifest = None
+    repo.max_files = 2
+    events = []
+    for name in ("a.txt", "b.txt", "c.txt", "d.txt", "e.txt"):
+        write(repo, name, name)
+        events.append(Event("created", name))
+    repo.commit_changes(events)
+    assert git(repo, "log", "--format=%s") == (
+        "Add e.txt\nAdd c.txt and d.txt\nAdd a.txt and b.txt\n"
+    )
+
+
+def test_splits_commits_by_size(repo):
+    repo.manifest = None
+    repo.max_bytes = 100
+    sizes = {"a.bin": 60, "b.bin": 30, "c.bin": 20, "d.bin": 500}
+    for name, size in sizes.items():
+        write(repo, name, "x" * size)
+    repo.commit_changes([Event("created", name) for name in sizes])
+    assert git(repo, "log", "--format=%s") == (
+        "Add d.bin\nAdd c.bin\nAdd a.bin and b.bin\n"
+    )
@@ -0,0 +1,88 @@
+import fnmatch
+from pathlib import Path
+
+from bolthole.ignore import IgnoreMatcher
+
+
+def reference(rel_path, patterns):
+    parts = Path(rel_path).parts
+    for pattern in patterns:
+        if fnmatch.fnmatch(rel_path, pattern):
+            return True
+        for part in parts:
+            if fnmatch.fnmatch(part, pattern):
+                return True
+    return False
+
+
+def test_no_patterns():
+    ignore = IgnoreMatcher([])
+    assert not ignore("file.txt")
+    assert not ignore("dir/file.txt")
+
+
+def test_exact_filename():
+    ignore = IgnoreMatcher(["secret.txt"])
+    assert ignore("secret.txt")
+    assert ignore("dir/secret.txt")
+    assert not ignore("secret.txt.bak")
+
+
+def test_extension():
+    ignore = IgnoreMatcher(["*.log"])
+    assert ignore("error.log")
+    assert ignore("deep/down/error.log")
+    assert not ignore("error.log.txt")
+
+
+def test_directory_component():
+    ignore = IgnoreMatcher([".git", "node_modules"])
+    assert ignore(".git")
+    assert ignore(".git/config")
+    assert ignore("web/node_modules/lib/index.js")
+    assert not ignore("web/src/index.js")
+
+
+def test_directory_with_extension():
+    ignore = IgnoreMatcher(["*.tmp"])
+    assert ignore("logs.tmp/file.txt")
+
+
+def test_path_pattern():
+    ignore = IgnoreMatcher(["logs/*.log"])
+    assert ignore("logs/file.log")
+    assert not ignore("other/file.log")
+    assert not ignore("file.log")
+
+
+def test_directory_ignored():
+    ignore = IgnoreMatcher(["build", "*.log"])
+    assert ignore.directory_ignored("build")
+    assert ignore.directory_ignored("src/build/output")
+    assert not ignore.directory_ignored("src")
+    assert not ignore.directory_ignored("")
+
+
+def test_path_pattern_does_not_ignore_directory():
+    ignore = IgnoreMatcher(["logs/*.log"])
+    assert not ignore.directory_ignored("logs")
+
+
+def test_matches_reference():
+    patterns = [
+        ".git", ".gitignore", "*.log", "*.tmp", "logs/*.log",
+        "build", "a?b", "*/cache", "[Tt]humbs.db", "*~",
+    ]
+    paths = [
+        "file.txt", "a.log", "sub/a.log", "a.log.txt", ".git/HEAD",
+        "src/.gitignore", "logs/x.log", "logs/deep/x.log", "build/out.o",
+        "src/build/out.o", "builder/out.o", "a/b", "a/b/c", "axb",
+        "x/cache", "x/cache/data", "Thumbs.db", "pics/thumbs.db",
+        "notes.txt~", "tmp/file.tmp", "file.tmpl",
+    ]
+    ignore = IgnoreMatcher(patterns)
+    for path in paths:
+        assert ignore(path) == reference(path, patterns), path
+    # repeated lookups are answered from the directory cache
+    for path in paths:
+        assert ignore(path) == reference(path, patterns), path
@@ -0,0 +1,171 @@
+import time
+
+import pytest
+
+from bolthole.ignore import IgnoreMatcher
+from bolthole.inotify import InotifyObserver
+
+
+class FakeHandler:
+    label = None
+
+    def __init__(self, root):
+        self.root = root
+        self.ignore = IgnoreMatcher([".git", "node_modules", "*.tmp"])
+        self.known_files = set()
+        self.events = []
+        self.rescans = []
+
+    def request_rescan(self, rel_dir, since_ns):
+        self.rescans.append((rel_dir, since_ns))
+
+    def dispatch(self, event):
+        src = str(event.src_path).removeprefix(f"{self.root}/")
+        if event.event_type == "moved":
+            dest = str(event.dest_path).removeprefix(f"{self.root}/")
+            self.events.append((event.event_type, src, dest))
+        else:
+            self.events.append((event.event_type, src))
+
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def settle(handler, count):
+    deadline = time.monotonic() + 2
+    while len(handler.events) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # anything more that was going to arrive
+    time.sleep(0.1)
+    return handler.events
+
+
+@pytest.fixture
+def watched(tmp_path):
+    write(tmp_path / "a.txt", "a")
+    write(tmp_path / "sub" / "b.txt", "b")
+    write(tmp_path / "node_modules" / "dep" / "index.js", "dep")
+    handler = FakeHandler(tmp_path)
+    observer = InotifyObserver()
+    observer.schedule(handler, str(tmp_path))
+    observer.start()
+    yield observer, handler
+    observer.stop()
+    observer.join()
+
+
+def test_ignored_directories_are_not_watched(watched):
+    observer, handler = watched
+    assert sorted(observer.trees[0].watches) == ["", "sub"]
+    assert handler.events == []
+
+
+def test_reports_changes(watched, tmp_path):
+    observer, handler = watched
+    write(tmp_path / "node_modules" / "dep" / "other.js", "ignored")
+    (tmp_path / "sub" / "b.txt").rename(tmp_path / "sub" / "c.txt")
+    (tmp_path / "a.txt").unlink()
+    assert settle(handler, 2) == [
+        ("moved", "sub/b.txt", "sub/c.txt"),
+        ("deleted", "a.txt"),
+    ]
+
+
+def test_new_directories_are_watched(watched, tmp_path):
+    observer, handler = watched
+    (tmp_path / "fresh").mkdir()
+    settle(handler, 0)
+    write(tmp_path / "fresh" / "deep" / "d.txt", "d")
+    events = settle(handler, 3)
+    assert ("created", "fresh/deep/d.txt") in events
+    assert "fresh/deep" in observer.trees[0].watches
+
+
+def test_renamed_directories_move_their_watches(watched, tmp_path):
+    observer, handler = watched
+    (tmp_path / "sub").rename(tmp_path / "renamed")
+    assert settle(handler, 1) == [("moved", "sub/b.txt", "renamed/b.txt")]
+    assert sorted(observer.trees[0].watches) == ["", "renamed"]
+
+    write(tmp_path / "renamed" / "e.txt", "e")
+    assert ("created", "renamed/e.txt") in settle(handler, 2)
+
+
+def test_ignored_directories_are_not_walked_when_moved(watched, tmp_path):
+    observer, handler = watched
+    write(tmp_path / "sub" / "node_modules" / "dep.js", "dep")
+    write(tmp_path / "sub" / "scratch.tmp", "ignored")
+    settle(handler, 0)
+    handler.events.clear()
+    (tmp_path / "sub").rename(tmp_path / "renamed")
+    assert settle(handler, 1) == [("moved", "sub/b.txt", "renamed/b.txt")]
+
+
+def test_directories_moved_to_an_ignored_name(watched, tmp_path):
+    observer, handler = watched
+    handler.known_files = {"a.txt", "sub/b.txt"}
+    (tmp_path / "sub").rename(tmp_path / "sub.tmp")
+    assert settle(handler, 1) == [("deleted", "sub/b.txt")]
+    assert sorted(observer.trees[0].watches) == [""]
+
+
+def test_directories_moved_out_are_unwatched(watched, tmp_path):
+    observer, handler = watched
+    handler.known_files = {"a.txt", "sub/b.txt"}
+    (tmp_path / "sub").rename(tmp_path.parent / f"{tmp_path.name}-outside")
+    assert settle(handler, 1) == [("deleted", "sub/b.txt")]
+    assert sorted(observer.trees[0].watches) == [""]
+
+
+def test_removed_directories_are_unwatched(watched, tmp_path):
+    observer, handler = watched
+    (tmp_path / "sub" / "b.txt").unlink()
+    (tmp_path / "sub").rmdir()
+    assert settle(handler, 1) == [("deleted", "sub/b.txt")]
+    assert sorted(observer.trees[0].watches) == [""]
+
+
+def test_written_files_are_reported_when_closed(watched, tmp_path):
+    observer, handler = watched
+    with open(tmp_path / "big.bin", "wb") as writer:
+        for _ in range(100):
+            writer.write(b"x" * 4096)
+            writer.flush()
+        assert settle(handler, 0) == []
+    handler.known_files.add("a.txt")
+    (tmp_path / "a.txt").write_text("changed")
+    assert settle(handler, 2) == [
+        ("created", "big.bin"),
+        ("modified", "a.txt"),
+    ]
+
+
+def test_links_are_reported_when_created(watched, tmp_path):
+    observer, handler = watched
+    (tmp_path / "link.txt").symlink_to("a.txt")
+    (tmp_path / "hard.txt").hardlink_to(tmp_path / "a.txt")
+    events = settle(handler, 2)
+    assert ("created", "link.txt") in events
+    assert ("created", "hard.txt") in events
+
+
+def test_overflow_restores_watches_and_rescans(tmp_path):
+    write(tmp_path / "sub" / "b.txt", "b")
+    handler = FakeHandler(tmp_path)
+    observer = InotifyObserver()
+    observer.schedule(handler, str(tmp_path))
+    tree = observer.trees[0]
+    observer.add_directory(tree, "", False)
+
+    # changes whose events never arrived
+    (tmp_path / "sub" / "b.txt").unlink()
+    (tmp_path / "sub").rmdir()
+    write(tmp_path / "fresh" / "deep" / "c.txt", "c")
+    observer.overflowed()
+
+    assert sorted(tree.watches) == ["", "fresh", "fresh/deep"]
+    assert handler.rescans == [("", observer.drained_ns)]
+    observer.stop()
+    observer.join()
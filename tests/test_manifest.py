@@ -0,0 +1,108 @@
+import os
+
+from bolthole.manifest import Manifest, ManifestEntry
+
+
+def make_file(path, content):
+    path.write_text(content)
+    return path.stat()
+
+
+def test_missing_manifest(tmp_path):
+    manifest = Manifest(tmp_path / "manifest")
+    assert not manifest.load()
+    assert manifest.entries == {}
+
+
+def test_save_and_load(tmp_path):
+    stat_result = make_file(tmp_path / "file.txt", "content")
+    manifest = Manifest(tmp_path / "manifest")
+    manifest.record("file.txt", stat_result, "abc123")
+    manifest.record("no digest.txt", stat_result)
+    manifest.save()
+    manifest.close()
+
+    loaded = Manifest(tmp_path / "manifest")
+    assert loaded.load()
+    assert loaded.entries == {
+        "file.txt": ManifestEntry(
+            stat_result.st_size,
+            stat_result.st_mtime_ns,
+            stat_result.st_ino,
+            "abc123",
+        ),
+        "no digest.txt": ManifestEntry(
+            stat_result.st_size,
+            stat_result.st_mtime_ns,
+            stat_result.st_ino,
+        ),
+    }
+
+
+def test_changes_after_save_are_journalled(tmp_path):
+    first = make_file(tmp_path / "first.txt", "first")
+    second = make_file(tmp_path / "second.txt", "second")
+    manifest = Manifest(tmp_path / "manifest")
+    manifest.record("first.txt", first)
+    manifest.save()
+    manifest.record("second.txt", second, "def456")
+    manifest.forget("first.txt")
+    manifest.close()
+
+    loaded = Manifest(tmp_path / "manifest")
+    assert loaded.load()
+    assert list(loaded.entries) == ["second.txt"]
+    assert loaded.entries["second.txt"].digest == "def456"
+
+
+def test_partial_record_ignored(tmp_path):
+    stat_result = make_file(tmp_path / "file.txt", "content")
+    manifest = Manifest(tmp_path / "manifest")
+    manifest.record("file.txt", stat_result)
+    manifest.save()
+    manifest.close()
+    with open(tmp_path / "manifest", "ab") as handle:
+        handle.write(b"+12 34 56 - trunc")
+
+    loaded = Manifest(tmp_path / "manifest")
+    assert loaded.load()
+    assert list(loaded.entries) == ["file.txt"]
+
+
+def test_matches_stat(tmp_path):
+    path = tmp_path / "file.txt"
+    stat_result = make_file(path, "content")
+    manifest = Manifest(tmp_path / "manifest")
+    manifest.record("file.txt", stat_result)
+    assert manifest.matches("file.txt", stat_result)
+    assert not manifest.matches("other.txt", stat_result)
+
+    os.utime(path, ns=(0, stat_result.st_mtime_ns + 1))
+    assert not manifest.matches("file.txt", path.stat())
+
+
+def test_record_keeps_digest_of_unchanged_file(tmp_path):
+    stat_result = make_file(tmp_path / "file.txt", "content")
+    manifest = Manifest(tmp_path / "manifest")
+    manifest.record("file.txt", stat_result, "abc123")
+    manifest.record("file.txt", stat_result)
+    assert manifest.entries["file.txt"].digest == "abc123"
+
+
+def test_for_repo_requires_git_directory(tmp_path):
+    assert Manifest.for_repo(tmp_path) is None
+    (tmp_path / ".git").mkdir()
+    manifest = Manifest.for_repo(tmp_path)
+    assert manifest.path == tmp_path / ".git" / "bolthole-manifest"
+
+
+def test_for_repo_stores_blobs_in_sha1_repositories(tmp_path):
+    (tmp_path / ".git" / "objects").mkdir(parents=True)
+    assert Manifest.for_repo(tmp_path).objects_dir is None
+    manifest = Manifest.for_repo(tmp_path, hash_copies=True)
+    assert manifest.objects_dir == tmp_path / ".git" / "objects"
+
+    (tmp_path / ".git" / "config").write_text(
+        "[extensions]\n\tobjectFormat = sha256\n",
+    )
+    assert Manifest.for_repo(tmp_path, hash_copies=True).objects_dir is None
@@ -0,0 +1,77 @@
+import urllib.request
+
+import pytest
+
+from bolthole.metrics import Metrics, MetricsFile, MetricsServer, registry
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    registry.clear()
+    yield
+    registry.clear()
+
+
+def test_nothing_recorded_renders_nothing():
+    assert Metrics().render() == "\n"
+
+
+def test_counters_and_gauges():
+    metrics = Metrics()
+    metrics.inc("bolthole_events_total", type="created")
+    metrics.inc("bolthole_events_total", type="created")
+    metrics.inc("bolthole_events_total", type="deleted")
+    metrics.set("bolthole_pending_events", 7)
+    assert metrics.render() == (
+        "# HELP bolthole_events_total Filesystem events received.\n"
+        "# TYPE bolthole_events_total counter\n"
+        'bolthole_events_total{type="created"} 2\n'
+        'bolthole_events_total{type="deleted"} 1\n'
+        "# HELP bolthole_pending_events Events waiting for the next flush.\n"
+        "# TYPE bolthole_pending_events gauge\n"
+        "bolthole_pending_events 7\n"
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    for value in (0.002, 0.3, 0.4, 1000):
+        metrics.observe("bolthole_push_seconds", value, remote="origin")
+    lines = metrics.render().splitlines()
+    assert 'bolthole_push_seconds_bucket{remote="origin",le="0.005"} 1' in lines
+    assert 'bolthole_push_seconds_bucket{remote="origin",le="0.25"} 1' in lines
+    assert 'bolthole_push_seconds_bucket{remote="origin",le="0.5"} 3' in lines
+    assert 'bolthole_push_seconds_bucket{remote="origin",le="300"} 3' in lines
+    assert 'bolthole_push_seconds_bucket{remote="origin",le="+Inf"} 4' in lines
+    assert 'bolthole_push_seconds_sum{remote="origin"} 1000.702' in lines
+    assert 'bolthole_push_seconds_count{remote="origin"} 4' in lines
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics()
+    metrics.inc("bolthole_push_failures_total", remote='odd "name"\\')
+    assert (
+        'bolthole_push_failures_total{remote="odd \\"name\\"\\\\"} 1'
+        in metrics.render().splitlines()
+    )
+
+
+def test_writes_textfile(tmp_path):
+    path = tmp_path / "bolthole.prom"
+    exporter = MetricsFile(path, interval=60)
+    registry.inc("bolthole_copied_bytes_total", 1024)
+    exporter.close()
+    assert "bolthole_copied_bytes_total 1024\n" in path.read_text()
+    assert [p.name for p in tmp_path.iterdir()] == ["bolthole.prom"]
+
+
+def test_serves_metrics():
+    server = MetricsServer("127.0.0.1", 0)
+    try:
+        registry.inc("bolthole_git_commands_total", command="add")
+        port = server.server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as reply:
+            body = reply.read().decode()
+        assert 'bolthole_git_commands_total{command="add"} 1\n' in body
+    finally:
+        server.close()
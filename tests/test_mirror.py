@@ -0,0 +1,182 @@
+import os
+
+import pytest
+
+from bolthole.debounce import Event
+from bolthole.manifest import Manifest
+from bolthole.watcher import apply_events
+
+
+def make_tree(root, files):
+    for path, content in files.items():
+        target = root / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(content)
+
+
+def read_tree(root):
+    return {
+        str(path.relative_to(root)): path.read_text()
+            for path in sorted(root.rglob("*"))
+            if path.is_file()
+    }
+
+
+def mirror(tmp_path, source_files, dest_files, events):
+    source = tmp_path / "source"
+    dest = tmp_path / "dest"
+    source.mkdir()
+    dest.mkdir()
+    make_tree(source, source_files)
+    make_tree(dest, dest_files)
+    apply_events(events, source, dest)
+    return read_tree(dest)
+
+
+def test_copies_created_and_modified(tmp_path):
+    assert mirror(
+        tmp_path,
+        {"new.txt": "new", "sub/changed.txt": "changed"},
+        {"sub/changed.txt": "original"},
+        [Event("created", "new.txt"), Event("modified", "sub/changed.txt")],
+    ) == {"new.txt": "new", "sub/changed.txt": "changed"}
+
+
+def test_deletes_and_tidies_directories(tmp_path):
+    assert mirror(
+        tmp_path,
+        {"keep.txt": "keep"},
+        {"keep.txt": "keep", "gone/deep/file.txt": "gone"},
+        [Event("deleted", "gone/deep/file.txt")],
+    ) == {"keep.txt": "keep"}
+    assert not (tmp_path / "dest" / "gone").exists()
+
+
+def test_rename_moves_existing_copy(tmp_path):
+    source = tmp_path / "source"
+    dest = tmp_path / "dest"
+    source.mkdir()
+    dest.mkdir()
+    make_tree(source, {"moved/new.txt": "content"})
+    make_tree(dest, {"old.txt": "content"})
+    stat_result = (dest / "old.txt").stat()
+    os.utime(source / "moved/new.txt", ns=(0, stat_result.st_mtime_ns))
+
+    apply_events([Event("renamed", "old.txt", "moved/new.txt")], source, dest)
+
+    assert read_tree(dest) == {"moved/new.txt": "content"}
+    assert (dest / "moved/new.txt").stat().st_ino == stat_result.st_ino
+
+
+def test_rename_copies_changed_content(tmp_path):
+    assert mirror(
+        tmp_path,
+        {"new.txt": "changed since"},
+        {"old.txt": "content"},
+        [Event("renamed", "old.txt", "new.txt")],
+    ) == {"new.txt": "changed since"}
+
+
+def test_rename_without_existing_copy(tmp_path):
+    assert mirror(
+        tmp_path,
+        {"new.txt": "content"},
+        {},
+        [Event("renamed", "old.txt", "new.txt")],
+    ) == {"new.txt": "content"}
+
+
+def test_swap(tmp_path):
+    assert mirror(
+        tmp_path,
+        {"a.txt": "was b", "b.txt": "was a"},
+        {"a.txt": "was a", "b.txt": "was b"},
+        [Event("renamed", "a.txt", "b.txt"), Event("renamed", "b.txt", "a.txt")],
+    ) == {"a.txt": "was b", "b.txt": "was a"}
+
+
+def rename_without_copying(
+    tmp_path, source_files, dest_files, events, manifest=None,
+):
+    # the source has the times of the copies, so nothing should need
+    # copying again and only moves can get the contents into place
+    source = tmp_path / "source"
+    dest = tmp_path / "dest"
+    source.mkdir()
+    dest.mkdir()
+    make_tree(source, source_files)
+    make_tree(dest, dest_files)
+    for path, content in source_files.items():
+        origin = next(old for old, text in dest_files.items() if text == content)
+        mtime_ns = (dest / origin).stat().st_mtime_ns
+        os.utime(source / path, ns=(mtime_ns, mtime_ns))
+    if manifest:
+        # each copy is recorded with its contents standing in for a digest
+        for path, content in dest_files.items():
+            manifest.record(path, (dest / path).stat(), content)
+    apply_events(events, source, dest, manifest=manifest)
+    return read_tree(dest)
+
+
+def recorded(manifest):
+    return {
+        path: entry.digest
+            for path, entry in sorted(manifest.entries.items())
+    }
+
+
+@pytest.mark.parametrize("events", [
+    [Event("renamed", "b", "c"), Event("renamed", "a", "b")],
+    [Event("renamed", "a", "b"), Event("renamed", "b", "c")],
+])
+def test_rename_chain(tmp_path, events):
+    # mv b c; mv a b
+    assert rename_without_copying(
+        tmp_path,
+        {"b": "AAA", "c": "BBBB"},
+        {"a": "AAA", "b": "BBBB"},
+        events,
+    ) == {"b": "AAA", "c": "BBBB"}
+
+
+def test_rename_cycle(tmp_path):
+    assert rename_without_copying(
+        tmp_path,
+        {"a": "was b", "b": "was c", "c": "was a"},
+        {"a": "was a", "b": "was b", "c": "was c"},
+        [
+            Event("renamed", "a", "c"),
+            Event("renamed", "b", "a"),
+            Event("renamed", "c", "b"),
+        ],
+    ) == {"a": "was b", "b": "was c", "c": "was a"}
+
+
+def test_swap_keeps_each_digest_with_its_contents(tmp_path):
+    manifest = Manifest(tmp_path / "manifest")
+    files = rename_without_copying(
+        tmp_path,
+        {"a": "was b", "b": "was a"},
+        {"a": "was a", "b": "was b"},
+        [Event("renamed", "a", "b"), Event("renamed", "b", "a")],
+        manifest,
+    )
+    assert files == {"a": "was b", "b": "was a"}
+    assert recorded(manifest) == files
+
+
+@pytest.mark.parametrize("events", [
+    [Event("renamed", "b", "c"), Event("renamed", "a", "b")],
+    [Event("renamed", "a", "b"), Event("renamed", "b", "c")],
+])
+def test_chain_keeps_each_digest_with_its_contents(tmp_path, events):
+    manifest = Manifest(tmp_path / "manifest")
+    files = rename_without_copying(
+        tmp_path,
+        {"b": "AAA", "c": "BBBB"},
+        {"a": "AAA", "b": "BBBB"},
+        events,
+        manifest,
+    )
+    assert files == {"b": "AAA", "c": "BBBB"}
+    assert recorded(manifest) == files
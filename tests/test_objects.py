@@ -0,0 +1,111 @@
+import pytest
+from conftest import git, write
+
+from bolthole.debounce import Event
+from bolthole.objects import ObjectRepo
+
+
+@pytest.fixture
+def repo(git_dir):
+    repo = ObjectRepo(git_dir)
+    yield repo
+    repo.close()
+
+
+def test_writes_valid_objects(repo):
+    write(repo, "a.txt", "a")
+    write(repo, "sub/b.txt", "b")
+    write(repo, "sub-c.txt", "c")
+    repo.commit_changes([
+        Event("created", "a.txt"),
+        Event("created", "sub/b.txt"),
+        Event("created", "sub-c.txt"),
+    ])
+    git(repo, "fsck", "--strict", "--no-dangling")
+    assert git(repo, "log", "--format=%s%n%an <%ae>") == (
+        "Add a.txt, sub-c.txt, and sub/b.txt\nTest User <test@example.com>\n"
+    )
+    assert git(repo, "ls-tree", "-r", "--name-only", "HEAD") == (
+        "a.txt\nsub-c.txt\nsub/b.txt\n"
+    )
+
+
+def test_only_touched_directories_change(repo):
+    write(repo, "one/a.txt", "a")
+    write(repo, "two/b.txt", "b")
+    repo.commit_changes([Event("created", "one/"), Event("created", "two/")])
+    before = git(repo, "rev-parse", "HEAD:two")
+    write(repo, "one/a.txt", "changed")
+    repo.commit_changes([Event("modified", "one/a.txt")])
+    assert git(repo, "rev-parse", "HEAD:two") == before
+    assert git(repo, "show", "HEAD:one/a.txt") == "changed"
+    git(repo, "fsck", "--strict", "--no-dangling")
+
+
+def test_removes_emptied_directories(repo):
+    write(repo, "keep.txt", "keep")
+    write(repo, "sub/deeper/gone.txt", "gone")
+    repo.commit_changes([Event("created", "keep.txt"), Event("created", "sub/")])
+    (repo.path / "sub" / "deeper" / "gone.txt").unlink()
+    repo.commit_changes([Event("deleted", "sub/deeper/gone.txt")])
+    assert git(repo, "ls-tree", "-r", "-t", "--name-only", "HEAD") == (
+        "keep.txt\n"
+    )
+
+
+def test_directory_replaced_by_file(repo):
+    write(repo, "sub/a.txt", "a")
+    repo.commit_changes([Event("created", "sub/")])
+    (repo.path / "sub" / "a.txt").unlink()
+    (repo.path / "sub").rmdir()
+    write(repo, "sub", "now a file")
+    repo.commit_changes([Event("deleted", "sub/a.txt"), Event("created", "sub")])
+    git(repo, "fsck", "--strict", "--no-dangling")
+    assert git(repo, "ls-tree", "-r", "--name-only", "HEAD") == "sub\n"
+    assert git(repo, "show", "HEAD:sub") == "now a file"
+
+
+def test_deletes_beneath_a_file_keep_it(repo):
+    write(repo, "a.txt", "a")
+    repo.commit_changes([Event("created", "a.txt")])
+    repo.start()
+    tree = repo.commit_tree(git(repo, "rev-parse", "HEAD").strip())
+    assert repo.update_tree(tree, {b"a.txt/gone": None, b"b/gone": None}) == tree
+
+
+def test_builds_on_packed_history(repo):
+    write(repo, "a.txt", "a")
+    git(repo, "add", "a.txt")
+    git(repo, "commit", "--quiet", "-m", "initial")
+    git(repo, "gc", "--quiet")
+    write(repo, "b.txt", "b")
+    repo.commit_changes([Event("created", "b.txt")])
+    assert git(repo, "log", "--format=%s") == "Add b.txt\ninitial\n"
+    assert git(repo, "ls-tree", "--name-only", "HEAD") == "a.txt\nb.txt\n"
+    git(repo, "fsck", "--strict", "--no-dangling")
+
+
+def test_refuses_locked_ref(repo):
+    write(repo, "a.txt", "a")
+    lock = repo.path / ".git" / "refs" / "heads" / "main.lock"
+    lock.parent.mkdir(parents=True, exist_ok=True)
+    lock.write_text("")
+    with pytest.raises(FileExistsError):
+        repo.commit_changes([Event("created", "a.txt")])
+    assert lock.exists()
+    lock.unlink()
+    repo.commit_changes([Event("created", "a.txt")])
+    assert git(repo, "log", "--format=%s") == "Add a.txt\n"
+
+
+def test_records_reflog(repo):
+    write(repo, "a.txt", "a")
+    repo.commit_changes([Event("created", "a.txt")])
+    assert git(repo, "reflog", "--format=%gs") == "commit: Add a.txt\n"
+
+
+def test_close_updates_index(repo):
+    write(repo, "a.txt", "a")
+    repo.commit_changes([Event("created", "a.txt")])
+    repo.close()
+    assert git(repo, "status", "--porcelain") == ""
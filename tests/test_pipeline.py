@@ -0,0 +1,158 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bolthole.pipeline import Feeder, Stage
+
+
+def test_passes_results_downstream():
+    results = []
+    last = Stage("last", results.append)
+    first = Stage("first", lambda n: n * 2, last)
+    for n in range(5):
+        first.put(n)
+    first.close()
+    last.close()
+    assert results == [0, 2, 4, 6, 8]
+
+
+def test_none_stops_an_item():
+    results = []
+    last = Stage("last", results.append)
+    first = Stage("first", lambda n: n if n % 2 else None, last)
+    for n in range(5):
+        first.put(n)
+    first.close()
+    last.close()
+    assert results == [1, 3]
+
+
+def test_full_queue_blocks_the_producer():
+    release = threading.Event()
+    stage = Stage("slow", lambda n: release.wait(), size=1)
+    stage.put(1)
+    stage.put(2)
+    blocked = threading.Thread(target=stage.put, args=(3,))
+    blocked.start()
+    blocked.join(timeout=0.1)
+    assert blocked.is_alive()
+    release.set()
+    blocked.join(timeout=1)
+    assert not blocked.is_alive()
+    stage.close()
+
+
+def test_failure_does_not_stop_the_stage(capsys):
+    results = []
+
+    def work(n):
+        if n == 1:
+            raise ValueError("broken")
+        results.append(n)
+
+    stage = Stage("flaky", work)
+    for n in range(3):
+        stage.put(n)
+    stage.close()
+    assert results == [0, 2]
+    assert "ValueError: broken" in capsys.readouterr().err
+
+
+def test_close_without_work():
+    Stage("idle", print).close()
+
+
+def test_pooled_stages_keep_their_own_order():
+    results = {"a": [], "b": []}
+    with ThreadPoolExecutor(2) as pool:
+        stages = {
+            name: Stage(name, results[name].append, pool=pool)
+                for name in results
+        }
+        for n in range(50):
+            for stage in stages.values():
+                stage.put(n)
+        for stage in stages.values():
+            stage.close()
+        assert results == {"a": list(range(50)), "b": list(range(50))}
+
+
+def test_pooled_stages_share_workers():
+    running = []
+    peak = []
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def work(n):
+        with lock:
+            running.append(n)
+            peak.append(len(running))
+        release.wait()
+        with lock:
+            running.remove(n)
+
+    with ThreadPoolExecutor(2) as pool:
+        stages = [Stage(str(n), work, pool=pool) for n in range(4)]
+        for n, stage in enumerate(stages):
+            stage.put(n)
+        release.set()
+        for stage in stages:
+            stage.close()
+    assert max(peak) <= 2
+
+
+def test_full_output_does_not_hold_a_worker():
+    release = threading.Event()
+    results = []
+    with ThreadPoolExecutor(1) as pool:
+        slow = Stage("slow", lambda n: release.wait(), size=1)
+        busy = Stage("busy", lambda n: n, slow, pool=pool)
+        other = Stage("other", results.append, pool=pool)
+        for n in range(3):
+            busy.put(n)
+        # the only worker is free for other stages while busy waits
+        other.put("done")
+        other.close()
+        assert results == ["done"]
+        release.set()
+        busy.close()
+        slow.close()
+
+
+def test_feeder_waits_for_room():
+    release = threading.Event()
+    results = []
+    stage = Stage("slow", lambda n: release.wait() and results.append(n), size=1)
+    feeder = Feeder(stage)
+    for n in range(5):
+        feeder.put(n)
+    assert feeder.held
+    release.set()
+    feeder.close()
+    stage.close()
+    assert results == list(range(5))
+
+
+def test_pooled_stage_with_nothing_to_take_goes_idle():
+    with ThreadPoolExecutor(1) as pool:
+        stage = Stage("idle", print, pool=pool)
+        # as if a worker had already taken what this run was started for
+        stage.running = True
+        stage.run_next()
+        assert not stage.running
+        stage.close()
+
+
+def test_full_pooled_stage_blocks_the_producer():
+    release = threading.Event()
+    with ThreadPoolExecutor(1) as pool:
+        stage = Stage("slow", lambda n: release.wait(), size=1, pool=pool)
+        stage.put(1)
+        stage.put(2)
+        blocked = threading.Thread(target=stage.put, args=(3,))
+        blocked.start()
+        blocked.join(timeout=0.1)
+        assert blocked.is_alive()
+        release.set()
+        blocked.join(timeout=1)
+        assert not blocked.is_alive()
+        stage.close()
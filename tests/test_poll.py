@@ -0,0 +1,139 @@
+import os
+import time
+
+import pytest
+
+from bolthole.debounce import Event
+from bolthole.ignore import IgnoreMatcher
+from bolthole.poll import PolledTree, PollingObserver
+from bolthole.watcher import DebouncingEventHandler
+
+TYPES = {
+    "created": "created",
+    "modified": "modified",
+    "deleted": "deleted",
+    "moved": "renamed",
+}
+
+
+class FakeHandler:
+    label = None
+
+    def __init__(self, root):
+        self.root = root
+        self.ignore = IgnoreMatcher([".git", "node_modules", "*.tmp"])
+        self.events = []
+
+    def dispatch(self, event):
+        src = str(event.src_path).removeprefix(f"{self.root}/")
+        dest = str(event.dest_path).removeprefix(f"{self.root}/") or None
+        self.events.append(Event(TYPES[event.event_type], src, dest))
+
+
+class FakeRepo:
+    def commit_changes(self, events):
+        pass
+
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def age(path):
+    # as if last changed long enough ago to be trusted
+    os.utime(path, (1_600_000_000, 1_600_000_000))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    write(tmp_path / "a.txt", "a")
+    write(tmp_path / "sub" / "b.txt", "b")
+    write(tmp_path / "node_modules" / "dep.js", "dep")
+    tree = PolledTree(FakeHandler(tmp_path), tmp_path)
+    tree.add_directory("", False)
+    return tree
+
+
+def test_snapshot_skips_ignored_directories(tree):
+    assert sorted(tree.directories) == ["", "sub"]
+    assert tree.handler.events == []
+
+
+def test_reports_changes(tree, tmp_path):
+    write(tmp_path / "new.txt", "new")
+    write(tmp_path / "scratch.tmp", "ignored")
+    write(tmp_path / "a.txt", "longer")
+    (tmp_path / "sub" / "b.txt").rename(tmp_path / "sub" / "c.txt")
+    tree.scan("")
+    tree.scan("sub")
+    assert tree.handler.events == [
+        Event("modified", "a.txt"),
+        Event("created", "new.txt"),
+        Event("renamed", "sub/b.txt", "sub/c.txt"),
+    ]
+
+
+def test_new_and_removed_directories(tree, tmp_path):
+    write(tmp_path / "fresh" / "deep" / "d.txt", "d")
+    (tmp_path / "sub" / "b.txt").unlink()
+    (tmp_path / "sub").rmdir()
+    changed, added = tree.scan("")
+    assert changed
+    assert added == ["fresh", "fresh/deep"]
+    assert tree.handler.events == [
+        Event("deleted", "sub/b.txt"),
+        Event("created", "fresh/deep/d.txt"),
+    ]
+
+
+def test_handler_keeps_track_of_files(tmp_path):
+    write(tmp_path / "a.txt", "a")
+    handler = DebouncingEventHandler(
+        tmp_path,
+        ignore=IgnoreMatcher([".git"]),
+        repo=FakeRepo(),
+        known_files={"a.txt"},
+    )
+    tree = PolledTree(handler, tmp_path)
+    tree.add_directory("", False)
+    write(tmp_path / "b.txt", "b")
+    (tmp_path / "a.txt").unlink()
+    tree.scan("")
+    handler.close()
+    assert handler.known_files == {"b.txt"}
+
+
+def test_unchanged_directory_is_not_listed_again(tree, tmp_path):
+    age(tmp_path)
+    tree.directories[""].mtime_ns = None
+    tree.scan("")
+    assert tree.directories[""].mtime_ns is not None
+
+    listed = []
+    tree.list_directory = lambda rel_dir: listed.append(rel_dir)
+    write(tmp_path / "a.txt", "changed in place")
+    age(tmp_path)
+    changed, _ = tree.scan("")
+    assert changed
+    assert listed == []
+    assert tree.handler.events == [Event("modified", "a.txt")]
+
+
+def test_quiet_directories_are_polled_less_often(tmp_path):
+    write(tmp_path / "a.txt", "a")
+    handler = FakeHandler(tmp_path)
+    observer = PollingObserver(interval=0.05, max_interval=0.4)
+    observer.schedule(handler, str(tmp_path))
+    observer.start()
+    try:
+        time.sleep(0.5)
+        directory = observer.trees[0].directories[""]
+        assert directory.interval == 0.4
+        write(tmp_path / "b.txt", "b")
+        time.sleep(0.6)
+        assert handler.events == [Event("created", "b.txt")]
+    finally:
+        observer.stop()
+        observer.join()
+    assert not observer.is_alive()
@@ -0,0 +1,70 @@
+import json
+
+from bolthole.profile import NO_SPAN, Profiler, format_duration, percentile
+
+
+def test_nothing_recorded_until_started():
+    profiler = Profiler()
+    assert profiler.span("commit") is NO_SPAN
+    profiler.record("grace", 0, 1)
+    assert profiler.summary() == []
+
+
+def test_spans_written_as_json_lines(tmp_path):
+    path = tmp_path / "profile.jsonl"
+    profiler = Profiler()
+    profiler.start(path)
+    with profiler.span("commit", events=3):
+        pass
+    profiler.record("grace", 10.0, 12.5)
+    profiler.close()
+    first, second = [json.loads(line) for line in path.read_text().splitlines()]
+    assert first["span"] == "commit"
+    assert first["events"] == 3
+    assert first["thread"] == "MainThread"
+    assert 0 <= first["duration"] < 1
+    assert second["span"] == "grace"
+    assert second["duration"] == 2.5
+    assert second["start"] < first["start"]
+
+
+def test_spans_carry_the_batch(tmp_path):
+    path = tmp_path / "profile.jsonl"
+    profiler = Profiler()
+    profiler.start(path)
+    first, second = profiler.new_batch(), profiler.new_batch()
+    with profiler.batch(first):
+        with profiler.span("collapse_events"):
+            pass
+        profiler.record("grace", 0, 1, batch=second)
+    profiler.record("push", 0, 1)
+    profiler.close()
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [span.get("batch") for span in spans] == [first, second, None]
+    assert first != second
+
+
+def test_nearest_rank_percentiles():
+    durations = [float(n) for n in range(1, 101)]
+    assert percentile(durations, 50) == 50
+    assert percentile(durations, 99) == 99
+    assert percentile([4.0], 90) == 4
+
+
+def test_format_duration():
+    assert format_duration(0.0123) == "12.3ms"
+    assert format_duration(40.5) == "40.50s"
+
+
+def test_summary(tmp_path):
+    profiler = Profiler()
+    profiler.start(tmp_path / "profile.jsonl")
+    for n in range(1, 11):
+        profiler.record("git add", 0, n / 1000)
+    profiler.record("push", 0, 2)
+    profiler.close()
+    assert profiler.summary() == [
+        "span      count       p50       p90       p99       max",
+        "git add      10     5.0ms     9.0ms    10.0ms    10.0ms",
+        "push          1     2.00s     2.00s     2.00s     2.00s",
+    ]
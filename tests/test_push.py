@@ -0,0 +1,93 @@
+import threading
+import time
+
+from bolthole.push import PushQueue
+
+
+class FakeRepo:
+    dry_run = False
+
+    def __init__(self, results=None):
+        self.pushes = []
+        self.results = results or {}
+        self.started = threading.Semaphore(0)
+        self.release = threading.Event()
+        self.release.set()
+
+    def push_remote(self, remote):
+        self.pushes.append(remote)
+        self.started.release()
+        self.release.wait()
+        outcomes = self.results.get(remote)
+        if outcomes:
+            return outcomes.pop(0)
+        return True
+
+
+def test_no_remotes_does_nothing():
+    repo = FakeRepo()
+    queue = PushQueue(repo, [])
+    queue.request()
+    queue.close()
+    assert repo.pushes == []
+
+
+def test_coalesces_requests_during_a_push():
+    repo = FakeRepo()
+    repo.release.clear()
+    queue = PushQueue(repo, ["origin"])
+    queue.request()
+    assert repo.started.acquire(timeout=1)
+    for _ in range(10):
+        queue.request()
+    repo.release.set()
+    queue.close()
+    assert repo.pushes == ["origin", "origin"]
+
+
+def test_pushes_remotes_in_parallel():
+    repo = FakeRepo()
+    repo.release.clear()
+    queue = PushQueue(repo, ["origin", "backup"])
+    queue.request()
+    # both pushes start before either is allowed to finish
+    assert repo.started.acquire(timeout=1)
+    assert repo.started.acquire(timeout=1)
+    repo.release.set()
+    queue.close()
+    assert sorted(repo.pushes) == ["backup", "origin"]
+
+
+def test_retries_with_backoff(capsys):
+    repo = FakeRepo({"origin": [False, False, True]})
+    queue = PushQueue(repo, ["origin"], retry_delay=0.05)
+    start = time.monotonic()
+    queue.request()
+    for _ in range(3):
+        assert repo.started.acquire(timeout=1)
+    elapsed = time.monotonic() - start
+    queue.close()
+    assert repo.pushes == ["origin"] * 3
+    assert elapsed >= 0.05 + 0.1
+    assert capsys.readouterr().out.count("!! push to origin failed") == 2
+
+
+def test_close_gives_up_waiting_to_retry():
+    repo = FakeRepo({"origin": [False]})
+    queue = PushQueue(repo, ["origin"], retry_delay=60)
+    queue.request()
+    assert repo.started.acquire(timeout=1)
+    start = time.monotonic()
+    queue.close()
+    assert time.monotonic() - start < 1
+    assert repo.pushes == ["origin"]
+
+
+def test_close_pushes_outstanding_commits():
+    repo = FakeRepo({"origin": [False]})
+    queue = PushQueue(repo, ["origin"], retry_delay=60)
+    queue.request()
+    assert repo.started.acquire(timeout=1)
+    queue.request()
+    queue.close()
+    assert repo.pushes == ["origin", "origin"]
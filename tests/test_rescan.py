@@ -0,0 +1,159 @@
+import json
+import os
+import shutil
+import time
+
+from watchdog.events import FileModifiedEvent
+
+from bolthole.debounce import Event
+from bolthole.ignore import IgnoreMatcher
+from bolthole.metrics import registry
+from bolthole.profile import profiler
+from bolthole.watcher import DebouncingEventHandler
+
+
+class FakeRepo:
+    def __init__(self):
+        self.commits = []
+
+    def commit_changes(self, events):
+        self.commits.append(sorted(events, key=lambda event: event.path))
+
+
+def write(path, content, mtime=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+
+
+def rescan(source, dest, known_files, rel_dir="", since_ns=0, label=None):
+    repo = FakeRepo()
+    handler = DebouncingEventHandler(
+        source,
+        dest_path=dest,
+        ignore=IgnoreMatcher([".git", "*.tmp"]),
+        repo=repo,
+        known_files=known_files,
+        label=label,
+    )
+    handler.rescan(rel_dir, since_ns)
+    handler.close()
+    return repo.commits
+
+
+def test_mirror_differences_become_events(tmp_path):
+    source = tmp_path / "source"
+    dest = tmp_path / "dest"
+    write(source / "same.txt", "same")
+    write(source / "stale.txt", "new contents")
+    write(source / "new.txt", "new")
+    write(source / "scratch.tmp", "ignored")
+    dest.mkdir()
+    shutil.copy2(source / "same.txt", dest / "same.txt")
+    write(dest / "stale.txt", "old")
+    write(dest / "gone.txt", "gone")
+
+    known = {"same.txt", "stale.txt", "gone.txt"}
+    assert rescan(source, dest, known) == [[
+        Event("deleted", "gone.txt"),
+        Event("created", "new.txt"),
+        Event("modified", "stale.txt"),
+    ]]
+    assert known == {"same.txt", "stale.txt", "new.txt"}
+    assert (dest / "stale.txt").read_text() == "new contents"
+    assert not (dest / "gone.txt").exists()
+
+
+def test_only_the_directory_is_rescanned(tmp_path):
+    source = tmp_path / "source"
+    write(source / "top.txt", "top")
+    write(source / "sub" / "inner.txt", "inner")
+
+    known = {"missing.txt", "sub/missing.txt"}
+    assert rescan(source, None, known, "sub") == [[
+        Event("created", "sub/inner.txt"),
+        Event("deleted", "sub/missing.txt"),
+    ]]
+    assert known == {"missing.txt", "sub/inner.txt"}
+
+
+def test_without_a_destination_recent_changes_are_assumed(tmp_path):
+    # as if events were lost a minute from now, after old.txt was written
+    since_ns = time.time_ns() + 60_000_000_000
+    source = tmp_path / "source"
+    write(source / "old.txt", "old")
+    write(source / "recent.txt", "recent", mtime=since_ns + 1)
+
+    known = {"old.txt", "recent.txt"}
+    assert rescan(source, None, known, since_ns=since_ns) == [[
+        Event("modified", "recent.txt"),
+    ]]
+
+
+def test_metrics_are_kept_for_each_tree(tmp_path):
+    source = tmp_path / "source"
+    write(source / "new.txt", "new")
+    dest = tmp_path / "dest"
+    dest.mkdir()
+
+    rescan(source, dest, set(), label="docs")
+    labels = (("tree", "docs"),)
+    assert registry.values[("bolthole_rescans_total", labels)] == 1
+    assert registry.values[("bolthole_copied_files_total", labels)] == 1
+    assert registry.values[("bolthole_pending_events", labels)] == 0
+
+
+def test_spans_of_one_flush_share_a_batch(tmp_path):
+    source = tmp_path / "source"
+    write(source / "new.txt", "new")
+    dest = tmp_path / "dest"
+    dest.mkdir()
+
+    path = tmp_path / "profile.jsonl"
+    profiler.start(path)
+    try:
+        rescan(source, dest, set())
+    finally:
+        profiler.close()
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    batches = {
+        span["span"]: span.get("batch")
+            for span in spans
+            if span["span"] not in ("queue_event", "rescan")
+    }
+    assert set(batches) == {
+        "flush_events", "debounce", "collapse_events", "apply_events",
+        "commit",
+    }
+    assert len(set(batches.values())) == 1
+    assert None not in batches.values()
+
+
+def test_sweep_looks_over_active_directories(tmp_path):
+    source = tmp_path / "source"
+    write(source / "sub" / "seen.txt", "seen")
+    write(source / "sub" / "lost.txt", "lost")
+    write(source / "sub" / "deeper" / "skipped.txt", "skipped")
+    write(source / "quiet" / "skipped.txt", "skipped")
+    repo = FakeRepo()
+    known = {"sub/seen.txt", "sub/gone.txt"}
+    handler = DebouncingEventHandler(
+        source,
+        ignore=IgnoreMatcher([".git", "*.tmp"]),
+        repo=repo,
+        known_files=known,
+        sweep=True,
+    )
+    # as if the events for everything else in sub were lost
+    handler.dispatch(FileModifiedEvent(str(source / "sub" / "seen.txt")))
+    assert handler.active_dirs == {"sub"}
+    handler.sweep_due(handler.SWEEP)
+    handler.close()
+
+    assert repo.commits == [[
+        Event("deleted", "sub/gone.txt"),
+        Event("created", "sub/lost.txt"),
+        Event("modified", "sub/seen.txt"),
+    ]]
+    assert known == {"sub/seen.txt", "sub/lost.txt"}
@@ -0,0 +1,101 @@
+import threading
+
+from bolthole.scheduler import Scheduler
+
+
+class Recorder:
+    def __init__(self):
+        self.fired = []
+        self.lock = threading.Lock()
+
+    def __call__(self, key):
+        with self.lock:
+            self.fired.append(key)
+
+
+def test_fires_in_deadline_order():
+    recorder = Recorder()
+    scheduler = Scheduler(recorder)
+    scheduler.schedule("late", 0.06)
+    scheduler.schedule("early", 0.02)
+    scheduler.schedule("middle", 0.04)
+    scheduler.close()
+    assert recorder.fired == ["early", "middle", "late"]
+
+
+def test_reschedule_replaces_deadline():
+    recorder = Recorder()
+    scheduler = Scheduler(recorder)
+    scheduler.schedule("moved", 0.01)
+    scheduler.schedule("fixed", 0.03)
+    scheduler.schedule("moved", 0.05)
+    scheduler.close()
+    assert recorder.fired == ["fixed", "moved"]
+
+
+def test_cancel():
+    recorder = Recorder()
+    scheduler = Scheduler(recorder)
+    scheduler.schedule("kept", 0.02)
+    scheduler.schedule("cancelled", 0.01)
+    assert "cancelled" in scheduler
+    scheduler.cancel("cancelled")
+    assert "cancelled" not in scheduler
+    scheduler.close()
+    assert recorder.fired == ["kept"]
+
+
+def test_one_thread_for_many_keys():
+    recorder = Recorder()
+    scheduler = Scheduler(recorder)
+    before = threading.active_count()
+    for number in range(1000):
+        scheduler.schedule(number, 0.05)
+    assert threading.active_count() == before + 1
+    assert len(scheduler) == 1000
+    scheduler.close()
+    assert sorted(recorder.fired) == list(range(1000))
+
+
+def test_repeated_rescheduling_stays_compact():
+    scheduler = Scheduler(Recorder())
+    for _ in range(10_000):
+        scheduler.schedule("busy", 60)
+    assert len(scheduler.heap) < 200
+    scheduler.cancel("busy")
+    scheduler.close()
+
+
+def test_failing_callback_does_not_stop_others(capsys):
+    fired = []
+
+    def callback(key):
+        if key == "bad":
+            raise RuntimeError("boom")
+        fired.append(key)
+
+    scheduler = Scheduler(callback)
+    scheduler.schedule("bad", 0.01)
+    scheduler.schedule("good", 0.02)
+    scheduler.close()
+    assert fired == ["good"]
+    assert "boom" in capsys.readouterr().err
+
+
+def test_timers_share_a_scheduler():
+    scheduler = Scheduler()
+    first = Recorder()
+    second = Recorder()
+    one = scheduler.timers(first)
+    other = scheduler.timers(second)
+    one.schedule("same", 0.01)
+    other.schedule("same", 60)
+    assert "same" in one
+    one.close()
+    assert first.fired == ["same"]
+    # the other's key isn't waited for
+    assert "same" in other
+    other.cancel("same")
+    other.close()
+    scheduler.close()
+    assert second.fired == []
@@ -0,0 +1,143 @@
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+import bolthole.scrub
+from bolthole.debounce import Event
+from bolthole.ignore import IgnoreMatcher
+from bolthole.scrub import Budget, Scrubber
+
+# every file gets the same time, so damage can't be seen from stat alone
+OLD = 1_600_000_000_000_000_000
+
+
+class FakeHandler:
+    label = None
+
+    def __init__(self, source, dest):
+        self.base_path = source
+        self.dest_path = dest
+        self.ignore = IgnoreMatcher([".git", "*.tmp"])
+        self.first_seen = {}
+        self.grace_events = {}
+        self.known_files = set()
+        self.events = []
+
+    def queue_event(self, event):
+        self.events.append(event)
+
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    os.utime(path, ns=(OLD, OLD))
+
+
+@pytest.fixture
+def scrubber(tmp_path, monkeypatch):
+    # setting the times changes them, so nothing would otherwise settle
+    monkeypatch.setattr(bolthole.scrub, "SETTLE_NS", 0)
+    source = tmp_path / "source"
+    dest = tmp_path / "dest"
+    write(source / "a.txt", "a")
+    write(source / "sub" / "b.txt", "b")
+    write(source / "scratch.tmp", "ignored")
+    shutil.copytree(source, dest)
+    write(dest / ".git" / "HEAD", "ref: refs/heads/main")
+    return Scrubber(FakeHandler(source, dest), 1024 ** 3)
+
+
+def test_matching_copy(scrubber):
+    root = scrubber.scrub()
+    assert root.source_hash == root.dest_hash
+    assert (root.files, root.verified) == (2, 2)
+    assert sorted(scrubber.nodes) == ["", "sub"]
+    assert scrubber.handler.events == []
+
+
+def test_differences_are_queued(scrubber, tmp_path):
+    dest = tmp_path / "dest"
+    # the same size and time, so only reading it shows the damage
+    write(dest / "sub" / "b.txt", "X")
+    (dest / "a.txt").unlink()
+    write(dest / "extra.txt", "extra")
+    write(dest / "gone" / "old.txt", "old")
+
+    root = scrubber.scrub()
+    assert root.source_hash != root.dest_hash
+    assert scrubber.handler.events == [
+        Event("modified", "sub/b.txt"),
+        Event("deleted", "gone/old.txt"),
+        Event("created", "a.txt"),
+        Event("deleted", "extra.txt"),
+    ]
+    assert scrubber.differences == 4
+
+
+def test_unsettled_files_are_left_alone(scrubber, tmp_path, monkeypatch):
+    monkeypatch.setattr(bolthole.scrub, "SETTLE_NS", 5_000_000_000)
+    (tmp_path / "source" / "a.txt").write_text("just changed")
+    scrubber.handler.first_seen["sub/b.txt"] = time.monotonic()
+    (tmp_path / "dest" / "sub" / "b.txt").unlink()
+
+    root = scrubber.scrub()
+    assert scrubber.handler.events == []
+    assert (root.files, root.verified) == (2, 0)
+    assert root.read is None
+
+
+def test_unchanged_files_are_not_read_again(scrubber, monkeypatch):
+    scrubber.scrub()
+    read = []
+    monkeypatch.setattr(
+        bolthole.scrub, "hash_blob", lambda path: read.append(path) or "",
+    )
+    scrubber.scrub()
+    assert read == []
+
+    # until they were last read too long ago
+    monkeypatch.setattr(bolthole.scrub, "SCRUB_WINDOW", 0)
+    scrubber.scrub()
+    assert len(read) == 4
+
+
+def test_only_changed_subtrees_are_verified(scrubber, tmp_path, monkeypatch):
+    write(tmp_path / "source" / "other" / "c.txt", "c")
+    write(tmp_path / "dest" / "other" / "c.txt", "c")
+    scrubber.scrub()
+    checked = []
+    digest = scrubber.digest
+
+    def record(side, root, rel_path, stat_result):
+        checked.append(rel_path)
+        return digest(side, root, rel_path, stat_result)
+
+    monkeypatch.setattr(scrubber, "digest", record)
+    root = scrubber.scrub()
+    assert checked == []
+    assert (root.files, root.verified) == (3, 3)
+
+    # damaged in place, with its size and time put back
+    write(tmp_path / "dest" / "sub" / "b.txt", "X")
+    root = scrubber.scrub()
+    assert sorted(set(checked)) == ["a.txt", "sub/b.txt"]
+    assert scrubber.handler.events == [Event("modified", "sub/b.txt")]
+    assert root.source_hash != root.dest_hash
+    assert sorted(scrubber.nodes) == ["", "other", "sub"]
+
+
+def test_budget_spreads_reading_out():
+    budget = Budget(10_000, threading.Event())
+    start = time.monotonic()
+    assert budget.spend(10_000)
+    assert budget.spend(1_000)
+    assert time.monotonic() - start >= 0.09
+
+
+def test_budget_gives_up_when_stopped():
+    stopping = threading.Event()
+    stopping.set()
+    assert not Budget(10, stopping).spend(1_000)
@@ -0,0 +1,58 @@
+from bolthole.ignore import IgnoreMatcher
+from bolthole.walk import list_files, walk_files
+
+
+def make_tree(root, paths):
+    for path in paths:
+        target = root / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(path)
+
+
+def test_lists_nested_files(tmp_path):
+    make_tree(tmp_path, ["a.txt", "sub/b.txt", "sub/deeper/c.txt"])
+    assert list_files(tmp_path, IgnoreMatcher([])) == {
+        "a.txt",
+        "sub/b.txt",
+        "sub/deeper/c.txt",
+    }
+
+
+def test_missing_directory(tmp_path):
+    assert list_files(tmp_path / "missing", IgnoreMatcher([])) == set()
+
+
+def test_skips_ignored_files(tmp_path):
+    make_tree(tmp_path, ["keep.txt", "drop.log", "sub/drop.log"])
+    assert list_files(tmp_path, IgnoreMatcher(["*.log"])) == {"keep.txt"}
+
+
+def test_prunes_ignored_directories(tmp_path):
+    make_tree(tmp_path, ["keep.txt", "node_modules/lib/index.js"])
+    (tmp_path / "node_modules" / "lib").chmod(0)
+    try:
+        files = list_files(tmp_path, IgnoreMatcher(["node_modules"]))
+    finally:
+        (tmp_path / "node_modules" / "lib").chmod(0o755)
+    assert files == {"keep.txt"}
+
+
+def test_path_patterns_filter_files(tmp_path):
+    make_tree(tmp_path, ["logs/a.log", "logs/deep/b.log", "other/c.log"])
+    assert list_files(tmp_path, IgnoreMatcher(["logs/*.log"])) == {
+        "other/c.log",
+    }
+
+
+def test_walks_in_sorted_order(tmp_path):
+    paths = ["a.txt", "a/b.txt", "a-b.txt", "b/z.txt", "b/a/y.txt", "B.txt"]
+    make_tree(tmp_path, paths)
+    walked = [rel for rel, _ in walk_files(tmp_path, IgnoreMatcher([]))]
+    assert walked == sorted(paths)
+
+
+def test_yields_reusable_entries(tmp_path):
+    make_tree(tmp_path, ["file.txt"])
+    [(rel, entry)] = walk_files(tmp_path, IgnoreMatcher([]))
+    assert rel == "file.txt"
+    assert entry.stat().st_size == len("file.txt")